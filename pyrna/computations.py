@@ -1,6 +1,7 @@
-import os, commands, re, shutil, sys, urllib, subprocess, time, fcntl, urllib, urllib2
+import os, commands, re, shutil, sys, urllib, subprocess, time, fcntl, urllib, urllib2, pipes, threading, atexit
 from string import maketrans
 from pandas import DataFrame
+from cStringIO import StringIO
 import parsers, utils
 from features import RNA, SecondaryStructure, TertiaryStructure
 from parsers import base_pairs_to_secondary_structure, parse_bn, to_fasta, to_pdb
@@ -13,6 +14,169 @@ def get_api_key(rest_server):
     api_key = str(response.read())
     return api_key
 
+class DockerExecutor:
+    """
+    The backend of a ContainerPool running its containers with the Docker command-line client.
+    """
+
+    def start(self, image, volume):
+        status, output = commands.getstatusoutput("docker run -d -v %s:/data %s tail -f /dev/null"%(volume, image))
+        if status:
+            raise Exception("Unable to start a container of the Docker image %s: %s"%(image, output))
+        return output.strip().split('\n')[-1] #the id of the container
+
+    def execute(self, container, command):
+        """
+        Returns:
+        --------
+        a tuple (output, failed), failed being True if Docker itself could not run the command (a container no longer running, removed,...)
+        """
+        status, output = commands.getstatusoutput("docker exec %s bash -c %s"%(container, pipes.quote(command)))
+        status >>= 8 #getstatusoutput() returns the status encoded like os.wait()
+        #125: error of the docker client or daemon, 126/127: the exec itself failed (and not the command run with bash, which can also exit with 126 or 127)
+        failed = status == 125 or output.startswith("Error response from daemon") or output.startswith("Error: No such container") or status in (126, 127) and "exec failed" in output
+        return output, failed
+
+    def is_alive(self, container):
+        return commands.getoutput("docker inspect -f '{{.State.Running}}' %s"%container).strip() == 'true'
+
+    def stop(self, container):
+        commands.getoutput("docker rm -f %s"%container)
+
+class LocalExecutor:
+    """
+    A fake backend for a ContainerPool, for tests or for the hosts where the tools are installed locally. The commands are run on the local host, the directory of the "container" being substituted for /data. Removing a "container" from self.volumes simulates its death.
+    """
+
+    def __init__(self):
+        self.volumes = {} #the directory mounted on /data for each "container"
+        self.commands = [] #the (container, command) tuples run so far
+        self.__containers_count = 0
+
+    def start(self, image, volume):
+        self.__containers_count += 1
+        container = "local-%i"%self.__containers_count
+        self.volumes[container] = volume
+        return container
+
+    def execute(self, container, command):
+        self.commands.append((container, command))
+        if not self.volumes.has_key(container):
+            return "Error: No such container: %s"%container, True
+        return commands.getoutput("bash -c %s"%pipes.quote(command.replace('/data', self.volumes[container]))), False
+
+    def is_alive(self, container):
+        return self.volumes.has_key(container)
+
+    def stop(self, container):
+        if self.volumes.has_key(container):
+            del self.volumes[container]
+
+class ContainerPool:
+    """
+    A pool of long-lived Docker containers. The commands are run in these containers with "docker exec" instead of starting a new container for each command.
+
+    For each (image, volume) pair, the pool keeps up to size containers. A command goes to an idle container if any, otherwise to a new container if the pool is not full, otherwise to the least busy container. A container that has not been checked for health_check_interval seconds is checked before use and replaced if it is no longer running. A command that Docker itself fails to run (the container died between two checks) is retried once in another container. A container is recycled once it has run max_uses commands. The containers are removed when the process exits.
+
+    The lock of the pool only protects its bookkeeping: the containers are started, checked and removed outside of it, so that a slow start-up doesn't block the commands run in the other containers.
+
+    The Tool objects share the pool stored in the variable container_pool of this module. Another pool (with another size or another executor, like a LocalExecutor for tests) can be swapped in by assigning this variable.
+    """
+
+    def __init__(self, size = 2, max_uses = 500, health_check_interval = 30, executor = None):
+        self.size = size
+        self.max_uses = max_uses
+        self.health_check_interval = health_check_interval
+        self.executor = executor if executor else DockerExecutor()
+        self.containers = {} #for each (image, volume) pair, the list of containers as dicts (keys: container, uses, running, checked, dead, ready)
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def run(self, image, volume, command):
+        """
+        Run a command in a container of the Docker image given as argument.
+
+        Parameters:
+        -----------
+        - image: the name of the Docker image
+        - volume: the local directory mounted on /data in the container
+        - command: the command to run (with bash)
+
+        Returns:
+        --------
+        the output of the command (stdout and stderr)
+        """
+        output = None
+        for attempt in range(2): #a command that Docker failed to run is retried once in another container
+            container = self.__acquire(image, volume)
+            failed = False
+            try:
+                output, failed = self.executor.execute(container['container'], command)
+            finally:
+                self.__release(image, volume, container, dead = failed)
+            if not failed:
+                return output
+        raise Exception("Unable to run a command in a container of the Docker image %s: %s"%(image, output))
+
+    def close(self):
+        """
+        Remove all the containers of the pool.
+        """
+        with self.lock:
+            containers = [container for image_containers in self.containers.values() for container in image_containers]
+            self.containers = {}
+        for container in containers:
+            if container['container'] is not None:
+                self.executor.stop(container['container'])
+
+    def __acquire(self, image, volume):
+        while True:
+            start = check = False
+            with self.lock:
+                containers = self.containers.setdefault((image, volume), [])
+                available_containers = [container for container in containers if container['uses'] < self.max_uses and not container['dead']] #the containers to recycle don't get new commands
+                ready_containers = [container for container in available_containers if container['ready'].is_set()]
+                container = min(ready_containers, key = lambda container: container['running']) if ready_containers else None
+                if (container is None or container['running']) and len(available_containers) < self.size: #no idle container, a new one is reserved
+                    container = {'container': None, 'uses': 0, 'running': 0, 'checked': time.time(), 'dead': False, 'ready': threading.Event()}
+                    containers.append(container)
+                    start = True
+                elif container is None: #all the containers are starting
+                    container = min(available_containers, key = lambda container: container['running'])
+                elif time.time()-container['checked'] > self.health_check_interval:
+                    container['checked'] = time.time()
+                    check = True
+                container['uses'] += 1
+                container['running'] += 1
+            if start:
+                try:
+                    container['container'] = self.executor.start(image, volume)
+                except:
+                    self.__release(image, volume, container, dead = True)
+                    raise
+                finally:
+                    container['ready'].set()
+                return container
+            container['ready'].wait()
+            if container['dead'] or check and not self.executor.is_alive(container['container']):
+                self.__release(image, volume, container, dead = True)
+                continue
+            return container
+
+    def __release(self, image, volume, container, dead = False):
+        with self.lock:
+            container['running'] -= 1
+            if dead:
+                container['dead'] = True
+            containers = self.containers.get((image, volume), [])
+            remove = (container['dead'] or container['uses'] >= self.max_uses) and not container['running'] and any([other is container for other in containers])
+            if remove:
+                self.containers[(image, volume)] = [other for other in containers if other is not container]
+        if remove and container['container'] is not None:
+            self.executor.stop(container['container'])
+
+container_pool = ContainerPool()
+
 class Tool:
     def __init__(self, cache_dir = '/tmp', rest_server = None, api_key = None, use_docker = True):
         self.cache_dir = cache_dir
@@ -28,6 +192,22 @@ class Tool:
         if not find_executable(executable):
             raise Exception("%s is not available in your PATH"%executable)
 
+    def docker_run(self, image, command, volume = None):
+        """
+        Run a command in a container of the Docker image given as argument. The containers are kept running in the pool container_pool of this module (see ContainerPool).
+
+        Parameters:
+        -----------
+        - image: the name of the Docker image
+        - command: the command to run (with bash)
+        - volume (default: None): the local directory mounted on /data. If None, the cache directory.
+
+        Returns:
+        --------
+        the output of the command
+        """
+        return container_pool.run(image, volume if volume else self.cache_dir, command)
+
     def submit(self, tool_name, parameters):
         parameters['api_key'] = self.api_key
         parameters = urllib.urlencode(parameters)
@@ -200,7 +380,7 @@ class Bcheck(Tool):
                         if tokens[-1] == '+':
                             hit['sequence'] = target_molecule.sequence[start-1:end]
                         else:
-                            hit['sequence'] = target_molecule.get_complement()[start-1:end][::-1]
+                            hit['sequence'] = target_molecule.reverse_complement(start-1, end)
                 hits.append(hit)
 
         return DataFrame(hits)
@@ -281,7 +461,7 @@ class Blast(Tool):
                             if subject_plus_strand:
                                 sequence = m.sequence[subject_positions[0][0]-1:subject_positions[-1][1]]
                             else:
-                                sequence = m.get_complement()[subject_positions[0][0]-1:subject_positions[-1][1]][::-1]
+                                sequence = m.reverse_complement(subject_positions[0][0]-1, subject_positions[-1][1])
                             hits.append({
                                 "name": query_name,
                                 "target_name":sequence_name,
@@ -330,7 +510,7 @@ class Blast(Tool):
                     if subject_plus_strand:
                         sequence = m.sequence[subject_positions[0][0]-1:subject_positions[-1][1]]
                     else:
-                        sequence = m.get_complement()[subject_positions[0][0]-1:subject_positions[-1][1]][::-1]
+                        sequence = m.reverse_complement(subject_positions[0][0]-1, subject_positions[-1][1])
                     hits.append({
                         "name": query_name,
                         "target_name":sequence_name,
@@ -442,25 +622,24 @@ class Bowtie2(Tool):
         - genomeName (a String)
         """
 
-        aligned_reads, total_reads, tids  = parsers.parse_sam(sam_file)
+        import numpy as np
+        import pandas as pd
+        genome_names = np.array(parsers.sam_reference_names(sam_file), dtype = object)
         reads = []
+        total_reads = 0
         total_aligned_reads = 0
-        for aligned_reads_per_genome in aligned_reads:
-            total_aligned_reads += len(aligned_reads_per_genome)
-            for target_molecule in target_molecules:
-                if target_molecule.name == tids[aligned_reads_per_genome[0]['tid']]:
-                    current_molecule = target_molecule
-            genomeName = tids[aligned_reads_per_genome[0]['tid']]
-
-            for aligned_read in aligned_reads_per_genome :
-                reads.append({
-                    'genomicStart': aligned_read['genomicStart'],
-                    'genomicEnd': aligned_read['genomicEnd'],
-                    'genomeName': genomeName,
-                    'genomicStrand': aligned_read['genomicStrand']
-                })
+        for chunk in parsers.iter_sam(sam_file):
+            total_reads += len(chunk['flag'])
+            aligned = (chunk['flag'] & 4) == 0 #the unmapped reads have the flag 0x4 (alone or with other flags, like in paired-end runs)
+            total_aligned_reads += np.count_nonzero(aligned)
+            reads.append(DataFrame({
+                'genomicStart': chunk['start'][aligned],
+                'genomicEnd': chunk['end'][aligned],
+                'genomeName': genome_names[chunk['tid'][aligned]],
+                'genomicStrand': chunk['strand'][aligned]
+            }))
         print "%i reads found, %i reads aligned..."%(total_reads, total_aligned_reads)
-        return DataFrame(reads)
+        return pd.concat(reads, ignore_index = True) if reads else DataFrame()
 
     def align(self, target_molecules, fastq_file, parsing = False, user_defined_options=[]):
         """
@@ -495,7 +674,7 @@ class Bowtie2(Tool):
             self.build_index(target_molecules)
 
         print "Reads alignment..."
-        commands.getoutput("docker run -v %s:/data fjossinet/rnaseq bowtie2 %s -x /data/%s -q \"/data/%s\" -S /data/%s"%(self.cache_dir, ' '.join(user_defined_options), self.index_path, fastq_file, result_file))
+        self.docker_run('fjossinet/rnaseq', "bowtie2 %s -x /data/%s -q \"/data/%s\" -S /data/%s"%(' '.join(user_defined_options), self.index_path, fastq_file, result_file))
         print "SAM file %s produced successfully: "%result_file
 
         if not parsing:
@@ -523,14 +702,14 @@ class Bowtie2(Tool):
             fasta_file = open(self.cache_dir+'/'+fasta_file_name, 'w')
             fasta_file.write(to_fasta(target_molecules))
             fasta_file.close()
-            commands.getoutput("docker run -v %s:/data fjossinet/rnaseq bowtie2-build /data/%s /data/%s"%(self.cache_dir, fasta_file_name, self.index_path))
+            self.docker_run('fjossinet/rnaseq', "bowtie2-build /data/%s /data/%s"%(fasta_file_name, self.index_path))
             print "Index files produced successfully: %s"%(self.cache_dir+'/'+self.index_path)
         else:
             fasta_file_name = self.index_path+".fa"
             fasta_file = open(self.cache_dir+'/'+fasta_file_name, 'w')
             fasta_file.write(to_fasta(target_molecules))
             fasta_file.close()
-            commands.getoutput("docker run -v %s:/data fjossinet/rnaseq bowtie2-build /data/%s /data/%s"%(self.cache_dir, fasta_file_name, self.index_path))
+            self.docker_run('fjossinet/rnaseq', "bowtie2-build /data/%s /data/%s"%(fasta_file_name, self.index_path))
             print "Index files produced successfully: %s"%(self.cache_dir+'/'+self.index_path)
 
         return self.index_path
@@ -916,7 +1095,7 @@ class Cmsearch(Tool):
                                 sequence = m.sequence[target_positions[0][0]-1:target_positions[-1][1]]
                             else:
                                 target_positions = target_positions[::-1]
-                                sequence = m.get_complement()[target_positions[0][0]-1:target_positions[-1][1]][::-1]
+                                sequence = m.reverse_complement(target_positions[0][0]-1, target_positions[-1][1])
                             hit = {
                                 "cm_file": cm_file,
                                 "RFAM_family": rfam_family_id,
@@ -1412,7 +1591,7 @@ class Gotohscan(Tool):
                         if tokens[-1] == '+':
                             hit['sequence'] = target_molecule.sequence[start-1:end]
                         else:
-                            hit['sequence'] = target_molecule.get_complement()[end-1:start][::-1]
+                            hit['sequence'] = target_molecule.reverse_complement(end-1, start)
                 hits.append(hit)
 
         return DataFrame(hits)
@@ -1437,7 +1616,7 @@ class Mlocarna(Tool):
         fileName = utils.generate_random_name(7)+'.fasta'
         with open(self.cache_dir+'/'+fileName, 'w') as fasta_file:
             fasta_file.write(parsers.to_fasta(molecules))
-        output = commands.getoutput("docker run -v %s:/data fjossinet/assemble2 mlocarna /data/%s"%(self.cache_dir,fileName))
+        output = self.docker_run('fjossinet/assemble2', "mlocarna /data/%s"%fileName)
 
         aligned_molecules = {}
         consensus2D = None
@@ -1478,7 +1657,7 @@ class RnaAlifold(Tool):
         fileName = utils.generate_random_name(7)+'.aln'
         with open(self.cache_dir+'/'+fileName, 'w') as aln_file:
             aln_file.write(alignment)
-        return commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAalifold < /data/%s'"%(self.cache_dir, fileName)).strip().split('\n')[-1].split(' ')[0]
+        return self.docker_run('fjossinet/assemble2', "RNAalifold < /data/%s"%fileName).strip().split('\n')[-1].split(' ')[0]
 
 class Rnafold(Tool):
 
@@ -1523,13 +1702,13 @@ class Rnafold(Tool):
                     fasta_file.write("\n"+constraints)
 
             if constraints:
-                output = commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAfold -C < /data/%s'"%(self.cache_dir, fileName)).strip()
+                output = self.docker_run('fjossinet/assemble2', "RNAfold -C < /data/%s"%fileName).strip()
             elif bp_probabilities:
-                commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAfold -p < /data/%s'"%(self.cache_dir, fileName)).strip()
+                self.docker_run('fjossinet/assemble2', "RNAfold -p < /data/%s"%fileName).strip()
                 with open("%s/%s_dp.ps"%(self.cache_dir, molecule.name), 'r') as ps_file:
                     output = ps_file.read()
             else:
-                output = commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAfold < /data/%s'"%(self.cache_dir, fileName)).strip()
+                output = self.docker_run('fjossinet/assemble2', "RNAfold < /data/%s"%fileName).strip()
         if raw_output:
             return output
         else:
@@ -1591,7 +1770,7 @@ class Rnainverse(Tool):
 
         rnas = []
         i = 0
-        output = commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAinverse -R %i < /data/%s'"%(repeats, fileName))
+        output = self.docker_run('fjossinet/assemble2', "RNAinverse -R %i < /data/%s"%(repeats, fileName))
         for line in output.split('\n'):
             i+=1
             name = "%s_%i"%(molecule.name, i)
@@ -1669,7 +1848,7 @@ class RNAMotif(Tool):
                         hit['target_strand'] = '-'
                         hit['target_positions'] = [int(tokens[3])-(int(tokens[4])-1), int(tokens[3])]
                         if target_molecule:
-                            hit['sequence'] = target_molecule.get_complement()[hit['target_positions'][0]-1:hit['target_positions'][1]][::-1]
+                            hit['sequence'] = target_molecule.reverse_complement(hit['target_positions'][0]-1, hit['target_positions'][1])
                     length_list = []
                     for sequence in tokens[5:]:
                         length_list.append(len(sequence))
@@ -1738,13 +1917,13 @@ class Rnaplfold(Tool):
             fasta_file.write(parsers.to_fasta([molecule], single_line=True))
 
         if free_energies:
-            commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'cd /data/ ;RNAplfold -W %i -L %i -u %i -O < /data/%s'"%(self.cache_dir, winsize, span, width, fileName)).strip()
+            self.docker_run('fjossinet/assemble2', "cd /data/ ;RNAplfold -W %i -L %i -u %i -O < /data/%s"%(winsize, span, width, fileName)).strip()
 
             h = open('%s/test_openen'%self.cache_dir)
             output = h.read()
             h.close()
         else:
-            commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'cd /data/ ; RNAplfold -W %i -L %i -u %i < /data/%s'"%(self.cache_dir, winsize, span, width, fileName)).strip()
+            self.docker_run('fjossinet/assemble2', "cd /data/ ; RNAplfold -W %i -L %i -u %i < /data/%s"%(winsize, span, width, fileName)).strip()
 
             with open('%s/test_lunp'%self.cache_dir) as h:
                 output = h.read()
@@ -1812,7 +1991,7 @@ class Rnaplot(Tool):
             with open(self.cache_dir+'/'+vienna_file_name, 'w') as f:
                 f.write(parsers.to_vienna([secondary_structure], [_rna], single_line=True))
 
-            commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'cd /data ; RNAplot -o svg < /data/%s'"%(self.cache_dir, vienna_file_name))
+            self.docker_run('fjossinet/assemble2', "cd /data ; RNAplot -o svg < /data/%s"%vienna_file_name)
 
             for f in os.listdir(self.cache_dir):
                 if f.endswith('.svg'):
@@ -1866,7 +2045,7 @@ class Rnasubopt(Tool):
         with open(self.cache_dir+'/'+fileName, 'w') as fasta_file:
             fasta_file.write(parsers.to_fasta([molecule], single_line=True))
 
-        output = commands.getoutput("docker run -v %s:/data fjossinet/assemble2 bash -c 'RNAsubopt %s %s < /data/%s'"%(self.cache_dir, "-e %i"%range if range else "" ,  "-p %i"%random_sample if random_sample else "", fileName)).strip()
+        output = self.docker_run('fjossinet/assemble2', "RNAsubopt %s %s < /data/%s"%("-e %i"%range if range else "" ,  "-p %i"%random_sample if random_sample else "", fileName)).strip()
         secondary_structures = []
         for line in output.split('\n'):
             tokens = line.split(' ')
@@ -1912,117 +2091,53 @@ class Rnaview(Tool):
                     pdb_file.write(pdb_content)
                 else:
                     pdb_file.write(to_pdb(tertiary_structure, export_numbering_system = True))
-            commands.getoutput("docker run -v %s:/data fjossinet/assemble2 rnaview -p /data/%s"%(self.cache_dir,pdb_file_name))
+            self.docker_run('fjossinet/assemble2', "rnaview -p /data/%s"%pdb_file_name)
 
             xml_file_name = self.cache_dir+'/'+pdb_file_name+".xml"
-            xml_content = ""
-            if os.path.exists(xml_file_name):
-                with open(xml_file_name) as xml_file:
-                    xml_content = xml_file.read()
-            else:
+            if not os.path.exists(xml_file_name):
                 raise Exception("No file %s"%xml_file_name)
+            if raw_output:
+                with open(xml_file_name) as xml_file:
+                    return xml_file.read()
         if raw_output:
             return xml_content
         else:
-            import xml.etree.ElementTree as ET
-            rnaml_tree = ET.fromstring(xml_content)
-
-            molecule = rnaml_tree.find('molecule')
+            molecule = next(parsers.iter_rnaml(StringIO(xml_content) if self.rest_server else xml_file_name)) #the local RNAML file is parsed while read
 
-            rna = RNA(name = tertiary_structure.rna.name, sequence = re.sub('\s+','',molecule.find('sequence').find('seq-data').text))
+            rna = RNA(name = tertiary_structure.rna.name, sequence = molecule['sequence'])
 
-            secondary_structure = SecondaryStructure(rna)
-            secondary_structure.source='tool:rnaview:N.A.'
             new_3D = None
 
             if len(rna) != len(tertiary_structure.rna): #RNAVIEW can have problems with some residues. Consequently, RNAVIEW produces an RNA molecule with a different sequence. We need to fit the 3D to this molecule.
                 new_3D = TertiaryStructure(rna)
                 new_3D.source = "tool:rnaview:N.A."
-                numbering_system = re.sub('\s{2,}', ' ', molecule.find('sequence').find('numbering-table').text).strip().split(' ')
+                numbering_system = re.sub('\s{2,}', ' ', molecule['numbering_table']).strip().split(' ')
                 #the strategy is the following:
                 #- the numbering-table in the XML output stores the labels of the 3D residues used by RNAVIEW
                 #- for each residue label, we recover its absolute position in the numbering system of the initial 3D
+                #- the atoms of the residues found are added to the new 3D at once
+                import numpy as np
+                label_positions = {}
+                for absPos, label in tertiary_structure.numbering_system.items():
+                    label_positions.setdefault(label, int(absPos))
+                atom_names, atom_positions, coords = [], [], []
                 residue_absPos = 1
                 for residue_label in numbering_system:
-                    for absPos, label in tertiary_structure.numbering_system.items():
-                        if label == residue_label:
-                            new_3D.residues[residue_absPos] = tertiary_structure.residues[int(absPos)]
-                            break
+                    if label_positions.has_key(residue_label):
+                        names, _coords = tertiary_structure.get_residue_atoms(label_positions[residue_label])
+                        atom_names.append(names)
+                        atom_positions.append(np.repeat(residue_absPos, len(names)))
+                        coords.append(_coords)
                     residue_absPos += 1
+                if atom_names:
+                    new_3D.add_atoms(np.concatenate(atom_names), np.concatenate(atom_positions), np.concatenate(coords))
             else: #no problem, then we can substitute the RNA of the 2D for the RNA of the 3D
-                secondary_structure.rna = tertiary_structure.rna
-
-            if not canonical_only:
-
-                for helix in molecule.find('structure').find('model').find('str-annotation').findall('helix'):
-                    secondary_structure.add_helix(helix.get('id'), int(helix.find('base-id-5p').find('base-id').find('position').text), int(helix.find('base-id-3p').find('base-id').find('position').text), int(helix.find('length').text));
-
-                #for single_strand in molecule.find('structure').find('model').find('str-annotation').findall('single-strand'):
-                #    end5 = int(single_strand.find('segment').find('base-id-5p').find('base-id').find('position').text)
-                #    end3 = int(single_strand.find('segment').find('base-id-3p').find('base-id').find('position').text)
-                #    secondary_structure.add_single_strand(single_strand.find('segment').find('seg-name').text, end5, end3-end5+1);
-
-                for base_pair in molecule.find('structure').find('model').find('str-annotation').findall('base-pair'):
-                    edge1 = '('
-                    edge2 = ')'
-                    if base_pair.find('edge-5p').text == 'H':
-                        edge1 = '['
-                    elif base_pair.find('edge-5p').text == 'S':
-                        edge1 = '{'
-                    elif base_pair.find('edge-5p').text == 's':
-                        edge1 = '{'
-                    elif base_pair.find('edge-5p').text == '!':
-                        edge1 = '!'
-
-                    if base_pair.find('edge-3p').text == 'H':
-                        edge2 = ']'
-                    elif base_pair.find('edge-3p').text == 'S':
-                        edge2 = '}'
-                    elif base_pair.find('edge-3p').text == 's':
-                        edge2 = '}'
-                    elif base_pair.find('edge-3p').text == '!':
-                        edge2 = '!'
-
-                    secondary_structure.add_base_pair(base_pair.find('bond-orientation').text.lower(), edge1, edge2, int(base_pair.find('base-id-5p').find('base-id').find('position').text), int(base_pair.find('base-id-3p').find('base-id').find('position').text));
-
-            else:
-                canonical_bps = []
-                non_canonical_bps = []
-                for base_pair in molecule.find('structure').find('model').find('str-annotation').findall('base-pair'):
-                    edge1 = '('
-                    edge2 = ')'
-                    if base_pair.find('edge-5p').text == 'H':
-                        edge1 = '['
-                    elif base_pair.find('edge-5p').text == 'S':
-                        edge1 = '{'
-                    elif base_pair.find('edge-5p').text == 's':
-                        edge1 = '{'
-                    elif base_pair.find('edge-5p').text == '!':
-                        edge1 = '!'
-
-                    if base_pair.find('edge-3p').text == 'H':
-                        edge2 = ']'
-                    elif base_pair.find('edge-3p').text == 'S':
-                        edge2 = '}'
-                    elif base_pair.find('edge-3p').text == 's':
-                        edge2 = '}'
-                    elif base_pair.find('edge-3p').text == '!':
-                        edge2 = '!'
-
-                    orientation = base_pair.find('bond-orientation').text.lower()
-
-                    pos1 = int(base_pair.find('base-id-5p').find('base-id').find('position').text)
-                    residue1 = secondary_structure.rna.sequence[pos1-1]
-                    pos2 = int(base_pair.find('base-id-3p').find('base-id').find('position').text)
-                    residue2 = secondary_structure.rna.sequence[pos2-1]
-
-                    canonical_bps.append([orientation, edge1, edge2, pos1, pos2]) if utils.is_canonical(residue1, residue2, orientation, edge1, edge2) else non_canonical_bps.append([orientation, edge1, edge2, pos1, pos2])
-
-                secondary_structure = base_pairs_to_secondary_structure(secondary_structure.rna, DataFrame(canonical_bps, columns=['orientation', 'edge1', 'edge2', 'pos1', 'pos2']))
-
-                for bp in non_canonical_bps: #the non-canonical interactions are tertiary ones
-                    secondary_structure.add_tertiary_interaction(bp[0], bp[1], bp[2], bp[3], bp[4])
+                rna = tertiary_structure.rna
 
+            base_pairs = molecule['base_pairs']
+            base_pairs['orientation'] = [orientation.lower() for orientation in base_pairs['orientation']]
+            secondary_structure = parsers.rnaml_base_pairs_to_secondary_structure(rna, molecule['helices'], base_pairs, canonical_only = canonical_only)
+            secondary_structure.source = 'tool:rnaview:N.A.'
             secondary_structure.find_single_strands()
 
             if new_3D:
@@ -2051,7 +2166,7 @@ class Samtools(Tool):
         if not self.use_docker:
             return commands.getoutput("samtools %s"%(" ".join(user_defined_options)))
         else:
-            return commands.getoutput("docker run -v %s:/data fjossinet/rnaseq bash -c 'samtools %s'"%(self.sam_dir, " ".join(user_defined_options)))
+            return self.docker_run('fjossinet/rnaseq', "samtools %s"%(" ".join(user_defined_options)), volume = self.sam_dir)
 
     def sort_and_index(self):
         """
@@ -2174,7 +2289,7 @@ class SnoGPS(Tool):
                         else:
                             hit['target_strand'] = "-"
                             if target_molecule:
-                                hit['sequence'] = target_molecule.get_complement()[hit['target_positions'][0]-1:hit['target_positions'][1]][::-1]
+                                hit['sequence'] = target_molecule.reverse_complement(hit['target_positions'][0]-1, hit['target_positions'][1])
             if target_molecule:
                 if line.startswith('#stem1'):
                     chain1 = lines[j+2]
@@ -2192,10 +2307,10 @@ class SnoGPS(Tool):
                         jl = hit['target_positions'][0]+chain.rfind('L') if hit['target_strand'] is "+" else hit['target_positions'][1]-chain.rfind('L')
                         ir = hit['target_positions'][0]+chain.find('R') if hit['target_strand'] is "+" else hit['target_positions'][1]-chain.find('R')
                         jr = hit['target_positions'][0]+chain.rfind('R') if hit['target_strand'] is "+" else hit['target_positions'][1]-chain.rfind('R')
-                        hit['H-box'] = {'genomicPositions': [ih, ih+5], 'sequence': target_molecule[ih-1:ih+5]} if hit['target_strand'] is "+" else {'genomicPositions': [ih-5, ih], 'sequence': target_molecule.get_complement()[ih-6:ih][::-1]}
-                        hit['ACA-box'] = {'genomicPositions': [ic, ic+2], 'sequence': target_molecule[ic-1:ic+2]} if hit['target_strand'] is "+" else {'genomicPositions': [ic-2, ic], 'sequence': target_molecule.get_complement()[ic-3:ic][::-1]}
-                        hit['L-guide'] = {'genomicPositions': [il, jl], 'sequence': target_molecule[il-1:jl]} if hit['target_strand'] is "+" else {'genomicPositions': [jl, il], 'sequence': target_molecule.get_complement()[jl-1:il][::-1]}
-                        hit['R-guide'] = {'genomicPositions': [ir, jr], 'sequence': target_molecule[ir-1:jr]} if hit['target_strand'] is "+" else {'genomicPositions': [jr, ir], 'sequence': target_molecule.get_complement()[jr-1:ir][::-1]}
+                        hit['H-box'] = {'genomicPositions': [ih, ih+5], 'sequence': target_molecule[ih-1:ih+5]} if hit['target_strand'] is "+" else {'genomicPositions': [ih-5, ih], 'sequence': target_molecule.reverse_complement(ih-6, ih)}
+                        hit['ACA-box'] = {'genomicPositions': [ic, ic+2], 'sequence': target_molecule[ic-1:ic+2]} if hit['target_strand'] is "+" else {'genomicPositions': [ic-2, ic], 'sequence': target_molecule.reverse_complement(ic-3, ic)}
+                        hit['L-guide'] = {'genomicPositions': [il, jl], 'sequence': target_molecule[il-1:jl]} if hit['target_strand'] is "+" else {'genomicPositions': [jl, il], 'sequence': target_molecule.reverse_complement(jl-1, il)}
+                        hit['R-guide'] = {'genomicPositions': [ir, jr], 'sequence': target_molecule[ir-1:jr]} if hit['target_strand'] is "+" else {'genomicPositions': [jr, ir], 'sequence': target_molecule.reverse_complement(jr-1, ir)}
                         trantab = maketrans("HLR ", "....")
                         chars = chain.translate(trantab)
                         x = 0
@@ -2302,18 +2417,18 @@ class Snoreport(Tool):
                     i2 = len(molecule) - (int(words[-3].split(':')[-1])+1)
                     j2 = len(molecule) - int(words[-4].split(':')[-1])
                     hit['target_positions'] = [i2+1, j2]
-                    hit['sequence'] = molecule.get_complement()[i2:j2][::-1]
+                    hit['sequence'] = molecule.reverse_complement(i2, j2)
                 #hit['bracket_notation'] = parsers.parse_bn(lines[i-1]) #Panda DataFrame object cannot be encoded by pymongo
                 hit['bracket_notation'] = lines[i-1]
                 cross_notation = lines[i-2]
                 i3 = cross_notation.find('x')
                 j3 = cross_notation.rfind('x')
                 if line.startswith('CD'):
-                    hit['C-box'] = {'genomicPositions': [hit['target_positions'][0]+i3, hit['target_positions'][0]+i3+6], 'sequence': molecule[hit['target_positions'][0]+i3-1:hit['target_positions'][0]+i3+6]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-(i3+6), j2-i3], 'sequence': molecule.get_complement()[j2-(i3+7):j2-i3][::-1]}
-                    hit['D-box'] = {'genomicPositions': [hit['target_positions'][0]+j3-3, hit['target_positions'][0]+j3], 'sequence': molecule[hit['target_positions'][0]+j3-4:hit['target_positions'][0]+j3]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-j3, j2-(j3-3)], 'sequence': molecule.get_complement()[j2-j3-1:j2-(j3-3)][::-1]}
+                    hit['C-box'] = {'genomicPositions': [hit['target_positions'][0]+i3, hit['target_positions'][0]+i3+6], 'sequence': molecule[hit['target_positions'][0]+i3-1:hit['target_positions'][0]+i3+6]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-(i3+6), j2-i3], 'sequence': molecule.reverse_complement(j2-(i3+7), j2-i3)}
+                    hit['D-box'] = {'genomicPositions': [hit['target_positions'][0]+j3-3, hit['target_positions'][0]+j3], 'sequence': molecule[hit['target_positions'][0]+j3-4:hit['target_positions'][0]+j3]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-j3, j2-(j3-3)], 'sequence': molecule.reverse_complement(j2-j3-1, j2-(j3-3))}
                 else:
-                    hit['H-box'] = {'genomicPositions': [hit['target_positions'][0]+i3, hit['target_positions'][0]+i3+5], 'sequence': molecule[hit['target_positions'][0]+i3-1:hit['target_positions'][0]+i3+5]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-(i3+5), j2-i3], 'sequence': molecule.get_complement()[j2-(i3+6):j2-i3][::-1]}
-                    hit['ACA-box'] = {'genomicPositions': [hit['target_positions'][0]+j3-2, hit['target_positions'][0]+j3], 'sequence': molecule[hit['target_positions'][0]+j3-3:hit['target_positions'][0]+j3]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-j3, j2-(j3-2)], 'sequence': molecule.get_complement()[j2-j3-1:j2-(j3-2)][::-1]}
+                    hit['H-box'] = {'genomicPositions': [hit['target_positions'][0]+i3, hit['target_positions'][0]+i3+5], 'sequence': molecule[hit['target_positions'][0]+i3-1:hit['target_positions'][0]+i3+5]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-(i3+5), j2-i3], 'sequence': molecule.reverse_complement(j2-(i3+6), j2-i3)}
+                    hit['ACA-box'] = {'genomicPositions': [hit['target_positions'][0]+j3-2, hit['target_positions'][0]+j3], 'sequence': molecule[hit['target_positions'][0]+j3-3:hit['target_positions'][0]+j3]} if hit['target_strand'] is "+" else {'genomicPositions': [j2-j3, j2-(j3-2)], 'sequence': molecule.reverse_complement(j2-j3-1, j2-(j3-2))}
                 hits.append(hit)
         if len(hits):
             return DataFrame(hits, columns = ['source', 'score',  'target_strand', 'target_name', 'class', 'name', 'target_positions', 'sequence', 'bracket_notation', 'C-box', 'D-box', 'H-box', 'ACA-box'])
@@ -2391,7 +2506,7 @@ class Snoscan(Tool):
                     hit['target_strand'] = "-"
                     hit['target_positions'] = target_positions[::-1]
                     if target_molecule:
-                        hit['sequence'] = target_molecule.get_complement()[hit['target_positions'][0]-1:hit['target_positions'][1]][::-1]
+                        hit['sequence'] = target_molecule.reverse_complement(hit['target_positions'][0]-1, hit['target_positions'][1])
                 else:
                     raise Exception("Hit with incorrect target positions")
                 hit['target_rRNA'] = tokens[5]
@@ -2406,15 +2521,15 @@ class Snoscan(Tool):
                     i = int(match.group(1))
                     j = int(match.group(2))
                     dist_cd = int(match.group(3))
-                    hit['C-box'] = {'genomicPositions': [i, j], 'sequence': target_molecule[i-1:j]} if hit['target_strand'] is "+" else {'genomicPositions': [j, i], 'sequence': target_molecule.get_complement()[j-1:i][::-1]}
-                    hit['D-box'] = {'genomicPositions': [j+dist_cd+1, j+dist_cd+4], 'sequence': target_molecule[j+dist_cd:j+dist_cd+4]} if hit['target_strand'] is "+" else {'genomicPositions': [j-dist_cd-4, j-dist_cd-1], 'sequence': target_molecule.get_complement()[j-dist_cd-5:j-dist_cd-1][::-1]}
+                    hit['C-box'] = {'genomicPositions': [i, j], 'sequence': target_molecule[i-1:j]} if hit['target_strand'] is "+" else {'genomicPositions': [j, i], 'sequence': target_molecule.reverse_complement(j-1, i)}
+                    hit['D-box'] = {'genomicPositions': [j+dist_cd+1, j+dist_cd+4], 'sequence': target_molecule[j+dist_cd:j+dist_cd+4]} if hit['target_strand'] is "+" else {'genomicPositions': [j-dist_cd-4, j-dist_cd-1], 'sequence': target_molecule.reverse_complement(j-dist_cd-5, j-dist_cd-1)}
             elif target_molecule and line.startswith('Qry seq:'):
                 pattern = re.compile('\((\d+)-(\d+)\)')
                 match = pattern.search(line)
                 if match:
                     i = int(match.group(1))
                     j = int(match.group(2))
-                    hit['guide_sequence'] = {'genomicPositions': [j, i], 'sequence': target_molecule[j-1:i]} if hit['target_strand'] is "+" else {'genomicPositions': [i, j], 'sequence': target_molecule.get_complement()[i-1:j][::-1]}
+                    hit['guide_sequence'] = {'genomicPositions': [j, i], 'sequence': target_molecule[j-1:i]} if hit['target_strand'] is "+" else {'genomicPositions': [i, j], 'sequence': target_molecule.reverse_complement(i-1, j)}
                 hits.append(hit)
                 target_molecule = None
         if not flag:
@@ -2483,7 +2598,7 @@ class TrnaScanSE(Tool):
                     elif target_positions[0] > target_positions[1]:
                         hit['target_strand'] = "-"
                         hit['target_positions'] = target_positions[::-1]
-                        hit['sequence'] = target_molecule.get_complement()[hit['target_positions'][0]:hit['target_positions'][1]][::-1]
+                        hit['sequence'] = target_molecule.reverse_complement(hit['target_positions'][0], hit['target_positions'][1])
                     else:
                         print "Error: hit with incorrect target positions"
                         print "##########\n" + line + "\n##########"
@@ -449,6 +449,7 @@ class Rfam:
         else:
             self.cache_dir = cache_dir
         self.version = version
+        self.__indexes = {} #the byte ranges of the families in the files Rfam.seed and Rfam.full
         if not os.path.exists(self.cache_dir):
             shutil.os.mkdir(self.cache_dir)
 
@@ -480,15 +481,19 @@ class Rfam:
             if not content.startswith("# STOCKHOLM"):
                 raise Exception("Rfam family %s not found!!"%rfam_id)
         else:
-            path = os.path.join(self.cache_dir, aln_type, "%s.sto"%rfam_id)
+            path = os.path.join(self.cache_dir, aln_type, "%s.sto"%rfam_id) #a family file from a previous cache
+            index = self.__get_index(aln_type)
 
-            if not os.path.exists(path):
-                raise Exception("file %s not found!!"%path)
-            else:
+            if os.path.exists(path):
                 with open(path) as h:
                     content = h.read()
-                if not content.strip().split('\n')[-1].strip() == '//': #incomplete file
-                    raise Exception("file %s is incomplete!!"%path)
+            elif index is not None and index.has_key(rfam_id):
+                path = os.path.join(self.cache_dir, aln_type, "Rfam.%s"%aln_type)
+                content = parsers.read_stockholm(path, *index[rfam_id])
+            else:
+                raise Exception("file %s not found!!"%path)
+            if not content.strip().split('\n')[-1].strip() == '//': #incomplete file
+                raise Exception("file %s is incomplete!!"%path)
 
         if not format:
             return parsers.parse_stockholm(content)
@@ -635,57 +640,47 @@ class Rfam:
         """
         This method has to be called if the Rfam wrapper uses data from the FTP. Seed alignments will be downloaded and stored locally.
         """
-        if not os.path.exists(self.cache_dir+'/seed/Rfam.seed'):
-            if not os.path.exists(self.cache_dir+'/seed/'):
-                shutil.os.mkdir(self.cache_dir+'/seed/')
-            subprocess.call([os.path.dirname(os.path.realpath(__file__))+"/../scripts/shell/getRfam_data.sh "+self.cache_dir+"/seed/ ftp://ftp.ebi.ac.uk/pub/databases/Rfam/"+self.version+"/ Rfam.seed.gz"], shell=True)
-
-        with open(self.cache_dir+'/seed/Rfam.seed') as h:
-            currentAccession = None
-            currentContent = None
-
-            for line in h:
-                if re.match('^#=GF AC', line):
-                    if currentContent and currentAccession:
-                        with open(self.cache_dir+'/seed/'+currentAccession+'.sto', 'w') as output:
-                            output.write(currentContent)
-                    currentContent = "# STOCKHOLM 1.0\n"
-                    currentContent += line
-                    currentAccession = re.split("\s+", line)[-2]
-                elif currentContent and not re.match('^# STOCKHOLM 1.0', line):
-                    currentContent += line
-
-            if currentContent and currentAccession:
-                with open(self.cache_dir+'/seed/'+currentAccession+'.sto', 'w') as output:
-                    output.write(currentContent)
+        self.__generate_alignments('seed')
 
     def generate_full_alignments(self):
         """
         This method has to be called if the Rfam wrapper uses data from the FTP. Full alignments will be downloaded and stored locally.
         """
-        if not os.path.exists(self.cache_dir+'/full/Rfam.full'):
-            if not os.path.exists(self.cache_dir+'/full/'):
-                shutil.os.mkdir(self.cache_dir+'/full/')
-            subprocess.call([os.path.dirname(os.path.realpath(__file__))+"/../scripts/shell/getRfam_data.sh "+self.cache_dir+"/full/ ftp://ftp.ebi.ac.uk/pub/databases/Rfam/"+self.version+"/ Rfam.full.gz"], shell=True)
-
-        with open(self.cache_dir+'/full/Rfam.full') as h:
-            currentAccession = None
-            currentContent = None
-
-            for line in h:
-                if re.match('^#=GF AC', line):
-                    if currentContent and currentAccession:
-                        with open(self.cache_dir+'/full/'+currentAccession+'.sto', 'w') as output:
-                            output.write(currentContent)
-                    currentContent = "# STOCKHOLM 1.0\n"
-                    currentContent += line
-                    currentAccession = re.split("\s+", line)[-2]
-                elif currentContent and not re.match('^# STOCKHOLM 1.0', line):
-                    currentContent += line
-
-            if currentContent and currentAccession:
-                with open(self.cache_dir+'/full/'+currentAccession+'.sto', 'w') as output:
-                    output.write(currentContent)
+        self.__generate_alignments('full')
+
+    def __generate_alignments(self, aln_type):
+        """
+        Download the file Rfam.seed or Rfam.full and index the byte range of each family (file Rfam.seed.idx or Rfam.full.idx), instead of splitting the file into one file per family.
+        """
+        alignments_file = "%s/%s/Rfam.%s"%(self.cache_dir, aln_type, aln_type)
+        if not os.path.exists(alignments_file):
+            if not os.path.exists(self.cache_dir+'/'+aln_type+'/'):
+                shutil.os.mkdir(self.cache_dir+'/'+aln_type+'/')
+            subprocess.call([os.path.dirname(os.path.realpath(__file__))+"/../scripts/shell/getRfam_data.sh "+self.cache_dir+"/"+aln_type+"/ ftp://ftp.ebi.ac.uk/pub/databases/Rfam/"+self.version+"/ Rfam."+aln_type+".gz"], shell=True)
+
+        if not os.path.exists(alignments_file+'.idx') or os.path.getmtime(alignments_file+'.idx') < os.path.getmtime(alignments_file):
+            with open(alignments_file+'.idx', 'w') as h:
+                for accession, offset, length in parsers.iter_stockholm(alignments_file, index = True):
+                    if accession:
+                        h.write("%s\t%i\t%i\n"%(accession, offset, length))
+        self.__indexes.pop(aln_type, None)
+
+    def __get_index(self, aln_type):
+        """
+        Returns the index of the file Rfam.seed or Rfam.full as a dict: the keys are the Rfam ids, the values the (offset, length) tuples. Returns None if the alignments have not been generated.
+        """
+        if not self.__indexes.has_key(aln_type):
+            index_file = "%s/%s/Rfam.%s.idx"%(self.cache_dir, aln_type, aln_type)
+            if not os.path.exists(index_file):
+                return None
+            index = {}
+            with open(index_file) as h:
+                for line in h:
+                    tokens = line.rstrip('\r\n').split('\t')
+                    if len(tokens) == 3:
+                        index[tokens[0]] = (int(tokens[1]), int(tokens[2]))
+            self.__indexes[aln_type] = index
+        return self.__indexes[aln_type]
 
     def generate_CMs(self):
         """
@@ -1,8 +1,9 @@
 from pandas import DataFrame
+import numpy as np
 import re
 from bson.objectid import ObjectId
-from itertools import groupby
-from operator import itemgetter
+from bisect import bisect_left, bisect_right
+from string import maketrans
 
 class Block:
     """
@@ -17,20 +18,48 @@ class Block:
             self.end = start
 
     def is_before(self, block):
-        pass
+        """
+        Test if this Block ends before the start of the Block given as argument.
+        """
+        return self.end < block.start
 
     def is_beside(self, block):
-        pass
+        """
+        Test if this Block and the Block given as argument are contiguous without sharing any position.
+        """
+        return self.end+1 == block.start or block.end+1 == self.start
 
     def intersects(self, block):
-        pass
+        """
+        Test if this Block and the Block given as argument share at least one position.
+        """
+        return self.start <= block.end and block.start <= self.end
 
     def merge(self, block):
-        pass
+        """
+        Extend this Block to enclose the Block given as argument.
+        """
+        self.start = min(self.start, block.start)
+        self.end = max(self.end, block.end)
+
+def _merge_ranges(ranges):
+    """
+    Sort a list of (start, end) ranges and merge the overlapping or contiguous ones.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]+1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
 
 class Location:
     """
     A Location defines a range of molecular positions, continuous or not. A location is made with Block objects.
+
+    The blocks are kept sorted and non-overlapping. All the operations (membership, union, intersection, difference) are computed on the blocks and never on the single positions.
     """
     def __init__(self, start = None, end = None, single_positions = None, nested_lists = None):
         """
@@ -40,64 +69,109 @@ class Location:
         - list the ranges of continuous positions as nested lists: Location(nested_lists=[[34,34], [56,58], [67,69]])
         """
         self.blocks = []
+        self._starts = []
         if start and end:
             self.add_block(Block(start, end))
         elif single_positions:
-            single_positions.sort()
-            for k, g in groupby(enumerate(single_positions), lambda (i,x):i-x):
-                _range = map(itemgetter(1), g)
-                self.blocks.append(Block(min(_range), max(_range)))
+            self._set_ranges([[position, position] for position in single_positions])
         elif nested_lists:
-            for nested_list in nested_lists:
-                self.blocks.append(Block(min(nested_list), max(nested_list)))
+            self._set_ranges([[min(nested_list), max(nested_list)] for nested_list in nested_lists])
+
+    def _set_ranges(self, ranges):
+        self.blocks = [Block(start, end) for start, end in _merge_ranges(ranges)]
+        self._starts = [block.start for block in self.blocks]
+
+    def _get_ranges(self):
+        return [[block.start, block.end] for block in self.blocks]
 
     def add_block(self, block):
-        blocks_to_remove = []
+        #the blocks to merge are those intersecting or contiguous to the new block. Since the blocks are sorted and disjoint, they are found by bisection
+        first = bisect_left(self._starts, block.start)
+        if first > 0 and (self.blocks[first-1].intersects(block) or self.blocks[first-1].is_beside(block)):
+            first -= 1
+        last = bisect_right(self._starts, block.end+1)
 
-        for _block in self.blocks:
-            if block.is_before(_block) and not block.is_beside(_block):
-                break
-            elif block.intersects(_block) or block.is_beside(_block):
-                block.merge(_block)
-                blocks_to_remove.append(_block)
-                #its necessary to continue to see if the new Block can merge with other blocks
-                continue
-            elif len(blocks_to_remove):
-                break
+        for _block in self.blocks[first:last]:
+            block.merge(_block)
 
-        for block_to_remove in blocks_to_remove:
-            self.blocks.remove(block_to_remove)
+        self.blocks[first:last] = [block]
+        self._starts[first:last] = [block.start]
+
+    def add_location(self, location):
+        """
+        Return a new Location object from the union between the current Location and the Location given as argument.
+        """
+        return self.add_locations([location])
+
+    def add_locations(self, locations):
+        """
+        Return a new Location object from the union between the current Location and all the Locations given in a list as argument.
+        """
+        ranges = self._get_ranges()
+        for location in locations:
+            ranges += location._get_ranges()
+        union = Location()
+        union._set_ranges(ranges)
+        return union
 
-        self.blocks.append(block)
-        self.blocks = sorted(self.blocks, key=lambda block: block.start)
+    def intersect_location(self, location):
+        """
+        Return a new Location object from the intersection between the current Location and the Location given as argument.
+        Intersection means all the positions found in both Locations
+        """
+        ranges = []
+        i = j = 0
+        while i < len(self.blocks) and j < len(location.blocks):
+            block_1 = self.blocks[i]
+            block_2 = location.blocks[j]
+            start = max(block_1.start, block_2.start)
+            end = min(block_1.end, block_2.end)
+            if start <= end:
+                ranges.append([start, end])
+            if block_1.end < block_2.end:
+                i += 1
+            else:
+                j += 1
+        intersection = Location()
+        intersection._set_ranges(ranges)
+        return intersection
 
     def remove_location(self, location):
         """
         Return a new Location object from the difference between the current Location and the Location given as argument.
         Difference means all the positions not found in the Location given as argument
         """
-        single_positions_1 = self.get_single_positions()
-        single_positions_2 = location.get_single_positions()
-
-        diff = list(set(single_positions_1) - set(single_positions_2))
-
-        return Location(single_positions = diff)
+        return self.remove_locations([location])
 
     def remove_locations(self, locations):
         """
         Return a new Location object from the difference between the current Location with all the Locations given in a list as argument.
         Difference means all the positions not found in the Locations given as argument
         """
-        single_positions_1 = self.get_single_positions()
-        single_positions_2 = []
-
+        to_remove = []
         for location in locations:
-            single_positions_2 += location.get_single_positions()
-
-        diff = list(set(single_positions_1) - set(single_positions_2))
-
-        return Location(single_positions = diff)
+            to_remove += location._get_ranges()
+        to_remove = _merge_ranges(to_remove)
 
+        ranges = []
+        j = 0
+        for block in self.blocks:
+            start = block.start
+            #we skip the ranges to remove that end before this block
+            while j < len(to_remove) and to_remove[j][1] < start:
+                j += 1
+            k = j
+            while k < len(to_remove) and to_remove[k][0] <= block.end:
+                if to_remove[k][0] > start:
+                    ranges.append([start, to_remove[k][0]-1])
+                start = max(start, to_remove[k][1]+1)
+                k += 1
+            if start <= block.end:
+                ranges.append([start, block.end])
+
+        diff = Location()
+        diff._set_ranges(ranges)
+        return diff
 
     def get_single_positions(self):
         """
@@ -117,7 +191,8 @@ class Location:
         ---------
         position: an integer
         """
-        return position in self.get_single_positions()
+        i = bisect_right(self._starts, position)-1
+        return i >= 0 and position <= self.blocks[i].end
 
     def start(self):
         return self.blocks[0].start
@@ -126,17 +201,105 @@ class Location:
         return self.blocks[-1].end
 
 
-class Molecule:
+class IntervalTree:
+    """
+    A static centered interval tree. It returns the k intervals enclosing a position in O(log n + k).
+    """
+    def __init__(self, intervals):
+        """
+        Parameters:
+        ---------
+        - intervals: a list of (start, end, value) tuples. The start and end positions are included in the interval.
+        """
+        self.center = None
+        self.left = None
+        self.right = None
+        self.by_start = []
+        self.by_end = []
+        if not intervals:
+            return
+        ends = sorted([interval[0] for interval in intervals]+[interval[1] for interval in intervals])
+        self.center = ends[len(ends)/2] #the median end is enclosed by at least one interval, so each node stores at least one interval
+        overlapping = [interval for interval in intervals if interval[0] <= self.center <= interval[1]]
+        self.by_start = sorted(overlapping, key=lambda interval: interval[0])
+        self.by_end = sorted(overlapping, key=lambda interval: interval[1], reverse=True)
+        left = [interval for interval in intervals if interval[1] < self.center]
+        right = [interval for interval in intervals if interval[0] > self.center]
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def find(self, position):
+        """
+        Returns:
+        ------
+        the values of all the intervals enclosing the position given as argument.
+        """
+        values = []
+        node = self
+        while node and node.center is not None:
+            if position < node.center:
+                for start, end, value in node.by_start:
+                    if start > position:
+                        break
+                    values.append(value)
+                node = node.left
+            elif position > node.center:
+                for start, end, value in node.by_end:
+                    if end < position:
+                        break
+                    values.append(value)
+                node = node.right
+            else:
+                values += [value for start, end, value in node.by_start]
+                break
+        return values
+
+class Molecule(object):
+    #the molecules can be created by hundreds of thousands (alignments, genomic windows,...). Slots keep them small, and the _id and the lists are only created when first needed.
+    __slots__ = ('__id', '__modified_residues', '__dbxref', 'name', 'family', 'organism', 'lineage', 'source', 'sequence')
+
     def __init__(self, name):
-        self._id = str(ObjectId())
-        self.modified_residues = []
+        self.__id = None
+        self.__modified_residues = None
+        self.__dbxref = None
         self.name = name
         self.family = None
         self.organism = None
         self.lineage = None
         self.source = 'N.A.:N.A.:N.A.'
         self.sequence = ""
-        self.dbxref = [] #to store the references, as strings, to external databases for this molecule ("RFAM:RF00001", "GO:0006355", "GeneID:13886572")
+
+    def get_id(self):
+        if self.__id is None:
+            self.__id = str(ObjectId())
+        return self.__id
+
+    def set_id(self, _id):
+        self.__id = _id
+
+    _id = property(get_id, set_id)
+
+    def get_modified_residues(self):
+        if self.__modified_residues is None:
+            self.__modified_residues = []
+        return self.__modified_residues
+
+    def set_modified_residues(self, modified_residues):
+        self.__modified_residues = modified_residues
+
+    modified_residues = property(get_modified_residues, set_modified_residues) #the (residue, position) tuples
+
+    def get_dbxref(self):
+        if self.__dbxref is None:
+            self.__dbxref = []
+        return self.__dbxref
+
+    def set_dbxref(self, dbxref):
+        self.__dbxref = dbxref
+
+    dbxref = property(get_dbxref, set_dbxref) #to store the references, as strings, to external databases for this molecule ("RFAM:RF00001", "GO:0006355", "GeneID:13886572")
 
     def get_gaps_positions(self):
         positions = []
@@ -192,29 +355,90 @@ class Molecule:
         return self.sequence.__getitem__(i)
 
 
-class DNA(Molecule):
-    def __init__(self, sequence, name = 'dna'):
+def _complement_translation(bases, complements):
+    return {
+        'str': maketrans(bases, complements),
+        'unicode': dict([(ord(base), unicode(complement)) for base, complement in zip(bases, complements)])
+    }
+
+class NucleicAcid(Molecule):
+    """
+    The common base of DNA and RNA molecules. Each subclass defines its complement_translation.
+    """
+    __slots__ = ('__complement',)
+
+    complement_translation = None
+
+    def __init__(self, name):
         Molecule.__init__(self, name)
-        self.sequence = sequence
+        self.__complement = None
 
-    def get_complement(self):
+    def get_complement(self, cache = False):
         """
+        Parameters:
+        ---------
+        - cache (default: False): if True, the complement strand is kept with this molecule and reused by the next calls (until the sequence changes)
+
         Returns:
         ------
         the complement sequence as a string.
         """
-        basecomplement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
-        letters = list(self.sequence)
-        letters = [basecomplement[base] if basecomplement.has_key(base) else base for base in letters]
-        return ''.join(letters)
+        if self.__complement is not None and self.__complement[0] is self.sequence:
+            return self.__complement[1]
+        complement = _translate(self.sequence, self.complement_translation)
+        if cache:
+            self.__complement = (self.sequence, complement)
+        return complement
+
+    def reverse_complement(self, start = None, end = None):
+        """
+        Returns the reverse complement of a region of this molecule, without complementing the whole sequence. molecule.reverse_complement(start, end) is equivalent to molecule.get_complement()[start:end][::-1].
+
+        Parameters:
+        ---------
+        - start (default: None): the start of the region, as a 0-based index like in a slice
+        - end (default: None): the end (excluded) of the region, as a 0-based index like in a slice
+
+        Returns:
+        ------
+        the reverse complement of the region as a string
+        """
+        if self.__complement is not None and self.__complement[0] is self.sequence:
+            return self.__complement[1][start:end][::-1]
+        return _translate(self.sequence[start:end], self.complement_translation)[::-1]
+
+class DNA(NucleicAcid):
+    __slots__ = ()
+
+    complement_translation = _complement_translation('ACGT', 'TGCA')
+
+    def __init__(self, sequence, name = 'dna'):
+        NucleicAcid.__init__(self, name)
+        self.sequence = sequence
 
 
-class RNA(Molecule):
+class RNA(NucleicAcid):
+    __slots__ = ()
+
+    complement_translation = _complement_translation('ACGU', 'UGCA')
+
     def __init__(self, sequence, name = 'rna'):
-        Molecule.__init__(self, name)
+        NucleicAcid.__init__(self, name)
 
-        for residue in list(sequence):
-            self.add_residue(residue)
+        if isinstance(sequence, basestring):
+            self.add_residues(sequence)
+        else:
+            for residue in sequence:
+                self.add_residue(residue)
+
+    def add_residues(self, residues):
+        """
+        Add all the residues of a string, one character per residue. The modified residues and the gap symbols are normalized like with add_residue(), but in a single pass over the string.
+        """
+        modified_residues = _find_modified_residues(residues, _ribonucleotides_translation, len(self.sequence))
+        if modified_residues:
+            self.modified_residues += modified_residues
+        self.sequence = ''.join([self.sequence, _translate(residues, _ribonucleotides_translation)])
 
     def add_residue(self, residue):
         if modified_ribonucleotides.has_key(residue):
@@ -228,23 +452,26 @@ class RNA(Molecule):
             #print "Unknown residue "+residue
             self.sequence = ''.join([self.sequence, residue])
 
-    def get_complement(self):
-        """
-        Returns:
-        ------
-        the complement sequence as a string.
-        """
-        basecomplement = {'A': 'U', 'C': 'G', 'G': 'C', 'U': 'A'}
-        letters = list(self.sequence)
-        letters = [basecomplement[base] if basecomplement.has_key(base) else base for base in letters]
-        return ''.join(letters)
-
 class Protein(Molecule):
+    __slots__ = ()
+
     def __init__(self, sequence, name = 'protein'):
         Molecule.__init__(self, name)
 
-        for residue in list(sequence):
-            self.add_residue(residue)
+        if isinstance(sequence, basestring):
+            self.add_residues(sequence)
+        else:
+            for residue in sequence:
+                self.add_residue(residue)
+
+    def add_residues(self, residues):
+        """
+        Add all the residues of a string, one character per residue. The modified residues are normalized like with add_residue(), but in a single pass over the string.
+        """
+        modified_residues = _find_modified_residues(residues, _aminoacids_translation, len(self.sequence))
+        if modified_residues:
+            self.modified_residues += modified_residues
+        self.sequence = ''.join([self.sequence, _translate(residues, _aminoacids_translation)])
 
     def add_residue(self, residue):
         if modified_aminoacids.has_key(residue):
@@ -252,6 +479,99 @@ class Protein(Molecule):
             residue = modified_aminoacids[residue]
         self.sequence = ''.join([self.sequence, residue])
 
+class MoleculeBatch(object):
+    """
+    A compact container for many molecules of the same type (the sequences of an alignment, the windows of a genome,...). The names are stored in a single array and the sequences are concatenated in a single string with their offsets in a single array. The RNA, DNA or Protein objects are only created on demand.
+    """
+
+    def __init__(self, molecule_type = RNA, source = 'N.A.:N.A.:N.A.'):
+        self.molecule_type = molecule_type
+        self.source = source
+        self.names = np.empty(0, dtype = object)
+        self.sequences = "" #all the sequences concatenated
+        self.offsets = np.zeros(1, dtype = np.int64) #the sequence i is self.sequences[self.offsets[i]:self.offsets[i+1]]
+        self._pending_molecules = ([], []) #the names and sequences added since the last update of the arrays
+
+    @classmethod
+    def from_molecules(cls, molecules):
+        """
+        Parameters:
+        ---------
+        - molecules: a list of RNA, DNA or Protein objects (see pyrna.features), all of the same type
+
+        Returns:
+        ------
+        a MoleculeBatch object storing the names and sequences of these molecules
+        """
+        batch = cls(molecule_type = molecules[0].__class__ if molecules else RNA)
+        batch.extend([(molecule.name, molecule.sequence) for molecule in molecules])
+        return batch
+
+    def add_molecule(self, name, sequence):
+        names, sequences = self._pending_molecules
+        names.append(name)
+        sequences.append(sequence)
+
+    def extend(self, molecules):
+        """
+        Parameters:
+        ---------
+        - molecules: a list of (name, sequence) tuples
+        """
+        names, sequences = self._pending_molecules
+        for name, sequence in molecules:
+            names.append(name)
+            sequences.append(sequence)
+
+    def get_name(self, i):
+        self.__update_arrays()
+        return self.names[i]
+
+    def get_sequence(self, i):
+        self.__update_arrays()
+        return self.sequences[self.offsets[i]:self.offsets[i+1]]
+
+    def get_lengths(self):
+        self.__update_arrays()
+        return np.diff(self.offsets)
+
+    def __update_arrays(self):
+        names, sequences = self._pending_molecules
+        if not names:
+            return
+        self._pending_molecules = ([], [])
+        self.names = np.concatenate((self.names, np.array(names, dtype = object)))
+        self.offsets = np.concatenate((self.offsets, self.offsets[-1]+np.cumsum([len(sequence) for sequence in sequences])))
+        self.sequences = ''.join([self.sequences]+sequences)
+
+    def __len__(self):
+        return len(self.names)+len(self._pending_molecules[0])
+
+    def __getitem__(self, i):
+        """
+        Returns:
+        ------
+        the molecule i as a new RNA, DNA or Protein object
+        """
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("molecule index out of range")
+        molecule = self.molecule_type(sequence = self.get_sequence(i), name = self.get_name(i))
+        molecule.source = self.source
+        return molecule
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+def _is_pseudoknot(start, end, length, helix):
+    """
+    Test if a helix made with the ends given as arguments crosses the helix given as argument.
+    """
+    ends = [helix['location'][0][0], helix['location'][0][1], helix['location'][-1][0], helix['location'][-1][-1]]
+    return start >= ends[1] and start <= ends[2] and end >= ends[3] or start <= ends[0] and end >= ends[1] and end <= ends[2]
+
 class SecondaryStructure:
 
     def __init__(self, rna):
@@ -265,6 +585,127 @@ class SecondaryStructure:
         self.source = "N.A:N.A:N.A"
         self._id = str(ObjectId())
         self.__step = None
+        self.__topology = None #the maps used by compute_plot()
+        self._pair_table = None
+        self._tertiary_interactions_index = {} #the tertiary interactions indexed by their (pos1, pos2) location
+        self._modules_index = None
+
+    @classmethod
+    def from_base_pairs(cls, rna, base_pairs, helices = None):
+        """
+        Build a SecondaryStructure in bulk from a list of base-pairs.
+
+        The helices are sorted and added in a single sweep. A helix crossing a previous one (pseudoknot) is not added and its base-pairs become tertiary interactions. The base-pairs in the helices are stored as secondary interactions if they are non-canonical, the other ones as tertiary interactions.
+
+        Parameters:
+        ---------
+        - rna: an RNA object
+        - base_pairs: the base pairs listed in a pandas Dataframe (columns orientation, edge1, edge2, pos1 and pos2)
+        - helices (default: None): the helices as a list of (name, start, end, length) tuples. If None, the helices are made with the runs of at least two stacked base-pairs.
+
+        Returns:
+        ------
+        a SecondaryStructure object
+        """
+        ss = cls(rna)
+
+        if len(base_pairs):
+            order = np.argsort(base_pairs['pos1'].values, kind='mergesort') #the base pairs are sorted according to the first position
+            orientations = base_pairs['orientation'].values[order]
+            edges1 = base_pairs['edge1'].values[order]
+            edges2 = base_pairs['edge2'].values[order]
+            positions1 = base_pairs['pos1'].values[order].astype(np.int64)
+            positions2 = base_pairs['pos2'].values[order].astype(np.int64)
+        else:
+            orientations = edges1 = edges2 = np.zeros(0, dtype=object)
+            positions1 = positions2 = np.zeros(0, dtype=np.int64)
+
+        if helices is None:
+            #the helices are the runs of base-pairs stacked on the previous one
+            breaks = np.flatnonzero((np.diff(positions1) != 1) | (np.diff(positions2) != -1))+1
+            run_starts = np.concatenate(([0], breaks))
+            run_lengths = np.diff(np.append(run_starts, len(positions1)))
+            run_starts, run_lengths = run_starts[run_lengths >= 2], run_lengths[run_lengths >= 2]
+            helices = [("H"+str(i+1), start, end, length) for i, (start, end, length) in enumerate(zip(positions1[run_starts].tolist(), positions2[run_starts].tolist(), run_lengths.tolist()))]
+
+        #the helices still open at the start of the current one are the only ones it could cross
+        open_helices = []
+        for name, start, end, length in sorted(helices, key=lambda helix: helix[1]):
+            open_helices = [helix for helix in open_helices if helix['location'][-1][-1] >= start]
+            if any(_is_pseudoknot(start, end, length, helix) for helix in open_helices):
+                for i in range(0, length):
+                    ss.add_tertiary_interaction('C', '(', ')', start+i, end-i)
+                continue
+            helix = {
+                'name': name,
+                'location': [[start,start+length-1],[end-length+1,end]],
+                'length': length,
+                'interactions': []
+            }
+            ss.helices.append(helix)
+            open_helices.append(helix)
+
+        pair_table = ss.pair_table()
+        helix_indexes = np.full(len(pair_table), -1, dtype=np.int32) #the index of the helix for each position of a 5' strand
+        for index, helix in enumerate(ss.helices):
+            helix_indexes[helix['location'][0][0]:helix['location'][0][1]+1] = index
+
+        #the canonical base-pairs in the helices are already described by them, the other ones are stored as interactions
+        in_helices = (positions1 < positions2) & (positions2 < len(pair_table))
+        in_helices[in_helices] = pair_table[positions1[in_helices]] == positions2[in_helices]
+        canonicals = np.zeros(len(positions1), dtype=bool)
+        canonicals[in_helices] = _are_canonical(rna.sequence, positions1[in_helices], positions2[in_helices], orientations[in_helices], edges1[in_helices], edges2[in_helices])
+
+        secondary_interactions = {}
+        for index in np.flatnonzero(~canonicals).tolist():
+            orientation, edge1, edge2, pos1, pos2 = orientations[index], edges1[index], edges2[index], int(positions1[index]), int(positions2[index])
+            if in_helices[index]:
+                interaction = {
+                    'orientation': orientation,
+                    'edge1': edge1,
+                    'edge2': edge2,
+                    'location': [[pos1, pos1], [pos2, pos2]]
+                }
+                if (pos1, pos2) in secondary_interactions:
+                    secondary_interactions[(pos1, pos2)].update(interaction)
+                else:
+                    secondary_interactions[(pos1, pos2)] = interaction
+                    ss.helices[helix_indexes[pos1]]['interactions'].append(interaction)
+            else:
+                ss.add_tertiary_interaction(orientation, edge1, edge2, pos1, pos2)
+
+        #the single-strands are the runs of unpaired positions
+        unpaired = np.concatenate(([0], pair_table[1:] == 0, [0])).astype(np.int8)
+        bounds = np.diff(unpaired)
+        for count, (start, end) in enumerate(zip((np.flatnonzero(bounds == 1)+1).tolist(), np.flatnonzero(bounds == -1).tolist())):
+            ss.add_single_strand("SS"+str(count+1), start, end-start+1)
+
+        return ss
+
+    @classmethod
+    def from_pair_table(cls, rna, pair_table):
+        """
+        Build a SecondaryStructure in bulk from a pair table.
+
+        Parameters:
+        ---------
+        - rna: an RNA object
+        - pair_table: a pair table like the one returned by the method pair_table(): the cell 0 stores the length of the molecule and the cell i stores the position paired with the residue i (0 if unpaired).
+
+        Returns:
+        ------
+        a SecondaryStructure object (see from_base_pairs())
+        """
+        pair_table = np.asarray(pair_table)
+        positions1 = np.flatnonzero(pair_table[1:] > np.arange(1, len(pair_table)))+1
+        base_pairs = DataFrame({
+            'orientation': ['c']*len(positions1),
+            'edge1': ['(']*len(positions1),
+            'edge2': [')']*len(positions1),
+            'pos1': positions1,
+            'pos2': pair_table[positions1]
+        }, columns=['orientation', 'edge1', 'edge2', 'pos1', 'pos2'])
+        return cls.from_base_pairs(rna, base_pairs)
 
     def _repr_html_(self):
         if self.__step:
@@ -273,55 +714,37 @@ class SecondaryStructure:
             return "No plot available"
 
     def __walk(self, helix, x_coords, current_y, verbose = False):
-        from numpy import mean
-        enclosed_stem_loops = []
+        enclosed_stem_loops = [] #the indexes of the stem-loops
         if verbose:
             print "walking helix", helix['location']
-        #do we have a >= 3-way junction linked to this helix?
+        child_y = current_y-(helix['location'][0][-1]-helix['location'][0][0])*self.__residue_occupancy-1.5*self.__junction_diameter
+        #do we have a junction linked to this helix?
         next_junction = None
-        for junction in self.junctions:
-            junction_location = sorted(junction['location'])
-            if len(junction_location) >= 3 and helix['location'][0][-1] == junction_location[0][0] :
-                next_junction = junction
+        for junction, junction_location in self.__topology['junctions'].get(helix['location'][0][-1], []):
+            next_junction = junction
+            if len(junction_location) >= 3:
                 if verbose:
                     print "linked to >=3 junction",junction_location
-                #the occupancy will be the number of residues on the largest side
-                junction_occupancy = mean([junction_location[-1][-1]-junction_location[-1][0]+1, junction_location[0][-1]-junction_location[0][0]+1])-1
                 for i in range(len(junction_location)-1):
-                    for h in self.helices: #next helices in junction
-                        if h['location'][0][0] == junction_location[i][-1]:
-                            if verbose:
-                                print "next helix in junction is helix", h['location']
-                            self.__walk(h, x_coords, current_y-(helix['location'][0][-1]-helix['location'][0][0])*self.__residue_occupancy-1.5*self.__junction_diameter, verbose)
-                    for stem_loop in self.stem_loops: #this helix will lead to which stem loops?
-                        if stem_loop['location'][0][0] >= junction_location[i][-1] and stem_loop['location'][-1][-1] <= junction_location[i+1][0]:
-                            enclosed_stem_loops.append(stem_loop)
-            elif len(junction_location) == 2 and helix['location'][0][-1] == junction_location[0][0]:
-                next_junction = junction
-                if verbose:
-                    print "linked to 2-way junction", junction_location
-                #the occupancy will be the number of residues on the largest side
-                junction_occupancy = mean([junction_location[-1][-1]-junction_location[-1][0]+1, junction_location[0][-1]-junction_location[0][0]+1])-1
-                for h in self.helices:
-                    if h['location'][0][0] == junction_location[0][-1]:
+                    for h in self.__topology['helices'].get(junction_location[i][-1], []): #next helices in junction
                         if verbose:
                             print "next helix in junction is helix", h['location']
-                        self.__walk(h, x_coords, current_y-(helix['location'][0][-1]-helix['location'][0][0])*self.__residue_occupancy-1.5*self.__junction_diameter, verbose)
-                for stem_loop in self.stem_loops: #this helix will lead to which stem loops?
-                    if stem_loop['location'][0][0] >= junction_location[0][0] and stem_loop['location'][-1][-1] <= junction_location[-1][-1]:
-                        enclosed_stem_loops.append(stem_loop)
-            elif len(junction_location) == 1 and helix['location'][0][-1] == junction_location[0][0]:
-                next_junction = junction
+                        self.__walk(h, x_coords, child_y, verbose)
+                    enclosed_stem_loops += self.__enclosed_stem_loops(junction_location[i][-1], junction_location[i+1][0]) #this helix will lead to which stem loops?
+            elif len(junction_location) == 2:
                 if verbose:
-                    print "linked to apical loop", junction_location
+                    print "linked to 2-way junction", junction_location
+                for h in self.__topology['helices'].get(junction_location[0][-1], []):
+                    if verbose:
+                        print "next helix in junction is helix", h['location']
+                    self.__walk(h, x_coords, child_y, verbose)
+                enclosed_stem_loops += self.__enclosed_stem_loops(junction_location[0][0], junction_location[-1][-1]) #this helix will lead to which stem loops?
+            elif verbose:
+                print "linked to apical loop", junction_location
         if not len(enclosed_stem_loops): #there was no junction linked to this helix, so it should be in a stem-loop
-            for stem_loop in self.stem_loops:
-                if helix['location'][0][0] >= stem_loop['location'][0][0] and helix['location'][-1][-1] <= stem_loop['location'][-1][-1]:
-                    enclosed_stem_loops.append(stem_loop)
-        _x_coords = []
-        for enclosed_stem_loop in enclosed_stem_loops:
-            _x_coords.append(x_coords[self.stem_loops.index(enclosed_stem_loop)])
-        m = mean(_x_coords)
+            enclosed_stem_loops = sorted([i for i in self.__topology['stem_loops'].find(helix['location'][0][0]) if helix['location'][-1][-1] <= self.stem_loops[i]['location'][-1][-1]])
+        _x_coords = [x_coords[i] for i in enclosed_stem_loops]
+        m = sum(_x_coords)/float(len(_x_coords)) if _x_coords else float('nan')
         helix['coords'] = [[m, current_y], [m, current_y-(helix['location'][0][-1]-helix['location'][0][0])*self.__residue_occupancy]]
         if verbose:
             print "helix", helix['location']
@@ -331,6 +754,58 @@ class SecondaryStructure:
             print "junction", next_junction['location']
             print "coords", next_junction['coords']
 
+    def __enclosed_stem_loops(self, start, end):
+        """
+        Returns the indexes (sorted) of the stem-loops enclosed between the start and end positions (included).
+        """
+        stem_loop_starts, stem_loop_indexes = self.__topology['stem_loop_starts']
+        indexes = []
+        for i in xrange(bisect_left(stem_loop_starts, start), len(stem_loop_starts)):
+            if stem_loop_starts[i] > end:
+                break
+            if self.stem_loops[stem_loop_indexes[i]]['location'][-1][-1] <= end:
+                indexes.append(stem_loop_indexes[i])
+        return sorted(indexes)
+
+    def __compute_topology(self):
+        """
+        Precomputes the maps used to lay out the structure, so that each helix, junction and stem-loop is visited once:
+        - the helices by start position
+        - the junctions (with their sorted location) by the position of their first end, which is the end of the helix leading to them
+        - the stem-loops as an interval tree and sorted by start position
+        """
+        helices = {}
+        for helix in self.helices:
+            helices.setdefault(helix['location'][0][0], []).append(helix)
+        junctions = {}
+        for junction in self.junctions:
+            junction_location = sorted(junction['location'])
+            junctions.setdefault(junction_location[0][0], []).append((junction, junction_location))
+        stem_loops = sorted([(stem_loop['location'][0][0], i) for i, stem_loop in enumerate(self.stem_loops)])
+        self.__topology = {
+            'helices': helices,
+            'junctions': junctions,
+            'stem_loops': IntervalTree([(stem_loop['location'][0][0], stem_loop['location'][-1][-1], i) for i, stem_loop in enumerate(self.stem_loops)]),
+            'stem_loop_starts': ([start for start, i in stem_loops], [i for start, i in stem_loops])
+        }
+
+    def __top_level_helices(self):
+        """
+        Returns the helices at the basis of the drawing: the first helix, then the first helix starting after its end, and so on.
+        """
+        helices_by_start = {}
+        for helix in reversed(self.helices):
+            helices_by_start[helix['location'][0][0]] = helix
+        helix_starts = sorted(helices_by_start.keys())
+        helix = self.helices[0]
+        top_level_helices = [helix]
+        i = bisect_right(helix_starts, helix['location'][-1][-1])
+        while i < len(helix_starts) and helix_starts[i] <= len(self.rna)+1:
+            helix = helices_by_start[helix_starts[i]]
+            top_level_helices.append(helix)
+            i = bisect_right(helix_starts, helix['location'][-1][-1])
+        return top_level_helices
+
     def compute_plot(self, step = 25, residue_occupancy = 5, junction_diameter = 15, verbose = False):
         if not self.stem_loops:
             self.find_stem_loops()
@@ -345,9 +820,13 @@ class SecondaryStructure:
         self.__junction_diameter = junction_diameter
         if not len(self.helices):
             raise Exception("Your secondary structure contains no helices!!")
+        self.__compute_topology()
         x = 0
         if verbose:
             print "\nStem-loops placement\n"
+        #we only use the single-strands of the >=3 junctions that are not on the left and right "sides"
+        single_strand_locations = sorted([(single_strand_location[0], single_strand_location[1]) for junction in self.junctions if len(junction['location']) >= 3 for single_strand_location in sorted(junction['location'])[1:-1]])
+        single_strand_starts = [single_strand_location[0] for single_strand_location in single_strand_locations]
         x_coords = []
         if verbose:
             print "stem loop", self.stem_loops[0]['location']
@@ -358,12 +837,13 @@ class SecondaryStructure:
             after = self.stem_loops[i+1]['location'][0][0]
             total_residues = 0
             total_junctions = 0
-            for junction in self.junctions:
-                if len(junction['location']) >=3:
-                    for single_strand_location in sorted(junction['location'])[1:-1]: #we only use the single-strands that are not on the left and right "sides"
-                        if before <= single_strand_location[0] and after >= single_strand_location[1]:
-                            total_residues += single_strand_location[1]-single_strand_location[0]+1
-                            total_junctions += 1
+            for j in xrange(bisect_left(single_strand_starts, before), len(single_strand_starts)):
+                single_strand_start, single_strand_end = single_strand_locations[j]
+                if single_strand_start > after:
+                    break
+                if after >= single_strand_end:
+                    total_residues += single_strand_end-single_strand_start+1
+                    total_junctions += 1
             if verbose:
                 print "total residues", total_residues
                 print "total junctions", total_junctions
@@ -381,354 +861,322 @@ class SecondaryStructure:
 
         if verbose:
             print "\nHelices placement\n"
-        helix = self.helices[0]
-        currentPos = helix['location'][-1][-1]
-        current_y = 200
-        self.__walk(helix, x_coords, current_y, verbose)
-        while currentPos <= len(self.rna):
-            currentPos +=1
+        for helix in self.__top_level_helices():
             if verbose:
-                print "currentPos", currentPos
-            for helix in self.helices:
-                if currentPos == helix['location'][0][0]:
-                    current_y = 200
-                    self.__walk(helix, x_coords, current_y, verbose)
-                    currentPos = helix['location'][-1][-1]
-                    break
+                print "currentPos", helix['location'][0][0]
+            current_y = 200
+            self.__walk(helix, x_coords, current_y, verbose)
 
-        single_strands_not_in_junctions = self.single_strands[:]
-        for junction in self.junctions:
-            for single_strand in junction['single_strands']:
-                single_strands_not_in_junctions.remove(single_strand)
+        helices_by_start = dict([(start, helices[0]) for start, helices in self.__topology['helices'].items()])
+        helices_by_end = {}
+        for helix in reversed(self.helices):
+            helices_by_end[helix['location'][-1][-1]] = helix
 
-        single_strands_not_in_junctions = sorted(single_strands_not_in_junctions)
+        single_strands_in_junctions = set([id(single_strand) for junction in self.junctions for single_strand in junction['single_strands']])
+        single_strands_not_in_junctions = [single_strand for single_strand in self.single_strands if not id(single_strand) in single_strands_in_junctions]
 
         for single_strand in single_strands_not_in_junctions:
             if verbose:
                 print "single strand not in a junction", single_strand['location']
             if single_strand['location'][0] == 1:
-                for helix in self.helices:
-                    if helix['location'][0][0] == single_strand['location'][-1]+1:
-                        l = helix['location'][0][0]*self.__residue_occupancy
-                        if l > 2*self.__junction_diameter:
-                            l = 2*self.__junction_diameter
-                        single_strand['coords'] = [[helix['coords'][0][0]-l, helix['coords'][0][1]], [helix['coords'][0][0], helix['coords'][0][1]]]
-                        break
+                helix = helices_by_start.get(single_strand['location'][-1]+1)
+                if helix:
+                    l = helix['location'][0][0]*self.__residue_occupancy
+                    if l > 2*self.__junction_diameter:
+                        l = 2*self.__junction_diameter
+                    single_strand['coords'] = [[helix['coords'][0][0]-l, helix['coords'][0][1]], [helix['coords'][0][0], helix['coords'][0][1]]]
             elif single_strand['location'][-1] == len(self.rna):
-                for helix in self.helices:
-                    if helix['location'][-1][-1] == single_strand['location'][0]-1:
-                        l =  (len(self.rna)-helix['location'][-1][-1]+1)*self.__residue_occupancy
-                        if l > 2*self.__junction_diameter:
-                            l = 2*self.__junction_diameter
-                        single_strand['coords'] = [[helix['coords'][0][0], helix['coords'][0][1]], [helix['coords'][0][0]+l, helix['coords'][0][1]]]
-                        break
+                helix = helices_by_end.get(single_strand['location'][0]-1)
+                if helix:
+                    l =  (len(self.rna)-helix['location'][-1][-1]+1)*self.__residue_occupancy
+                    if l > 2*self.__junction_diameter:
+                        l = 2*self.__junction_diameter
+                    single_strand['coords'] = [[helix['coords'][0][0], helix['coords'][0][1]], [helix['coords'][0][0]+l, helix['coords'][0][1]]]
             else:
-                first_helix = None
-                second_helix = None
-                for helix in self.helices:
-                    if helix['location'][-1][-1] == single_strand['location'][0]-1:
-                        first_helix =  helix
-                    if helix['location'][0][0] == single_strand['location'][-1]+1:
-                        second_helix = helix
-                    if first_helix and second_helix:
-                        single_strand['coords'] = [[first_helix['coords'][0][0], first_helix['coords'][0][1]], [second_helix['coords'][0][0], second_helix['coords'][0][1]]]
-                        break
+                first_helix = helices_by_end.get(single_strand['location'][0]-1)
+                second_helix = helices_by_start.get(single_strand['location'][-1]+1)
+                if first_helix and second_helix:
+                    single_strand['coords'] = [[first_helix['coords'][0][0], first_helix['coords'][0][1]], [second_helix['coords'][0][0], second_helix['coords'][0][1]]]
 
     def draw_as_d3(self, stroke_width = 2, verbose = False):
-        from pyrna import utils
-        from numpy import mean
-        all_x =[]
-        all_y = []
-        quantitative_values = []
-
-        single_strands_not_in_junctions = []
-
-        for single_strand in self.single_strands: #only the single-strands with a coords key are not in junctions
-            if single_strand.has_key('coords'):
-                single_strands_not_in_junctions.append(single_strand)
+        """
+        Returns:
+        ------
+        the plot computed with compute_plot() as an HTML div with a D3 script
+        """
+        return self.draw(format = 'd3', stroke_width = stroke_width, verbose = verbose)
 
-        for single_strand in single_strands_not_in_junctions:
-            if single_strand.has_key('quantitative_value'):
-                quantitative_values.append(single_strand['quantitative_value'])
-            all_x.append(single_strand['coords'][0][0])
-            all_y.append(single_strand['coords'][0][1])
-            all_x.append(single_strand['coords'][1][0])
-            all_y.append(single_strand['coords'][1][1])
-        for helix in self.helices:
-            if helix.has_key('quantitative_value'):
-                quantitative_values.append(helix['quantitative_value'])
-            all_x.append(helix['coords'][0][0])
-            all_y.append(helix['coords'][0][1])
-            all_x.append(helix['coords'][1][0])
-            all_y.append(helix['coords'][1][1])
-        for junction in self.junctions:
-            if junction.has_key('quantitative_value'):
-                quantitative_values.append(junction['quantitative_value'])
-            all_x.append(junction['coords'][0][0])
-            all_y.append(junction['coords'][0][1])
+    def draw_as_svg(self, stroke_width = 2, verbose = False):
+        """
+        Returns:
+        ------
+        the plot computed with compute_plot() as a static SVG document
+        """
+        return self.draw(format = 'svg', stroke_width = stroke_width, verbose = verbose)
 
-        min_x = min(all_x)
-        min_y = min(all_y)
+    def draw(self, output = None, format = 'd3', stroke_width = 2, verbose = False):
+        """
+        Draw the plot computed with compute_plot(). The drawing is written piece by piece, without building intermediate strings.
 
-        for single_strand in single_strands_not_in_junctions:
-            single_strand['coords'] = [[coord[0]-min_x+self.__junction_diameter, coord[1]-min_y+self.__junction_diameter] for coord in single_strand['coords']]
-        for helix in self.helices:
-            helix['coords'] = [[coord[0]-min_x+self.__junction_diameter, coord[1]-min_y+self.__junction_diameter] for coord in helix['coords']]
-        for junction in self.junctions:
-            junction['coords'] = [[coord[0]-min_x+self.__junction_diameter, coord[1]-min_y+self.__junction_diameter] for coord in junction['coords']]
+        Parameters:
+        ---------
+        - output (default: None): a file-like object to write the drawing into. If None, the drawing is returned as a String
+        - format (default: 'd3'): 'd3' (an HTML div with a D3 script) or 'svg' (a static SVG document)
+        - stroke_width (default: 2): the width of the lines
 
-        all_x = [x-min_x+self.__junction_diameter for x in all_x]
-        all_y = [y-min_y+self.__junction_diameter for y in all_y]
+        Returns:
+        ------
+        the drawing as a String if no output was given
+        """
+        if not format in ['d3', 'svg']:
+            raise Exception("Unknown format %s"%format)
+        if output is None:
+            from cStringIO import StringIO
+            buffer = StringIO()
+            self.draw(buffer, format = format, stroke_width = stroke_width, verbose = verbose)
+            return buffer.getvalue()
+
+        lines, line_values, circles, circle_values, width, height = self.__plot_elements(verbose)
+        diagonals = sum([circle[2] for circle in circles])
+        values = [value for value in line_values[diagonals:]+circle_values if value is not None and value is not False] #the diagonals repeat the values of their helices
+        colors = None
+        if values:
+            colors = [min(values), sum(values)/float(len(values)), max(values)]
+
+        def color(value):
+            if value is None or value is False or colors is None:
+                default = "grey" if value is False else "steelblue"
+                return '"%s"'%default if format == 'd3' else default
+            elif format == 'd3':
+                return "colors(%s)"%value
+            else:
+                return _scale_color(value, colors, _plot_colors)
+
+        write = output.write
+        if format == 'd3':
+            write('\n<div id="viz"></div>\n<script type="text/javascript">\n')
+            write('var svg = d3.select("#viz").append("svg").attr("width", %s).attr("height", %s);\n'%(width, height))
+            if colors:
+                write('var colors = d3.scale.linear().domain([%s,%s,%s]).range(["%s", "%s", "%s"]);\n'%tuple(colors+_plot_colors))
+            circle_template = 'svg.append("circle").style("fill", %s).attr("cx", %s).attr("cy", %s).attr("r", %s);\n'
+            ring_template = 'svg.append("circle").style("fill", "none").style("stroke", %s).style("stroke-width", %s).attr("cx", %s).attr("cy", %s).attr("r", %s);\n'
+            line_template = 'svg.append("line").style("stroke-linecap", "round").style("stroke", %s).style("stroke-width", %s).attr("x1", %s).attr("y1", %s).attr("x2", %s).attr("y2", %s);\n'
+        else:
+            write('<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s">\n'%(width, height))
+            circle_template = '<circle fill="%s" cx="%s" cy="%s" r="%s"/>\n'
+            ring_template = '<circle fill="none" stroke="%s" stroke-width="%s" cx="%s" cy="%s" r="%s"/>\n'
+            line_template = '<line stroke-linecap="round" stroke="%s" stroke-width="%s" x1="%s" y1="%s" x2="%s" y2="%s"/>\n'
+
+        #the junctions (with the diagonals to their helices) are drawn first, then the helices, the single-strands and the links between the helices at the basis of the drawing
+        radius = self.__junction_diameter/2
+        ring_radius = (1.5*self.__junction_diameter)/2
+        line_index = 0
+        for (cx, cy, diagonals), value in zip(circles, circle_values):
+            for i in xrange(line_index, line_index+diagonals):
+                write(line_template%((color(line_values[i]), stroke_width)+tuple(lines[i])))
+            line_index += diagonals
+            write(circle_template%(color(value), cx, cy, radius))
+            write(ring_template%(color(value), stroke_width, cx, cy, ring_radius))
+        for i in xrange(line_index, len(lines)):
+            write(line_template%((color(line_values[i]), stroke_width)+tuple(lines[i])))
+
+        if format == 'd3':
+            write('</script>')
+        else:
+            write('</svg>\n')
 
-        colors_d3 = """"""
-        if quantitative_values:
-            colors_d3 = """var colors = d3.scale.linear().domain(["""+str(min(quantitative_values))+""","""+str(mean(quantitative_values))+""","""+str(max(quantitative_values))+"""]).range(["#4daf4a",  "#377eb8", "#e41a1c"]);"""
+    def __plot_elements(self, verbose = False):
+        """
+        Returns the elements of the plot computed with compute_plot(), in drawing order and with their coordinates shifted to keep the drawing in the positive quadrant:
+        - the lines as a list of [x1, y1, x2, y2]: the diagonals from the helices to their >=3 junction (grouped by junction), then the helices, the single-strands not in junctions and the links between the helices directly linked at the basis of the drawing
+        - the quantitative value of each line (None if no value, False for the links between helices)
+        - the junctions as a list of [cx, cy, number of diagonals]
+        - the quantitative value of each junction
+        - the width and height of the drawing
+        """
+        from pyrna import utils
+        single_strands_not_in_junctions = [single_strand for single_strand in self.single_strands if single_strand.has_key('coords')] #only the single-strands with a coords key are not in junctions
+
+        #the coordinates of all the elements in a single array, to shift them at once
+        coords = np.array([coord for single_strand in single_strands_not_in_junctions for coord in single_strand['coords']] + \
+                [coord for helix in self.helices for coord in helix['coords'][:2]] + \
+                [junction['coords'][0] for junction in self.junctions], dtype = float)
+        coords -= coords.min(axis = 0) - self.__junction_diameter
+        width, height = (coords.max(axis = 0) + self.__junction_diameter).tolist()
+        coords = coords.tolist()
+        single_strands_coords = coords[:2*len(single_strands_not_in_junctions)]
+        helices_coords = coords[2*len(single_strands_not_in_junctions):2*len(single_strands_not_in_junctions)+2*len(self.helices)]
+        junctions_coords = coords[2*len(single_strands_not_in_junctions)+2*len(self.helices):]
+
+        helices_by_start = {}
+        for i, helix in reversed(list(enumerate(self.helices))):
+            helices_by_start[helix['location'][0][0]] = i
 
-        helices_d3 = """"""
-        helix_color = '"steelblue"'
-        if helix.has_key('quantitative_value'):
-            helix_color = "colors("+str(helix['quantitative_value'])+")"
-        for helix in self.helices:
-            helices_d3 += """svg.append("line")
-                            .style("stroke", """+helix_color+""")
-                            .style("stroke-width", """+str(stroke_width)+""")
-                            .attr("x1", """+str(helix['coords'][0][0])+""")
-                            .attr("y1", """+str(helix['coords'][0][1])+""")
-                            .attr("x2", """+str(helix['coords'][1][0])+""")
-                            .attr("y2", """+str(helix['coords'][1][1])+""");
-                    """
-
-        junctions_d3 = """"""
-        for junction in self.junctions:
+        lines = []
+        line_values = []
+        circles = []
+        circle_values = []
+        for junction, (cx, cy) in zip(self.junctions, junctions_coords):
+            diagonals = 0
             if len(junction['location']) >= 3:
                 junction_location = sorted(junction['location'])
                 for i in range(len(junction_location)-1):
-                    for h in self.helices: #next helices in junction
-                        if h['location'][0][0] == junction_location[i][-1]:
-                            if h['coords'][0][1] != junction['coords'][0][1]: #to avoid to redraw a vertical line
-                                new_points = utils.get_points(h['coords'][0][0], h['coords'][0][1], junction['coords'][0][0], junction['coords'][0][1], distance = (self.__junction_diameter+10)/2)
-                                if len(new_points) == 2:
-                                    helix_color = '"steelblue"'
-                                    if h.has_key('quantitative_value'):
-                                        helix_color = "colors("+str(h['quantitative_value'])+")"
-                                    junctions_d3 += """svg.append("line")
-                                        .style("stroke-linecap", "round")
-                                        .style("stroke", """+helix_color+""")
-                                        .style("stroke-width", """+str(stroke_width)+""")
-                                        .attr("x1", """+str(h['coords'][0][0])+""")
-                                        .attr("y1", """+str(h['coords'][0][1])+""")
-                                        .attr("x2", """+str(new_points[1][0])+""")
-                                        .attr("y2", """+str(new_points[1][1])+""");
-                                    """
-
-            junction_color = '"steelblue"'
-            if junction.has_key('quantitative_value'):
-                junction_color = "colors("+str(junction['quantitative_value'])+")"
-
-            junctions_d3 += """svg.append("circle")
-                            .style("fill", """+junction_color+""")
-                            .attr("cx", """+str(junction['coords'][0][0])+""")
-                            .attr("cy", """+str(junction['coords'][0][1])+""")
-                            .attr("r", """+str(self.__junction_diameter/2)+""");
-                    """
-
-            junction_color = '"steelblue"'
-            if junction.has_key('quantitative_value'):
-                junction_color = "colors("+str(junction['quantitative_value'])+")"
-
-            junctions_d3 += """svg.append("circle")
-                    .style("fill", "none")
-                    .style("stroke", """+junction_color+""")
-                    .style("stroke-width", """+str(stroke_width)+""")
-                    .attr("cx", """+str(junction['coords'][0][0])+""")
-                    .attr("cy", """+str(junction['coords'][0][1])+""")
-                    .attr("r", """+str((1.5*self.__junction_diameter)/2)+""");
-            """
-
-        single_strands_d3 = """"""
-        for single_strand in single_strands_not_in_junctions:
-
-            single_strand_color = '"steelblue"'
-            if single_strand.has_key('quantitative_value'):
-                single_strand_color = "colors("+str(single_strand['quantitative_value'])+")"
-
-            single_strands_d3 += """svg.append("line")
-                                    .style("stroke-linecap", "round")
-                                    .style("stroke", """+single_strand_color+""")
-                                    .style("stroke-width", """+str(stroke_width)+""")
-                                    .attr("x1", """+str(single_strand['coords'][0][0])+""")
-                                    .attr("y1", """+str(single_strand['coords'][0][1])+""")
-                                    .attr("x2", """+str(single_strand['coords'][1][0])+""")
-                                    .attr("y2", """+str(single_strand['coords'][1][1])+""");
-                                """
+                    h = helices_by_start.get(junction_location[i][-1]) #next helix in junction
+                    if h is not None:
+                        x, y = helices_coords[2*h]
+                        if y != cy: #to avoid to redraw a vertical line
+                            new_points = utils.get_points(x, y, cx, cy, distance = (self.__junction_diameter+10)/2)
+                            if len(new_points) == 2:
+                                lines.append([x, y, new_points[1][0], new_points[1][1]])
+                                line_values.append(self.helices[h].get('quantitative_value'))
+                                diagonals += 1
+            circles.append([cx, cy, diagonals])
+            circle_values.append(junction.get('quantitative_value'))
+
+        for i, helix in enumerate(self.helices):
+            lines.append(helices_coords[2*i]+helices_coords[2*i+1])
+            line_values.append(helix.get('quantitative_value'))
+
+        for i, single_strand in enumerate(single_strands_not_in_junctions):
+            lines.append(single_strands_coords[2*i]+single_strands_coords[2*i+1])
+            line_values.append(single_strand.get('quantitative_value'))
 
         #we end with the helices directly linked at the basis of the drawing
-        directly_linked_helices_d3 = """"""
-        previous_helix = self.helices[0]
-        currentPos = previous_helix['location'][-1][-1]
-        while currentPos <= len(self.rna):
-            currentPos +=1
-            if verbose:
-                print "currentPos", currentPos
-            for helix in self.helices:
-                if currentPos == helix['location'][0][0]:
-                    if previous_helix['location'][-1][-1] +1 == helix['location'][0][0]:
-                        if verbose:
-                            print "directly linked helices", previous_helix['location'] , helix['location']
-                        directly_linked_helices_d3 += """svg.append("line")
-                                        .style("stroke-linecap", "round")
-                                        .style("stroke", "grey")
-                                        .style("stroke-width", """+str(stroke_width)+""")
-                                        .attr("x1", """+str(previous_helix['coords'][0][0])+""")
-                                        .attr("y1", """+str(previous_helix['coords'][0][1])+""")
-                                        .attr("x2", """+str(helix['coords'][0][0])+""")
-                                        .attr("y2", """+str(helix['coords'][0][1])+""");
-                                    """
-                    currentPos = helix['location'][-1][-1]
-                    previous_helix = helix
-                    break
+        helix_indexes = dict([(id(helix), i) for i, helix in enumerate(self.helices)])
+        top_level_helices = self.__top_level_helices()
+        for previous_helix, helix in zip(top_level_helices, top_level_helices[1:]):
+            if previous_helix['location'][-1][-1] +1 == helix['location'][0][0]:
+                if verbose:
+                    print "directly linked helices", previous_helix['location'] , helix['location']
+                lines.append(helices_coords[2*helix_indexes[id(previous_helix)]]+helices_coords[2*helix_indexes[id(helix)]])
+                line_values.append(False)
+
+        return lines, line_values, circles, circle_values, width, height
 
-        d3_description = """
+    def get_junctions(self):
+        return DataFrame(self.junctions)
 
-            <div id="viz"></div>
-            <script type="text/javascript">
+    def pair_table(self):
+        """
+        Returns:
+        ------
+        the pairings made by the helices as a numpy int32 array of size len(rna)+1. Like in the Vienna package, the cell 0 stores the length of the molecule and the cell i stores the position paired with the residue i (0 if unpaired). The tertiary interactions are not stored.
 
-            var svg = d3.select("#viz")
-                .append("svg")
-                .attr("width", """+str(max(all_x)+self.__junction_diameter)+""")
-                .attr("height", """+str(max(all_y)+self.__junction_diameter)+""");
-                """+colors_d3+"""
-                """+junctions_d3+"""
-                """+helices_d3+"""
-                """+single_strands_d3+"""
-                """+directly_linked_helices_d3+"""
-                </script>"""
+        The table is computed once and then updated by add_helix().
+        """
+        if self._pair_table is None or len(self._pair_table) != len(self.rna)+1:
+            self._pair_table = np.zeros(len(self.rna)+1, dtype=np.int32)
+            self._pair_table[0] = len(self.rna)
+            for helix in self.helices:
+                self.__store_helix_in_pair_table(helix)
+        return self._pair_table
 
-        return d3_description
+    def __store_helix_in_pair_table(self, helix):
+        start = helix['location'][0][0]
+        end = helix['location'][-1][-1]
+        length = helix['length']
+        self._pair_table[start:start+length] = np.arange(end, end-length, -1)
+        self._pair_table[end-length+1:end+1] = np.arange(start+length-1, start-1, -1)
 
-    def get_junctions(self):
-        return DataFrame(self.junctions)
+    def partner(self, pos):
+        """
+        Returns:
+        ------
+        the position paired with the residue at pos in a helix, or -1 if this residue is not paired.
+        """
+        pair_table = self.pair_table()
+        if pos < 1 or pos >= len(pair_table) or not pair_table[pos]:
+            return -1
+        return int(pair_table[pos])
 
     def get_paired_residue(self, pos):
-        for helix in self.helices:
-            if pos >= helix['location'][0][0] and pos <= helix['location'][0][0] + helix['length']-1:
-                return helix['location'][-1][-1] - (pos-helix['location'][0][0])
-            elif pos <= helix['location'][-1][-1] and pos >= helix['location'][-1][-1] - helix['length']+1:
-                return helix['location'][0][0]+ helix['location'][-1][-1] - pos
-        return -1
+        return self.partner(pos)
 
     def find_single_strands(self):
+        self.single_strands = []
         full_location = Location(start = 1, end = len(self.rna))
-        for helix in self.helices:
-            full_location =  full_location.remove_location(Location(start = helix['location'][0][0], end = helix['location'][0][-1]))
-            full_location =  full_location.remove_location(Location(start = helix['location'][-1][0], end = helix['location'][-1][-1]))
-        single_positions = full_location.get_single_positions()
-        single_positions.sort()
-
-        start = None
-        length = 0
-        single_strand_count = 1
-        for index, current_pos in enumerate(single_positions):
-            if index == 0 or current_pos == single_positions[index-1]+1:
-                length += 1
-                if index == 0:
-                    start = current_pos
-            else:
-                self.add_single_strand("SS_%i"%single_strand_count, start, length)
-                single_strand_count +=1
-                length = 1
-                start = current_pos
-        #the last
-        self.add_single_strand("SS_%i"%single_strand_count, start, length)
+        helices_location = Location(nested_lists = [strand for helix in self.helices for strand in helix['location']])
+        single_strands_location = full_location.remove_location(helices_location)
 
-    def find_junctions(self):
-        self.junctions = []
-        for single_strand in self.single_strands:
-            if single_strand['location'][0] == 1 or single_strand['location'][-1] == len(self.rna) or len(filter(lambda junction: single_strand in junction['single_strands'], self.junctions)):
-                continue
-            strands = [single_strand]
-            descr = self.rna[single_strand['location'][0]-1:single_strand['location'][-1]]+" "
-            current_pos =  self.get_paired_residue(single_strand['location'][-1]+1)+1
-            location = [[single_strand['location'][0]-1, single_strand['location'][-1]+1]]
-            next_single_strand = None
-
-            while current_pos >= 1 and current_pos <= len(self.rna):
-                next_single_strand = filter(lambda single_strand : single_strand['location'][0] == current_pos, self.single_strands)
-                if next_single_strand and next_single_strand[0] == single_strand:
-                    break
-                elif next_single_strand:
-                    strands.append(next_single_strand[0])
-                    location.append([next_single_strand[0]['location'][0]-1, next_single_strand[0]['location'][-1]+1])
-                    descr += self.rna[next_single_strand[0]['location'][0]-1:next_single_strand[0]['location'][-1]]+" "
-                    current_pos = self.get_paired_residue(next_single_strand[0]['location'][-1]+1)+1
-                    continue
-                next_helix = filter(lambda helix: current_pos == helix['location'][0][0] or current_pos == helix['location'][-1][-1]-helix['length']+1, self.helices)
-                if next_helix:
-                    descr += '- '
-                    location.append([current_pos-1, current_pos])
-                    current_pos = self.get_paired_residue(current_pos)+1
-
-            if next_single_strand and next_single_strand[0] == single_strand:
-                self.junctions.append({
-                    'single_strands': strands,
-                    'description': descr.strip(),
-                    'location': location
-                })
-
-        #now we search for junctions with only directly linked helices
+        for single_strand_count, block in enumerate(single_strands_location.blocks):
+            self.add_single_strand("SS_%i"%(single_strand_count+1), block.start, block.end-block.start+1)
+
+    def __find_loops(self):
+        """
+        Walk once the loops closed by the helices (the exterior loop is not a junction and is ignored).
+
+        Returns:
+        ------
+        a list of dicts, one per loop, with:
+        - 'helix': the helix closing the loop
+        - 'location': the ranges between two consecutive helix strands of the loop, from its 5' to its 3' end. Each range starts and ends with the paired positions around the single-strand (or around nothing if the helix strands are directly linked)
+        - 'single_strands': the single-strand found in each range (None if the helix strands are directly linked)
+        - 'children': the helices branching from the loop, from its 5' to its 3' end
+        """
+        pair_table = self.pair_table()
+        single_strands_by_start = dict((single_strand['location'][0], single_strand) for single_strand in self.single_strands)
+        helices_by_start = dict((helix['location'][0][0], helix) for helix in self.helices)
+        loops = []
         for helix in self.helices:
-            if helix['location'][0][0] == 1 or helix['location'][-1][-1] == len(self.rna) or len(filter(lambda junction: helix['location'][0][0] in sum(junction['location'],[]) or helix['location'][-1][-1] in sum(junction['location'],[]), self.junctions)):
-                continue
-            descr = ""
-            location = []
-            next_helix = None
-            current_pos = helix['location'][-1][-1]+1
-
-            while current_pos >= 1 and current_pos <= len(self.rna):
-                next_helix = filter(lambda helix: current_pos == helix['location'][0][0] or current_pos == helix['location'][1][0], self.helices)
-                if next_helix and next_helix[0] == helix:
-                    descr += '- '
-                    location.append([current_pos-1, current_pos])
-                    break
-                elif next_helix:
-                    descr += '- '
-                    location.append([current_pos-1, current_pos])
-                    current_pos = self.get_paired_residue(current_pos)+1
+            loop = {'helix': helix, 'location': [], 'single_strands': [], 'children': []}
+            current_pos = helix['location'][0][-1] #the last paired position before the first range of the loop
+            loop_end = helix['location'][-1][0]
+            while True:
+                single_strand = None
+                if pair_table[current_pos+1]:
+                    next_pos = current_pos+1
                 else:
+                    single_strand = single_strands_by_start.get(current_pos+1)
+                    if not single_strand: #the single-strands don't match the helices
+                        loop = None
+                        break
+                    next_pos = single_strand['location'][-1]+1
+                loop['location'].append([current_pos, next_pos])
+                loop['single_strands'].append(single_strand)
+                if next_pos >= loop_end:
                     break
-
-            if next_helix and next_helix[0] == helix:
-                self.junctions.append({
-                    'single_strands': [],
-                    'description': descr.strip(),
-                    'location': location
-                })
-
-            #the other side
-            descr = ""
-            location = []
-            next_helix = None
-            current_pos = helix['location'][0][1]+1
-
-            while current_pos >= 1 and current_pos <= len(self.rna):
-                next_helix = filter(lambda helix: current_pos == helix['location'][0][0] or current_pos == helix['location'][1][0], self.helices)
-                if next_helix and next_helix[0] == helix:
-                    descr += '- '
-                    location.append([current_pos-1, current_pos])
-                    break
-                elif next_helix:
-                    descr += '- '
-                    location.append([current_pos-1, current_pos])
-                    current_pos = self.get_paired_residue(current_pos)+1
-                else:
+                next_helix = helices_by_start.get(next_pos)
+                if not next_helix:
+                    loop = None
                     break
+                loop['children'].append(next_helix)
+                current_pos = next_helix['location'][-1][-1]
+            if loop:
+                loops.append(loop)
+        return loops
 
-            if next_helix and next_helix[0] == helix:
-                self.junctions.append({
-                    'single_strands': [],
-                    'description': descr.strip(),
-                    'location': location
-                })
+    def find_junctions(self):
+        self.junctions = []
+        self._modules_index = None
+        loops = self.__find_loops()
+
+        #each location starts at the first single-strand of the junction. Without single-strands, it starts after the closing helix or after the first helix branching from the junction, like the descriptions computed (and stored) so far.
+        enclosing_loops = {}
+        for loop in loops:
+            for helix in loop['children']:
+                enclosing_loops[id(helix)] = loop
+        starts_after_closing_helix = {}
+        for helix in self.helices:
+            enclosing_loop = enclosing_loops.get(id(helix))
+            starts_after_closing_helix[id(helix)] = not (helix['location'][0][0] == 1 or helix['location'][-1][-1] == len(self.rna) or \
+                enclosing_loop and (any(enclosing_loop['single_strands']) or starts_after_closing_helix[id(enclosing_loop['helix'])] or enclosing_loop['children'][0] is not helix))
+
+        for loop in loops:
+            strands = [single_strand for single_strand in loop['single_strands'] if single_strand]
+            if strands:
+                first = loop['single_strands'].index(strands[0])
+            elif starts_after_closing_helix[id(loop['helix'])]:
+                first = 0
+            elif loop['children']:
+                first = 1
+            else:
+                continue
+            descr = [self.rna[single_strand['location'][0]-1:single_strand['location'][-1]] if single_strand else '-' for single_strand in loop['single_strands']]
+            self.junctions.append({
+                'single_strands': strands,
+                'description': ' '.join(descr[first:]+descr[:first]),
+                'location': loop['location'][first:]+loop['location'][:first]
+            })
 
         self.junctions = sorted(self.junctions, key=lambda x: x['location'][0][0])
 
@@ -796,6 +1244,30 @@ class SecondaryStructure:
                 self.stem_loops.append(stem_loop)
 
         self.stem_loops = sorted(self.stem_loops, key=lambda x: x['apical_loop']['location'][0])
+        self.__index_modules()
+
+    def __index_modules(self):
+        #each interval of the index stores (rank, module, module start, module end). The rank orders the stem-loops before the junctions, like in the lists self.stem_loops and self.junctions
+        intervals = []
+        modules = self.stem_loops+[junction for junction in self.junctions if len(junction['location']) >= 3]
+        for rank, module in enumerate(modules):
+            location = Location(nested_lists = module['location'])
+            for block in location.blocks:
+                intervals.append((block.start, block.end, (rank, module, location.start(), location.end())))
+        self._modules_index = IntervalTree(intervals)
+
+    def get_modules(self, position):
+        """
+        Returns:
+        ------
+        the stem-loops and the junctions of degree >= 3 enclosing the position given as argument, as a list of dicts (stem-loops first).
+        """
+        if self._modules_index is None:
+            if not self.stem_loops:
+                self.find_stem_loops()
+            else:
+                self.__index_modules()
+        return [module for rank, module, start, end in sorted(self._modules_index.find(position))]
 
     def find_connected_modules(self):
         self.connected_modules = []
@@ -803,47 +1275,43 @@ class SecondaryStructure:
             self.find_junctions()
         if not self.stem_loops:
             self.find_stem_loops()
+        if self._modules_index is None:
+            self.__index_modules()
 
-        tertiary_interactions = self.tertiary_interactions
+        stem_loops_count = len(self.stem_loops)
 
         for tertiary_interaction in self.tertiary_interactions:
             start = tertiary_interaction['location'][0][0]
             end = tertiary_interaction['location'][-1][-1]
-            #print "Tertiary Interaction",start, end
-            for stem_loop_1 in self.stem_loops:
-                location_1 = Location(nested_lists = stem_loop_1['location'])
-                if location_1.has_position(start):
-                    for junction in self.junctions:
-                        if len(junction['location']) >=3 :
-                            location_2 = Location(nested_lists = junction['location'])
-                            if location_2.has_position(end):
-                                if location_2.end() < location_1.start() or location_2.start() > location_1.end():
-                                    self.connected_modules.append((stem_loop_1, junction))
-                                    #print location_1.start(),location_1.end()
-                                    #print location_2.start(),location_2.end()
-                    for stem_loop_2 in self.stem_loops:
-                        location_2 = Location(nested_lists = stem_loop_2['location'])
-                        if location_2.has_position(end) and stem_loop_2 != stem_loop_1:
-                            if location_2.end() < location_1.start() or location_2.start() > location_1.end():
-                                self.connected_modules.append((stem_loop_1, stem_loop_2))
-                                #print location_1.start(),location_1.end()
-                                #print location_2.start(),location_2.end()
-                if location_1.has_position(end):
-                    for junction in self.junctions:
-                        if len(junction['location']) >=3 :
-                            location_2 = Location(nested_lists = junction['location'])
-                            if location_2.has_position(start):
-                                if location_2.end() < location_1.start() or location_2.start() > location_1.end():
-                                    self.connected_modules.append((stem_loop_1, junction))
-                                    #print location_1.start(),location_1.end()
-                                    #print location_2.start(),location_2.end()
+            modules_at_start = sorted(self._modules_index.find(start))
+            modules_at_end = sorted(self._modules_index.find(end))
+            stem_loops_at_start = [module for module in modules_at_start if module[0] < stem_loops_count]
+            stem_loops_at_end = [module for module in modules_at_end if module[0] < stem_loops_count]
+            junctions_at_start = [module for module in modules_at_start if module[0] >= stem_loops_count]
+            junctions_at_end = [module for module in modules_at_end if module[0] >= stem_loops_count]
+
+            stem_loops = dict((module[0], module) for module in stem_loops_at_start+stem_loops_at_end)
+            ranks_at_start = [module[0] for module in stem_loops_at_start]
+            ranks_at_end = [module[0] for module in stem_loops_at_end]
+
+            for rank_1 in sorted(stem_loops):
+                rank_1, stem_loop_1, start_1, end_1 = stem_loops[rank_1]
+                if rank_1 in ranks_at_start:
+                    for rank_2, junction, start_2, end_2 in junctions_at_end:
+                        if end_2 < start_1 or start_2 > end_1:
+                            self.connected_modules.append((stem_loop_1, junction))
+                    for rank_2, stem_loop_2, start_2, end_2 in stem_loops_at_end:
+                        if rank_2 != rank_1 and (end_2 < start_1 or start_2 > end_1):
+                            self.connected_modules.append((stem_loop_1, stem_loop_2))
+                if rank_1 in ranks_at_end:
+                    for rank_2, junction, start_2, end_2 in junctions_at_start:
+                        if end_2 < start_1 or start_2 > end_1:
+                            self.connected_modules.append((stem_loop_1, junction))
 
     def add_helix(self, name, start, end, length):
-        _ends = [start, start+length-1, end-length+1, end]
         #no pseudoknot allowed
         for helix in self.helices:
-            ends = [helix['location'][0][0], helix['location'][0][1], helix['location'][-1][0], helix['location'][-1][-1]]
-            if _ends[0] >= ends[1] and _ends[0] <= ends[2] and _ends[3] >= ends[3] or _ends[0] <= ends[0] and _ends[3] >= ends[1] and _ends[3] <= ends[2]: #pseudoknot
+            if _is_pseudoknot(start, end, length, helix):
                 for i in range(0, length):
                     self.add_tertiary_interaction('C', '(', ')', start+i, end-i)
                 return None
@@ -855,6 +1323,8 @@ class SecondaryStructure:
             }
         self.helices.append(helix)
         self.helices = sorted(self.helices, key=lambda helix: helix['location'][0][0]) #the helices are sorted according to the start position
+        if self._pair_table is not None:
+            self.__store_helix_in_pair_table(helix)
         return helix
 
     def add_single_strand(self, name, start, length):
@@ -866,17 +1336,17 @@ class SecondaryStructure:
         return single_strand
 
     def add_tertiary_interaction(self, orientation, edge1, edge2, pos1, pos2):
-        location = [[pos1, pos1], [pos2, pos2]]
-        for tertiary_interaction in self.tertiary_interactions:
-            if tertiary_interaction['location'] == location:
-                self.tertiary_interactions.remove(tertiary_interaction)
-                break
-        self.tertiary_interactions.append({
+        tertiary_interaction = {
                             'orientation': orientation,
                             'edge1': edge1,
                             'edge2': edge2,
                             'location': [[pos1, pos1], [pos2, pos2]]
-                        })
+                        }
+        if self._tertiary_interactions_index.has_key((pos1, pos2)): #an interaction at the same location is replaced
+            self._tertiary_interactions_index[(pos1, pos2)].update(tertiary_interaction)
+        else:
+            self._tertiary_interactions_index[(pos1, pos2)] = tertiary_interaction
+            self.tertiary_interactions.append(tertiary_interaction)
 
     def add_base_pair(self, orientation, edge1, edge2, pos1, pos2):
         is_secondary_interaction = False
@@ -916,6 +1386,101 @@ class SecondaryStructure:
             #if we reach this point, its a tertiary interaction
             self.add_tertiary_interaction(orientation, edge1, edge2, pos1, pos2)
 
+class Alignment(object):
+    """
+    Aligned molecules stored in a uint8 matrix, with one row for each molecule and one column for each position of the alignment. The consensus base pairs (if any) follow the columns, so that columns can be removed without unbalancing the consensus structure. Iterating over an Alignment gives new RNA, DNA or Protein objects.
+    """
+
+    def __init__(self, names, matrix, base_pairs = None, molecule_type = RNA):
+        self.names = names
+        self.matrix = matrix
+        self.base_pairs = base_pairs if base_pairs is not None else DataFrame()
+        self.molecule_type = molecule_type
+
+    @classmethod
+    def from_molecules(cls, molecules, base_pairs = None):
+        """
+        Parameters:
+        ---------
+        - molecules: a list of gapped RNA, DNA or Protein objects (see pyrna.features), all of the same type. The shorter sequences are padded with null bytes.
+        - base_pairs (default: None): the consensus base pairs in a pandas Dataframe
+
+        Returns:
+        ------
+        an Alignment object
+        """
+        length = max([len(molecule) for molecule in molecules]) if molecules else 0
+        matrix = np.frombuffer(''.join([str(molecule.sequence).ljust(length, '\0') for molecule in molecules]), dtype = np.uint8).reshape(len(molecules), length)
+        return cls(np.array([molecule.name for molecule in molecules], dtype = object), matrix, base_pairs, molecules[0].__class__ if molecules else RNA)
+
+    def get_length(self):
+        return self.matrix.shape[1]
+
+    def get_gap_columns(self, gap_symbol = '-'):
+        """
+        Returns:
+        ------
+        a numpy array of booleans flagging the columns made only with gaps
+        """
+        return (self.matrix == ord(gap_symbol)).all(axis = 0)
+
+    def remove_columns(self, columns):
+        """
+        Parameters:
+        ---------
+        - columns: a numpy array of booleans flagging the columns to remove
+
+        Returns:
+        ------
+        a new Alignment object without these columns. The base pairs with a removed position are removed too (their partner columns becoming single-strands) and the positions of the other ones are shifted.
+        """
+        kept = ~np.asarray(columns, dtype = bool)
+        base_pairs = self.base_pairs
+        if len(base_pairs):
+            new_positions = np.cumsum(kept) #the new 1-based position of each column kept
+            positions1 = base_pairs['pos1'].values.astype(int)
+            positions2 = base_pairs['pos2'].values.astype(int)
+            kept_base_pairs = (positions1 >= 1) & (positions1 <= len(kept)) & (positions2 >= 1) & (positions2 <= len(kept))
+            kept_base_pairs[kept_base_pairs] = kept[positions1[kept_base_pairs]-1] & kept[positions2[kept_base_pairs]-1]
+            base_pairs = base_pairs[kept_base_pairs].copy()
+            base_pairs['pos1'] = new_positions[positions1[kept_base_pairs]-1]
+            base_pairs['pos2'] = new_positions[positions2[kept_base_pairs]-1]
+        return Alignment(self.names, self.matrix[:, kept], base_pairs, self.molecule_type)
+
+    def curate(self):
+        """
+        Returns:
+        ------
+        a new Alignment object without the columns made only with gaps
+        """
+        return self.remove_columns(self.get_gap_columns())
+
+    def get_rows(self, start = 0, end = None):
+        """
+        Returns:
+        ------
+        the rows restricted to the columns start to end (0-based, end excluded) as a numpy array of Strings
+        """
+        block = np.ascontiguousarray(self.matrix[:, start:end])
+        if not block.shape[1]:
+            return np.zeros(len(self), dtype = 'S1')
+        return block.view('S%i'%block.shape[1]).ravel() #the null bytes padding the shorter rows are dropped
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, i):
+        """
+        Returns:
+        ------
+        the molecule i as a new RNA, DNA or Protein object
+        """
+        return self.molecule_type(sequence = self.matrix[i].tostring().rstrip('\0'), name = self.names[i])
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
 class StructuralAlignment:
 
     def __init__(self, json_data):
@@ -944,9 +1509,18 @@ class TertiaryStructure:
         self.source = 'N.A.:N.A.:N.A.'
         self.rna = rna
         self.name = "N.A."
-        self.residues = {} #the keys are the absolute position of residues
         self.numbering_system = {}
         self._id = str(ObjectId())
+        #the atoms are stored in columns, sorted by residue absolute position:
+        #- the atom names
+        #- the residue absolute position of each atom
+        #- the atom coordinates in a (N,3) float32 array
+        self.atom_names = np.empty(0, dtype = object)
+        self.atom_positions = np.empty(0, dtype = np.int32)
+        self.coords = np.empty((0, 3), dtype = np.float32)
+        self._residue_offsets = {} #the keys are the absolute position of residues, the values the (start, end) slice of their atoms in the columns
+        self._pending_atoms = ([], [], []) #the atoms added since the last update of the columns
+        self.residues = Residues(self) #the keys are the absolute position of residues
 
     def get_atoms(self):
         """
@@ -962,49 +1536,64 @@ class TertiaryStructure:
         - y (float)
         - z (float)
         """
-        _atoms = []
-        keys =[]
-        for k in self.residues:
-            keys.append(k)
-
-        keys.sort() #the absolute position are sorted
-
-        for key in keys:
-            atoms = self.residues[key]['atoms']
-            for atom in atoms:
-                _atoms.append({
-                    'name': atom['name'],
-                    'absolute position': key,
-                    'position label': self.get_residue_label(key),
-                    'residue name': self.rna.sequence[key-1],
-                    'chain name': self.rna.name,
-                    'x': atom['coords'][0],
-                    'y': atom['coords'][1],
-                    'z': atom['coords'][2]
-                })
-
-        return DataFrame(_atoms)
+        self.__update_columns()
+        positions = self.atom_positions
+        residue_positions = np.unique(positions)
+        labels = np.array([self.get_residue_label(position) for position in residue_positions.tolist()], dtype = object)
+        return DataFrame({
+            'name': self.atom_names,
+            'absolute position': positions,
+            'position label': labels[np.searchsorted(residue_positions, positions)],
+            'residue name': np.array(list(self.rna.sequence), dtype = object)[positions-1],
+            'chain name': np.repeat(np.array([self.rna.name], dtype = object), len(positions)),
+            'x': self.coords[:,0],
+            'y': self.coords[:,1],
+            'z': self.coords[:,2]
+        }, columns = ['absolute position', 'chain name', 'name', 'position label', 'residue name', 'x', 'y', 'z'])
 
     def add_atom(self, atom_name, absolute_position, coords):
-        atom_name = re.sub("\*", "'", atom_name)
-        if atom_name == 'OP1':
-            atom_name = 'O1P'
-        elif atom_name == 'OP2':
-            atom_name = 'O2P'
-        elif atom_name == 'OP3':
-            atom_name = 'O3P'
-        if self.residues.has_key(absolute_position):
-            self.residues[absolute_position]['atoms'].append({
-                    'name': atom_name,
-                    'coords': coords
-                })
+        names, positions, _coords = self._pending_atoms
+        names.append(_atom_name(atom_name))
+        positions.append(absolute_position)
+        _coords.append(coords)
+
+    def add_atoms(self, atom_names, absolute_positions, coords):
+        """
+        Add several atoms at once.
+
+        Parameters:
+        ---------
+        - atom_names: the atom names
+        - absolute_positions: the residue absolute position of each atom
+        - coords: the atom coordinates as a (N,3) array or a list of [x,y,z] lists
+        """
+        self.__update_columns()
+        atom_names = np.asarray(atom_names)
+        if len(atom_names):
+            #the names are normalized once for each distinct name
+            distinct_names, indexes = np.unique(atom_names.astype(str), return_inverse = True)
+            atom_names = np.array([_atom_name(atom_name) for atom_name in distinct_names.tolist()], dtype = object)[indexes]
         else:
-             self.residues[absolute_position] = {
-                'atoms': [{
-                    'name': atom_name,
-                    'coords': coords
-                }]
-             }
+            atom_names = np.empty(0, dtype = object)
+        self.__set_columns(
+            np.concatenate((self.atom_names, atom_names)),
+            np.concatenate((self.atom_positions, np.asarray(absolute_positions, dtype = np.int32))),
+            np.concatenate((self.coords, np.asarray(coords, dtype = np.float32).reshape(-1, 3))))
+
+    def get_residue_atoms(self, absolute_position):
+        """
+        Returns:
+        ------
+        the (atom names, coords) arrays for the residue at the absolute position given as argument. These arrays are views on the columns of this tertiary structure.
+        """
+        self.__update_columns()
+        start, end = self._residue_offsets[absolute_position]
+        return self.atom_names[start:end], self.coords[start:end]
+
+    def remove_residue(self, absolute_position):
+        if self.has_residue(absolute_position):
+            keep = self.atom_positions != absolute_position
+            self.__set_columns(self.atom_names[keep], self.atom_positions[keep], self.coords[keep])
 
     def get_residue_label(self, absolute_position):
         if self.numbering_system.has_key(str(absolute_position)):
@@ -1012,6 +1601,91 @@ class TertiaryStructure:
         else:
             return str(absolute_position)
 
+    def __update_columns(self):
+        names, positions, coords = self._pending_atoms
+        if not names:
+            return
+        self._pending_atoms = ([], [], [])
+        self.__set_columns(
+            np.concatenate((self.atom_names, np.array(names, dtype = object))),
+            np.concatenate((self.atom_positions, np.array(positions, dtype = np.int32))),
+            np.concatenate((self.coords, np.array(coords, dtype = np.float32).reshape(-1, 3))))
+
+    def __set_columns(self, names, positions, coords):
+        if len(positions) and np.any(positions[1:] < positions[:-1]):
+            order = np.argsort(positions, kind = 'mergesort') #stable, to keep the order of the atoms within each residue
+            names, positions, coords = names[order], positions[order], coords[order]
+        self.atom_names, self.atom_positions, self.coords = names, positions, coords
+        starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]]) if len(positions) else np.empty(0, dtype = np.int64)
+        ends = np.r_[starts[1:], len(positions)]
+        self._residue_offsets = dict(zip(positions[starts].tolist(), zip(starts.tolist(), ends.tolist())))
+
+    def get_residue_positions(self):
+        """
+        Returns:
+        ------
+        the sorted absolute positions of the residues having atoms
+        """
+        self.__update_columns()
+        return sorted(self._residue_offsets.keys())
+
+    def has_residue(self, absolute_position):
+        self.__update_columns()
+        return self._residue_offsets.has_key(absolute_position)
+
+class Residues:
+    """
+    A dict-like view on the atoms of a TertiaryStructure. For each residue absolute position, it gives a dict like {'atoms': [{'name': 'P', 'coords': [x, y, z]}, ...]}.
+
+    This dict is a copy made from the columns of the TertiaryStructure: editing it in place doesn't change the structure, it has to be assigned back (residues[position] = residue). Each assignment rebuilds the columns, so that many residues have to be added with a single call to TertiaryStructure.add_atoms().
+    """
+
+    def __init__(self, tertiary_structure):
+        self.tertiary_structure = tertiary_structure
+
+    def keys(self):
+        return self.tertiary_structure.get_residue_positions()
+
+    def has_key(self, absolute_position):
+        return self.tertiary_structure.has_residue(absolute_position)
+
+    def items(self):
+        return [(absolute_position, self[absolute_position]) for absolute_position in self.keys()]
+
+    def __contains__(self, absolute_position):
+        return self.has_key(absolute_position)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, absolute_position):
+        """
+        Returns:
+        ------
+        a new dict describing the atoms of the residue (see the class documentation)
+        """
+        names, coords = self.tertiary_structure.get_residue_atoms(absolute_position)
+        coords = coords.astype(np.float64).round(3) #the coordinates are stored in float32, we give them back with the precision of the PDB format
+        return {
+            'atoms': [{'name': name, 'coords': _coords} for name, _coords in zip(names.tolist(), coords.tolist())]
+        }
+
+    def __setitem__(self, absolute_position, residue):
+        """
+        Replace the atoms of a residue. The columns of the TertiaryStructure are rebuilt (see the class documentation).
+        """
+        self.tertiary_structure.remove_residue(absolute_position)
+        atoms = residue['atoms']
+        self.tertiary_structure.add_atoms([atom['name'] for atom in atoms], [absolute_position]*len(atoms), [atom['coords'] for atom in atoms])
+
+    def __delitem__(self, absolute_position):
+        if not self.has_key(absolute_position):
+            raise KeyError(absolute_position)
+        self.tertiary_structure.remove_residue(absolute_position)
+
 modified_aminoacids = {
     "ALA": "A",
     "ARG": "R",
@@ -1467,3 +2141,77 @@ modified_ribonucleotides = {
     "P5P": "A",
     "FMU": "U"
 }
+
+def _translation(modified_residues, gap_symbols = ''):
+    """
+    Returns the tables to normalize in a single pass a sequence made with one character per residue: the modified residues named with a single character and the gap symbols (turned into '-').
+    """
+    substitutions = dict([(residue, modified_residues[residue]) for residue in modified_residues if len(residue) == 1 and len(modified_residues[residue]) == 1])
+    modified = ''.join(sorted(substitutions))
+    substitutions.update([(gap_symbol, '-') for gap_symbol in gap_symbols])
+    characters = ''.join(sorted(substitutions))
+    return {
+        'str': maketrans(characters, ''.join([substitutions[c] for c in characters])),
+        'unicode': dict([(ord(c), unicode(substitutions[c])) for c in characters]),
+        'modified': re.compile('[%s]'%re.escape(modified)) if modified else None
+    }
+
+def _translate(sequence, translation):
+    if isinstance(sequence, unicode):
+        return sequence.translate(translation['unicode'])
+    return sequence.translate(translation['str'])
+
+def _find_modified_residues(sequence, translation, offset = 0):
+    """
+    Returns the modified residues of a sequence as a list of (residue, position) tuples. The positions start at offset+1.
+    """
+    if not translation['modified']:
+        return []
+    return [(match.group(), match.start()+offset+1) for match in translation['modified'].finditer(sequence)]
+
+_ribonucleotides_translation = _translation(modified_ribonucleotides, gap_symbols = '._')
+_aminoacids_translation = _translation(modified_aminoacids)
+
+_atom_names = {
+    'OP1': 'O1P',
+    'OP2': 'O2P',
+    'OP3': 'O3P'
+}
+
+def _atom_name(atom_name):
+    atom_name = atom_name.replace('*', "'")
+    return _atom_names.get(atom_name, atom_name)
+
+_plot_colors = ["#4daf4a", "#377eb8", "#e41a1c"] #the colors for the lowest, mean and highest quantitative values in a plot
+
+def _scale_color(value, domain, colors):
+    """
+    Returns the color (as '#rrggbb') of a value, interpolated like with a D3 linear scale on a domain and colors of the same length.
+    """
+    i = 0
+    while i < len(domain)-2 and value > domain[i+1]:
+        i += 1
+    ratio = (value-domain[i])/float(domain[i+1]-domain[i]) if domain[i+1] != domain[i] else 0.0
+    ratio = min(max(ratio, 0.0), 1.0)
+    start, end = colors[i], colors[i+1]
+    return '#'+''.join(['%02x'%int(round(int(start[j:j+2], 16)+(int(end[j:j+2], 16)-int(start[j:j+2], 16))*ratio)) for j in (1, 3, 5)])
+
+def _canonical_residues():
+    """
+    Returns a 256x256 boolean table telling if two residues (as bytes) make a canonical pair (AU, GC or GU, whatever the case).
+    """
+    table = np.zeros((256, 256), dtype=bool)
+    for residue_1, residue_2 in ['AU', 'UA', 'GC', 'CG', 'GU', 'UG']:
+        for r1 in (residue_1, residue_1.lower()):
+            for r2 in (residue_2, residue_2.lower()):
+                table[ord(r1), ord(r2)] = True
+    return table
+
+_canonical_residues = _canonical_residues()
+
+def _are_canonical(sequence, positions1, positions2, orientations, edges1, edges2):
+    """
+    The vectorized counterpart of pyrna.utils.is_canonical() for the base-pairs of a sequence given as numpy arrays. Returns a boolean array.
+    """
+    residues = np.frombuffer(str(sequence), dtype=np.uint8)
+    return _canonical_residues[residues[positions1-1], residues[positions2-1]] & ((orientations == 'c') | (orientations == 'C')) & (edges1 == '(') & (edges2 == ')')
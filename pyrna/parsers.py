@@ -1,6 +1,8 @@
-import re
+import re, string
+import numpy as np
+from string import maketrans
 from pandas import DataFrame
-from pyrna.features import RNA, DNA, Protein, TertiaryStructure, SecondaryStructure
+from pyrna.features import RNA, DNA, Protein, TertiaryStructure, SecondaryStructure, Alignment
 from pyrna import utils
 
 def consensus2d_to_base_pairs(aligned_rna, consensus_2d):
@@ -14,24 +16,64 @@ def consensus2d_to_base_pairs(aligned_rna, consensus_2d):
     ------
     the secondary structure as a list of base-pairs in a pandas DataFrame
     """
+    if not len(consensus_2d):
+        return DataFrame()
+    kept, positions1, positions2 = _project_consensus2d([aligned_rna.sequence], consensus_2d)[:3]
+    kept = kept[0]
+    if not kept.any():
+        return DataFrame()
+    return DataFrame({
+        'edge1': consensus_2d['edge1'].values[kept].tolist(),
+        'edge2': consensus_2d['edge2'].values[kept].tolist(),
+        'orientation': consensus_2d['orientation'].values[kept].tolist(),
+        'pos1': positions1[0][kept],
+        'pos2': positions2[0][kept]
+    }, columns=['edge1', 'edge2', 'orientation', 'pos1', 'pos2'])
+
+def consensus2d_to_pair_tables(aligned_rnas, consensus_2d):
+    """
+    Project a consensus secondary structure on all the sequences of an alignment at once.
 
-    aligned_sequence = aligned_rna.sequence
-    rna = RNA(name = aligned_rna.name, sequence = aligned_sequence.replace('-',''))
-    new_base_pairs = []
-
-    for index, bp in consensus_2d.iterrows():
-        if aligned_sequence[bp['pos1']-1] != '-' and aligned_sequence[bp['pos2']-1] != '-':
-            new_pos1 = bp['pos1']-aligned_sequence[0:bp['pos1']].count('-')
-            new_pos2 = bp['pos2']-aligned_sequence[0:bp['pos2']].count('-')
-            new_base_pairs.append({
-                'pos1': new_pos1,
-                'pos2': new_pos2,
-                'orientation': bp['orientation'],
-                'edge1': bp['edge1'],
-                'edge2': bp['edge2']
-                })
+    Parameters:
+    ---------
+    - aligned_rnas: the RNA objects (see pyrna.features) of the alignment. Their sequences have the same length and can contain gap symbols ('-')
+    - consensus_2d: the consensus secondary structure and described as a list of base_pairs in a pandas Dataframe
 
-    return DataFrame(new_base_pairs)
+    Returns:
+    ------
+    a list of pair tables, one for each RNA once ungapped (see pyrna.features.SecondaryStructure.pair_table()). A consensus base-pair is kept for an RNA if both its positions are not gaps.
+    """
+    if not aligned_rnas:
+        return []
+    kept, positions1, positions2, lengths = _project_consensus2d([rna.sequence for rna in aligned_rnas], consensus_2d)
+    #all the pair tables are stored in a single array, one after the other
+    offsets = np.concatenate(([0], np.cumsum(lengths+1)[:-1]))
+    tables = np.zeros(int(np.sum(lengths+1)), dtype=np.int32)
+    tables[offsets] = lengths
+    rows = np.nonzero(kept)[0]
+    tables[offsets[rows]+positions1[kept]] = positions2[kept]
+    tables[offsets[rows]+positions2[kept]] = positions1[kept]
+    return np.split(tables, offsets[1:])
+
+def _project_consensus2d(aligned_sequences, consensus_2d):
+    """
+    Returns, for each aligned sequence (rows) and each consensus base-pair (columns), if the base-pair is kept and its positions in the ungapped sequence. Returns also the length of each ungapped sequence.
+    """
+    if len(set(len(sequence) for sequence in aligned_sequences)) > 1:
+        raise Exception("The aligned sequences need to have the same length")
+    length = len(aligned_sequences[0]) if aligned_sequences else 0
+    alignment = np.frombuffer(''.join(str(sequence) for sequence in aligned_sequences), dtype=np.uint8).reshape(len(aligned_sequences), length)
+    residues = alignment != ord('-')
+    #the position in the ungapped sequence for each column of the alignment, in the narrowest integers able to store it (this is the largest array, with one value per residue of the alignment)
+    ungapped_positions = np.cumsum(residues, axis=1, dtype=np.int16 if length <= np.iinfo(np.int16).max else np.int32)
+    lengths = ungapped_positions[:, -1].astype(np.int64) if length else np.zeros(len(aligned_sequences), dtype=np.int64)
+    if len(consensus_2d):
+        columns1 = consensus_2d['pos1'].values.astype(np.int64)-1
+        columns2 = consensus_2d['pos2'].values.astype(np.int64)-1
+    else:
+        columns1 = columns2 = np.zeros(0, dtype=np.int64)
+    kept = residues[:, columns1] & residues[:, columns2]
+    return kept, ungapped_positions[:, columns1].astype(np.int64), ungapped_positions[:, columns2].astype(np.int64), lengths
 
 def secondary_structure_to_base_pairs(secondary_structure, keep_tertiaries = False):
     """
@@ -98,97 +140,7 @@ def base_pairs_to_secondary_structure(rna, base_pairs):
     a SecondaryStructure object (see pyrna.features)
     """
 
-    ss = SecondaryStructure(rna)
-
-    if not len(base_pairs):
-        ss.add_single_strand("SS1", 1, len(rna))
-        return ss
-
-    new_helix = False
-    helix_start = -1
-    helix_end = -1
-    helix_length = -1
-    base_pairs = base_pairs.sort_values(by='pos1') #the base pairs are sorted according to the first position
-    base_pairs = base_pairs.as_matrix()
-    helix_count = 1
-
-    next_pos1 = -1
-    next_edge1 = None
-    next_pos2 = -1
-    next_edge2 = None
-    next_orientation = None
-
-    non_canonical_secondary_interactions = []
-
-    for i in range(0, len(base_pairs)-1):
-        bp = base_pairs[i]
-        pos1 = bp[3]
-        edge1 = bp[1]
-        pos2 = bp[4]
-        edge2 = bp[2]
-        orientation = bp[0]
-
-        next_bp = base_pairs[i+1]
-        next_pos1 = next_bp[3]
-        next_edge1 = next_bp[1]
-        next_pos2 = next_bp[4]
-        next_edge2 = next_bp[2]
-        next_orientation = next_bp[0]
-
-        if pos1+1 == next_pos1 and pos2-1 == next_pos2:
-            if new_helix:
-                helix_length += 1
-                if not utils.is_canonical(rna[next_pos1-1], rna[next_pos2-1], next_orientation, next_edge1, next_edge2):
-                    non_canonical_secondary_interactions.append((next_orientation, next_edge1, next_edge2, next_pos1, next_pos2))
-            else:
-                new_helix = True
-                helix_length = 2
-                helix_start = pos1
-                helix_end = pos2
-                if not utils.is_canonical(rna[pos1-1], rna[pos2-1], orientation, edge1, edge2):
-                    non_canonical_secondary_interactions.append((orientation, edge1, edge2, pos1, pos2))
-                if not utils.is_canonical(rna[next_pos1-1], rna[next_pos2-1], next_orientation, next_edge1, next_edge2):
-                    non_canonical_secondary_interactions.append((next_orientation, next_edge1, next_edge2, next_pos1, next_pos2))
-
-        else:
-            if new_helix:
-                ss.add_helix("H"+str(helix_count), helix_start, helix_end, helix_length)
-                helix_count += 1
-            else:
-                ss.add_tertiary_interaction(orientation, edge1, edge2, pos1, pos2)
-            new_helix = False
-
-    #the last helix
-    if new_helix:
-        ss.add_helix("H"+str(helix_count), helix_start, helix_end, helix_length)
-        helix_count+=1
-    else:
-        ss.add_tertiary_interaction(next_orientation, next_edge1, next_edge2, next_pos1, next_pos2)
-
-    #now we add the non-canonical interactions to their helices
-    for non_canonical_secondary_interaction in non_canonical_secondary_interactions:
-        ss.add_base_pair( non_canonical_secondary_interaction[0], non_canonical_secondary_interaction[1], non_canonical_secondary_interaction[2], non_canonical_secondary_interaction[3], non_canonical_secondary_interaction[4] )
-
-    #we construct the single-strands
-    ss_count = 1
-    ss_start = -1
-    ss_length = 0
-    for i in range(1, len(rna)+1):
-        paired_residue = ss.get_paired_residue(i)
-        if paired_residue != -1 and ss_length > 0:
-            ss.add_single_strand("SS"+str(ss_count), ss_start, ss_length)
-            ss_length = 0
-            ss_count += 1
-        elif paired_residue == -1:
-            if ss_length == 0:
-                ss_start = i
-            ss_length += 1
-
-    #the last single-strand
-    if ss_length > 0:
-        ss.add_single_strand("SS"+str(ss_count), ss_start, ss_length)
-
-    return ss
+    return SecondaryStructure.from_base_pairs(rna, base_pairs)
 
 def consensus2d_to_booquet(structural_alignment, junction_diameter = 20):
     """
@@ -407,16 +359,18 @@ def to_ct(base_pairs, rna):
     the CT data as a String
     """
     lines=["ENERGY"]
-    base_pairs = base_pairs.sort_index(by='pos1') #the base pairs are sorted according to the first position
+    #the partners of each position, listed in one pass over the base pairs sorted according to the first position
+    partners_as_pos1 = {}
+    partners_as_pos2 = {}
+    if len(base_pairs):
+        order = np.argsort(base_pairs.pos1.values, kind = 'mergesort')
+        for pos1, pos2 in zip(base_pairs.pos1.values[order].tolist(), base_pairs.pos2.values[order].tolist()):
+            partners_as_pos1.setdefault(pos1, []).append(pos2)
+            partners_as_pos2.setdefault(pos2, []).append(pos1)
+    sequence = rna.sequence
     for molecular_pos in range (1, len(rna)+1):
-        if len(base_pairs[base_pairs.pos1 == molecular_pos]):
-            for index, bps in base_pairs[base_pairs.pos1 == molecular_pos].iterrows():
-                lines.append("%i\t%s\t%i\t%i\t%i\t%i"%(molecular_pos, rna.sequence[molecular_pos-1], molecular_pos-1, molecular_pos+1, bps['pos2'], molecular_pos))
-        elif len(base_pairs[base_pairs.pos2 == molecular_pos]):
-            for index, bps in base_pairs[base_pairs.pos2 == molecular_pos].iterrows():
-                lines.append("%i\t%s\t%i\t%i\t%i\t%i"%(molecular_pos, rna.sequence[molecular_pos-1], molecular_pos-1, molecular_pos+1, bps['pos1'], molecular_pos))
-        else:
-            lines.append("%i\t%s\t%i\t%i\t0\t%i"%(molecular_pos, rna.sequence[molecular_pos-1], molecular_pos-1, molecular_pos+1, molecular_pos))
+        for partner in partners_as_pos1.get(molecular_pos) or partners_as_pos2.get(molecular_pos) or [0]:
+            lines.append("%i\t%s\t%i\t%i\t%i\t%i"%(molecular_pos, sequence[molecular_pos-1], molecular_pos-1, molecular_pos+1, partner, molecular_pos))
 
     return '\n'.join(lines)
 
@@ -426,7 +380,7 @@ def to_fasta(molecules, single_line=False):
 
     Parameters:
     ---------
-    - molecules: a list of Molecule objects (see pyrna.features)
+    - molecules: a list of Molecule objects or an Alignment object (see pyrna.features)
     - single_line (default: False): if True, each molecular sequence will we exported into a single line
 
     Returns:
@@ -512,7 +466,7 @@ def to_stockholm(base_pairs, molecules, rfam_accession_number = None, family_id
     Parameters:
     ---------
     - base_pairs: a pandas Dataframe listing the base pairs.
-    - molecules: a list of Molecule objects (gapped or ungapped) (see pyrna.features)
+    - molecules: a list of Molecule objects (gapped or ungapped) or an Alignment object (see pyrna.features)
     - rfam_accession_number (default: None): the RFAM ID to export (corresponding to the line starting with #=GF AC)
     - family_id (default: None): the family ID to export (corresponding to the line starting with #=GF ID)
 
@@ -520,23 +474,21 @@ def to_stockholm(base_pairs, molecules, rfam_accession_number = None, family_id
     ------
     the Stockholm data as a String
     """
-    bn = to_bn(base_pairs, len(molecules[0]))
+    alignment = _to_alignment(base_pairs, molecules)
+    alignment_length = alignment.get_length()
+    bn = to_bn(base_pairs, alignment_length)
     lines = []
     lines.append("# STOCKHOLM 1.0")
     if rfam_accession_number:
         lines.append("#=GF AC %s"%rfam_accession_number)
     if family_id:
         lines.append("#=GF ID  %s"%family_id)
-    c = 0
-    alignment_length = len(bn)
-
-    while c < alignment_length:
-        d = min(alignment_length, c + 80)
-        for molecule in molecules:
-            lines.append("%s\t%s"%(molecule.name, molecule.sequence[c:d]))
-        lines.append("#=GC SS_cons\t%s"%bn[c:d])
+
+    for c in xrange(0, alignment_length, 80):
+        for name, row in zip(alignment.names, alignment.get_rows(c, c+80).tolist()):
+            lines.append("%s\t%s"%(name, row))
+        lines.append("#=GC SS_cons\t%s"%bn[c:c+80])
         lines.append("")
-        c += 80
 
     lines.append("//")
     return '\n'.join(lines)
@@ -547,83 +499,43 @@ def to_clustalw(base_pairs, molecules, curate = False):
     Parameters:
     ---------
     - base_pairs: a pandas Dataframe listing the base-pairs. This can be a consensus 2D.
-    - molecules: an list of Molecule objects (gapped or ungapped) (see pyrna.features)
-    - curate (default: False): remove the columns filled with gaps
+    - molecules: an list of Molecule objects (gapped or ungapped) or an Alignment object (see pyrna.features)
+    - curate (default: False): remove the columns filled with gaps. The base-pairs with a removed column are removed too, their partner columns becoming single-strands (otherwise the curated bracket notation would be unbalanced).
 
     Returns:
     ------
     the clustalw data as a String. The name of the molecules will be non-redundant and will not contain any spaces characters.
     """
+    alignment = _to_alignment(base_pairs, molecules)
+    if curate:
+        alignment = alignment.curate()
+    alignment_length = alignment.get_length()
+
+    names = []
+    name_counts = {}
+    for name in alignment.names:
+        name = name.replace(' ', '_') #molecule name without any space
+        if name_counts.has_key(name): #and non-redundant
+            names.append('%s.%i'%(name, name_counts[name]))
+        else:
+            names.append(name) #if already non-redundant, not .0 as suffix
+        name_counts[name] = name_counts.get(name, 0)+1
 
     sequence_lines = []
-    bn = to_bn(base_pairs, len(molecules[0]))
-    c = 0
-    gaps_positions = None
-    while c < len(molecules[0]):
-        names = []
-        for molecule in molecules:
-            if gaps_positions == None: #and not "if not gaps_positions:". The intersection of gap positions could lead to an empty set (no columns to remove in the alignment). And then, such condition would become true and we will restart with a list of positions corresponding to those of the next molecule processed!!
-                gaps_positions = set(molecule.get_gaps_positions())
-            else: #we search the same gap positions
-                gaps_positions = gaps_positions.intersection(molecule.get_gaps_positions())
-            d = min(len(molecule), c + 60)
-            name = molecule.name.replace(' ', '_') #molecule name without any space
-            if names.count(name): #and non-redundant
-                sequence_lines.append('%s.%i'%(name,names.count(name))+"\t"+molecule[c:d]+'\n')
-            else:
-                sequence_lines.append(name+"\t"+molecule[c:d]+'\n')#if already non-redundant, not .0 as suffix
-            names.append(name)
+    for c in xrange(0, alignment_length, 60):
+        for name, row in zip(names, alignment.get_rows(c, c+60).tolist()):
+            sequence_lines.append(name+"\t"+row+'\n')
         sequence_lines.append('\n')
-        c += 60
-
-    if curate:
-        sequence_lines = []
-        chars = list(molecules[0].sequence)
-        for pos in gaps_positions:
-            chars[pos]=""
-        curated_sequence = ''.join(chars)
-
-        c = 0
-        while c < len(curated_sequence):
-            names = []
-            for molecule in molecules:
-                chars = list(molecule.sequence)
-                for pos in gaps_positions:
-                    chars[pos]=""
-                curated_sequence = ''.join(chars)
-                d = min(len(curated_sequence), c + 60)
-                name = molecule.name.replace(' ', '_') #molecule name without any space
-                if names.count(name): #and non-redundant
-                    sequence_lines.append('%s.%i'%(name,names.count(name))+"\t"+curated_sequence[c:d]+'\n')
-                else:
-                    sequence_lines.append(name+"\t"+curated_sequence[c:d]+'\n') #if already non-redundant, not .0 as suffix
-                names.append(name)
-            sequence_lines.append('\n')
-            c += 60
-
-        chars = list(bn)
-
-        i = 0
-        left_positions = []
-        base_pairs = []
-        for char in chars:
-            if char == '(':
-                left_positions.append(i)
-            elif char == ')':
-                base_pairs.append([left_positions.pop(), i])
-            i+=1
-
-        for base_pair in base_pairs:
-            if base_pair[0] in gaps_positions or base_pair[1] in gaps_positions: #this means that one of the paired column will be removed, then the partner column becomes a single-strand (otherwise the curated bracket notation will be unbalanced)
-                chars[base_pair[0]] = '.'
-                chars[base_pair[1]] = '.'
-
-        for pos in gaps_positions:
-            chars[pos]=""
 
-        bn = ''.join(chars)
+    return ''.join(sequence_lines)+"2D\t"+to_bn(alignment.base_pairs, alignment_length)
 
-    return ''.join(sequence_lines)+"2D\t"+bn
+def _to_alignment(base_pairs, molecules):
+    """
+    Returns the Alignment object (see pyrna.features) made with the molecules and the base pairs given as arguments, the molecules being either a list of Molecule objects or an Alignment object.
+    """
+    if isinstance(molecules, Alignment):
+        return Alignment(molecules.names, molecules.matrix, base_pairs, molecules.molecule_type)
+    return Alignment.from_molecules(molecules, base_pairs)
 
 def to_bn(base_pairs, length):
     """
@@ -638,18 +550,14 @@ def to_bn(base_pairs, length):
     ------
     the bracket notation as a String
     """
-    bn = []
-    if not len(base_pairs): #its a pure single_strand fold
-        for pos in range(1, length+1):
-            bn.append('.')
-    else:
-        for pos in range(1, length+1):
-            if len(base_pairs.pos1[base_pairs.pos1 == pos]) != 0:
-                bn.append(base_pairs[base_pairs.pos1 == pos].edge1.values[0])
-            elif len(base_pairs.pos2[base_pairs.pos2 == pos]) != 0:
-                bn.append(base_pairs[base_pairs.pos2 == pos].edge2.values[0])
-            else:
-                bn.append('.')
+    bn = np.empty(length, dtype = object)
+    bn[:] = '.'
+    if len(base_pairs):
+        #the edges are scattered in the bracket notation, the first positions last since they prevail over the second ones
+        for positions, edges in [(base_pairs.pos2.values, base_pairs.edge2.values), (base_pairs.pos1.values, base_pairs.edge1.values)]:
+            positions, first_rows = np.unique(positions.astype(int), return_index = True) #for a position found in several base pairs, the first one prevails
+            in_molecule = (positions >= 1) & (positions <= length)
+            bn[positions[in_molecule]-1] = edges[first_rows[in_molecule]]
 
     return ''.join(bn)
 
@@ -681,8 +589,35 @@ def parse_genbank(genbank_data):
     - a column for each qualifier attached to the feature (/qualifier=)
     """
 
-    dnas = []
-    
+    lines = genbank_data.strip().split('\n')
+    if not lines[-1].strip() == '//':
+        raise Exception("Uncomplete file")
+    return [(dna, DataFrame(features)) for dna, features in _genbank_records(lines)]
+
+def iter_genbank(genbank):
+    """
+    Parse Genbank data one record at a time, without loading the whole data in memory.
+
+    Parameters:
+    ---------
+    - genbank: the path of a Genbank file (gzipped if its name ends with .gz) or a file-like object
+
+    Returns:
+    ------
+    a generator of (DNA object (see pyrna.features), list of genomic features) tuples. Each genomic feature is a dict, so that the pandas Dataframe returned by parse_genbank() is only built if needed, with DataFrame(features).
+    """
+    handle = _open_data(genbank)
+    try:
+        for record in _genbank_records(line.rstrip('\r\n') for line in handle):
+            yield record
+    finally:
+        if handle is not genbank:
+            handle.close()
+
+def _genbank_records(lines):
+    """
+    Parse the lines of Genbank data and yield a (DNA object, list of genomic features) tuple for each record ending with '//'.
+    """
     pieces_of_seq=[]
     start_of_sequence = False
     accession = None
@@ -697,13 +632,13 @@ def parse_genbank(genbank_data):
     inOrganism = False
     lineage = ""
     location = None
-    lines = genbank_data.strip().split('\n')
-    if not lines[-1].strip() == '//':
-        raise Exception("Uncomplete file")
     for line in lines:
+        if start_of_sequence and not line.startswith('//'): #the bulk of the data, parsed without any regular expression
+            pieces_of_seq.append(_sequence_residues(line))
+            continue
         tokens = re.split('\s+', line)
         if line.startswith('//'):
-            dna = DNA( name = accession, sequence=''.join(pieces_of_seq))
+            dna = DNA( name = accession, sequence=''.join(pieces_of_seq).upper())
             dna.lineage = lineage.strip()
             if organism:
                 dna.organism = organism
@@ -713,9 +648,9 @@ def parse_genbank(genbank_data):
                     if feature['genomicStrand'] == '+':
                         feature['sequence'] = dna.sequence[feature['genomicPositions'][0]-1:feature['genomicPositions'][-1]]
                     else:
-                        feature['sequence'] = DNA(name = dna.name, sequence = dna.sequence[feature['genomicPositions'][0]-1:feature['genomicPositions'][-1]]).get_complement()[::-1]
+                        feature['sequence'] = dna.reverse_complement(feature['genomicPositions'][0]-1, feature['genomicPositions'][-1])
             
-            dnas.append((dna,DataFrame(features)))
+            yield dna, features
             
             #fresh restart if several sequences stored in the file
             pieces_of_seq=[]
@@ -919,12 +854,11 @@ def parse_genbank(genbank_data):
             qualifier_content += " "+line.strip().replace('"','')
         elif line.startswith('//'): #end of the genomic sequence
             start_of_sequence = False
-        elif start_of_sequence:
-            pieces_of_seq.append(''.join(re.split('\s+',line.strip())[1:]).upper())
         elif inOrganism:
             lineage += " "+line.strip()
 
-    return dnas
+    if accession or pieces_of_seq or features or feature_type:
+        raise Exception("Uncomplete file")
 
 def parse_embl(embl_data):
     """
@@ -944,6 +878,36 @@ def parse_embl(embl_data):
     - a column for each qualifier attached to the feature (/qualifier=)
     """
 
+    lines = embl_data.strip().split('\n')
+    if not lines[-1].strip() == '//':
+        raise Exception("Uncomplete file")
+    dna, features = list(_embl_records(lines))[-1]
+    return dna, DataFrame(features)
+
+def iter_embl(embl):
+    """
+    Parse EMBL data one record at a time, without loading the whole data in memory.
+
+    Parameters:
+    ---------
+    - embl: the path of an EMBL file (gzipped if its name ends with .gz) or a file-like object
+
+    Returns:
+    ------
+    a generator of (DNA object (see pyrna.features), list of genomic features) tuples. Each genomic feature is a dict, so that the pandas Dataframe returned by parse_embl() is only built if needed, with DataFrame(features).
+    """
+    handle = _open_data(embl)
+    try:
+        for record in _embl_records(line.rstrip('\r\n') for line in handle):
+            yield record
+    finally:
+        if handle is not embl:
+            handle.close()
+
+def _embl_records(lines):
+    """
+    Parse the lines of EMBL data and yield a (DNA object, list of genomic features) tuple for each record ending with '//'.
+    """
     pieces_of_seq=[]
     start_of_sequence = False
     accession = None
@@ -957,10 +921,42 @@ def parse_embl(embl_data):
     organism = None
     location = None
     lineage = ""
-    lines = embl_data.strip().split('\n')
-    if not lines[-1].strip() == '//':
-        raise Exception("Uncomplete file")
     for line in lines:
+        if line.startswith('//'): #end of the record
+            dna = DNA( name = accession, sequence=''.join(pieces_of_seq).upper())
+            tokens = lineage.split('; ')
+            dna.lineage = '; '.join(tokens[:-2])+'.'
+
+            if organism:
+                dna.organism = organism
+
+            for feature in features:
+                if feature.has_key('ncRNA_class'):
+                    if feature['genomicStrand'] == '+':
+                        feature['sequence'] = dna.sequence[feature['genomicPositions'][0]-1:feature['genomicPositions'][-1]]
+                    else:
+                        feature['sequence'] = dna.reverse_complement(feature['genomicPositions'][0]-1, feature['genomicPositions'][-1])
+
+            yield dna, features
+
+            #fresh restart if several records stored in the file
+            pieces_of_seq=[]
+            start_of_sequence = False
+            accession = None
+            feature_type = None
+            qualifer_type = None
+            qualifier_content = None
+            qualifiers = []
+            genomic_strand = '+'
+            genomic_positions = None
+            features = []
+            organism = None
+            location = None
+            lineage = ""
+            continue
+        elif start_of_sequence: #the bulk of the data, parsed without any regular expression
+            pieces_of_seq.append(_sequence_residues(line))
+            continue
         tokens = re.split('\s+', line)
         if line.startswith('AC'):
             accession = re.split('\s+', line)[-1]
@@ -1143,27 +1139,20 @@ def parse_embl(embl_data):
             location += tokens[1].strip()
         elif not start_of_sequence and qualifer_type and qualifier_content : # still the content of the current qualifier
             qualifier_content += " "+line.strip().replace('"','')
-        elif line.startswith('//'): #end of the genomic sequence
-            start_of_sequence = False
-        elif start_of_sequence:
-            pieces_of_seq.append(''.join(re.split('\s+',line.strip())[:-1]).upper())
-
-    dna = DNA( name = accession, sequence=''.join(pieces_of_seq))
-
-    tokens = lineage.split('; ')
-    dna.lineage = '; '.join(tokens[:-2])+'.'
 
-    if organism:
-        dna.organism = organism
+    if accession or pieces_of_seq or features or feature_type:
+        raise Exception("Uncomplete file")
 
-    for feature in features:
-        if feature.has_key('ncRNA_class'):
-            if feature['genomicStrand'] == '+':
-                feature['sequence'] = dna.sequence[feature['genomicPositions'][0]-1:feature['genomicPositions'][-1]]
-            else:
-                feature['sequence'] = DNA(name = dna.name, sequence = dna.sequence[feature['genomicPositions'][0]-1:feature['genomicPositions'][-1]]).get_complement()[::-1]
+_sequence_deletions = string.digits+string.whitespace #the positions and blanks around the residues in the sequence lines of Genbank and EMBL data
+_unicode_sequence_deletions = dict((ord(c), None) for c in _sequence_deletions)
 
-    return dna, DataFrame(features)
+def _sequence_residues(line):
+    """
+    Returns the residues of a sequence line of Genbank or EMBL data, without their positions and blanks.
+    """
+    if isinstance(line, unicode):
+        return line.translate(_unicode_sequence_deletions)
+    return line.translate(None, _sequence_deletions)
 
 def parse_rnaml(rnaml_data, canonical_only = False):
     """
@@ -1178,93 +1167,117 @@ def parse_rnaml(rnaml_data, canonical_only = False):
     ------
     a list of SecondaryStructure objects (see pyrna.features)
     """
+    from cStringIO import StringIO
     secondary_structures = []
-    import xml.etree.ElementTree as ET
-    rnaml_tree = ET.fromstring(rnaml_data)
-
-    for molecule in rnaml_tree.findall('molecule'):
-
-        rna = RNA(name = molecule.get('id'), sequence = re.sub('\s+','', molecule.find('sequence').find('seq-data').text))
-
-        secondary_structure = SecondaryStructure(rna)
 
-        if not canonical_only:
-
-            for helix in molecule.find('structure').find('model').find('str-annotation').findall('helix'):
-                secondary_structure.add_helix(helix.get('id'), int(helix.find('base-id-5p').find('base-id').find('position').text), int(helix.find('base-id-3p').find('base-id').find('position').text), int(helix.find('length').text));
-
-            #for single_strand in molecule.find('structure').find('model').find('str-annotation').findall('single-strand'):
-            #    end5 = int(single_strand.find('segment').find('base-id-5p').find('base-id').find('position').text)
-            #    end3 = int(single_strand.find('segment').find('base-id-3p').find('base-id').find('position').text)
-            #    secondary_structure.add_single_strand(single_strand.find('segment').find('seg-name').text, end5, end3-end5+1);
-
-            for base_pair in molecule.find('structure').find('model').find('str-annotation').findall('base-pair'):
-                edge1 = '('
-                edge2 = ')'
-                if base_pair.find('edge-5p').text == 'H':
-                    edge1 = '['
-                elif base_pair.find('edge-5p').text == 'S':
-                    edge1 = '{'
-                elif base_pair.find('edge-5p').text == 's':
-                    edge1 = '{'
-                elif base_pair.find('edge-5p').text == '!':
-                    edge1 = '!'
+    for molecule in iter_rnaml(StringIO(rnaml_data)):
+        rna = RNA(name = molecule['id'], sequence = molecule['sequence'])
+        base_pairs = molecule['base_pairs']
+        base_pairs['orientation'] = [orientation.upper() for orientation in base_pairs['orientation']]
+        secondary_structure = rnaml_base_pairs_to_secondary_structure(rna, molecule['helices'], base_pairs, canonical_only = canonical_only)
+        secondary_structure.find_single_strands()
+        secondary_structures.append(secondary_structure)
 
-                if base_pair.find('edge-3p').text == 'H':
-                    edge2 = ']'
-                elif base_pair.find('edge-3p').text == 'S':
-                    edge2 = '}'
-                elif base_pair.find('edge-3p').text == 's':
-                    edge2 = '}'
-                elif base_pair.find('edge-3p').text == '!':
-                    edge2 = '!'
+    return secondary_structures
 
-                secondary_structure.add_base_pair(base_pair.find('bond-orientation').text.upper(), edge1, edge2, int(base_pair.find('base-id-5p').find('base-id').find('position').text), int(base_pair.find('base-id-3p').find('base-id').find('position').text));
+def iter_rnaml(rnaml):
+    """
+    Parse RNAML data one molecule at a time. The XML elements are read with iterparse() and freed once read, so that the whole XML tree is never in memory.
 
-        else:
-            canonical_bps = []
-            non_canonical_bps = []
-            for base_pair in molecule.find('structure').find('model').find('str-annotation').findall('base-pair'):
-                edge1 = '('
-                edge2 = ')'
-                if base_pair.find('edge-5p').text == 'H':
-                    edge1 = '['
-                elif base_pair.find('edge-5p').text == 'S':
-                    edge1 = '{'
-                elif base_pair.find('edge-5p').text == 's':
-                    edge1 = '{'
-                elif base_pair.find('edge-5p').text == '!':
-                    edge1 = '!'
-
-                if base_pair.find('edge-3p').text == 'H':
-                    edge2 = ']'
-                elif base_pair.find('edge-3p').text == 'S':
-                    edge2 = '}'
-                elif base_pair.find('edge-3p').text == 's':
-                    edge2 = '}'
-                elif base_pair.find('edge-3p').text == '!':
-                    edge2 = '!'
-
-                orientation = base_pair.find('bond-orientation').text.upper()
-
-                pos1 = int(base_pair.find('base-id-5p').find('base-id').find('position').text)
-                residue1 = secondary_structure.rna.sequence[pos1-1]
-                pos2 = int(base_pair.find('base-id-3p').find('base-id').find('position').text)
-                residue2 = secondary_structure.rna.sequence[pos2-1]
-
-                canonical_bps.append([orientation, edge1, edge2, pos1, pos2]) if utils.is_canonical(residue1, residue2, orientation, edge1, edge2) else non_canonical_bps.append([orientation, edge1, edge2, pos1, pos2])
-
-            secondary_structure = base_pairs_to_secondary_structure(secondary_structure.rna, DataFrame(canonical_bps, columns=['orientation', 'edge1', 'edge2', 'pos1', 'pos2']))
-
-            for bp in non_canonical_bps: #the non-canonical interactions are tertiary ones
-                secondary_structure.add_tertiary_interaction(bp[0], bp[1], bp[2], bp[3], bp[4])
+    Parameters:
+    ---------
+    - rnaml: the path of an RNAML file (gzipped if its name ends with .gz) or a file-like object
 
-        secondary_structure.find_single_strands()
+    Returns:
+    ------
+    a generator of dicts, one for each molecule, with the keys:
+    - 'id': the id of the molecule
+    - 'sequence': the sequence as a String
+    - 'numbering_table': the content of the numbering-table element (None if not found)
+    - 'helices': the helices of the secondary structure as (name, start, end, length) tuples
+    - 'base_pairs': the base pairs of the secondary structure in a pandas Dataframe (columns orientation, edge1, edge2, pos1 and pos2), made with numpy arrays. The orientations are the ones of the RNAML data.
+    """
+    import xml.etree.cElementTree as ET
+    handle = _open_data(rnaml)
+    try:
+        tags = [] #the tags and elements still open
+        elements = []
+        molecule = None
+        for event, element in ET.iterparse(handle, events = ('start', 'end')):
+            if event == 'start':
+                tags.append(element.tag)
+                elements.append(element)
+                if len(tags) == 2 and element.tag == 'molecule':
+                    molecule = {'id': element.get('id'), 'sequence': None, 'numbering_table': None, 'helices': [], 'base_pairs': ([], [], [], [], [])}
+                continue
+            tags.pop()
+            elements.pop()
+            if molecule is None:
+                continue
+            if tags[1:] == ['molecule', 'structure', 'model', 'str-annotation']:
+                if element.tag == 'helix':
+                    molecule['helices'].append((element.get('id'), int(element.findtext('base-id-5p/base-id/position')), int(element.findtext('base-id-3p/base-id/position')), int(element.findtext('length'))))
+                elif element.tag == 'base-pair':
+                    orientations, edges1, edges2, positions1, positions2 = molecule['base_pairs']
+                    orientations.append(element.findtext('bond-orientation'))
+                    edges1.append(element.findtext('edge-5p'))
+                    edges2.append(element.findtext('edge-3p'))
+                    positions1.append(int(element.findtext('base-id-5p/base-id/position')))
+                    positions2.append(int(element.findtext('base-id-3p/base-id/position')))
+                del elements[-1][-1] #an element is the last child of its parent when it ends
+            elif tags[1:] == ['molecule', 'sequence'] and molecule['sequence'] is None and element.tag == 'seq-data':
+                molecule['sequence'] = re.sub('\s+', '', element.text)
+            elif tags[1:] == ['molecule', 'sequence'] and molecule['numbering_table'] is None and element.tag == 'numbering-table':
+                molecule['numbering_table'] = element.text
+            elif len(tags) == 1 and element.tag == 'molecule':
+                orientations, edges1, edges2, positions1, positions2 = molecule['base_pairs']
+                molecule['base_pairs'] = DataFrame({
+                    'orientation': np.array(orientations, dtype = object),
+                    'edge1': _rnaml_edges(edges1, 0),
+                    'edge2': _rnaml_edges(edges2, 1),
+                    'pos1': np.array(positions1, dtype = np.int64),
+                    'pos2': np.array(positions2, dtype = np.int64)
+                }, columns = ['orientation', 'edge1', 'edge2', 'pos1', 'pos2'])
+                del elements[-1][-1]
+                yield molecule
+                molecule = None
+    finally:
+        if handle is not rnaml:
+            handle.close()
+
+_rnaml_edge_symbols = {'H': ('[', ']'), 'S': ('{', '}'), 's': ('{', '}'), '!': ('!', '!')} #the (5', 3') symbols for the RNAML edges, the other edges being '(' and ')'
+
+def _rnaml_edges(edges, side):
+    """
+    Returns the symbols of the RNAML edges given as argument as a numpy array, the side being 0 for the 5' edges and 1 for the 3' ones.
+    """
+    if not edges:
+        return np.empty(0, dtype = object)
+    distinct_edges, indexes = np.unique(np.array([edge or '' for edge in edges], dtype = object), return_inverse = True)
+    return np.array([_rnaml_edge_symbols.get(edge, ('(', ')'))[side] for edge in distinct_edges], dtype = object)[indexes]
 
-        secondary_structures.append(secondary_structure)
+def rnaml_base_pairs_to_secondary_structure(rna, helices, base_pairs, canonical_only = False):
+    """
+    Parameters:
+    ---------
+    - rna: an RNA object (see pyrna.features)
+    - helices: the helices of RNAML data as (name, start, end, length) tuples (see iter_rnaml())
+    - base_pairs: the base pairs of RNAML data in a pandas Dataframe (see iter_rnaml())
+    - canonical_only (default: False): if True, the helices will be made exclusively with canonical base-pairs: AU c( ), GC c( ) or GU c( ). The other base-pairs are tertiary interactions.
 
-    return secondary_structures
+    Returns:
+    ------
+    a SecondaryStructure object (see pyrna.features)
+    """
+    if not canonical_only:
+        return SecondaryStructure.from_base_pairs(rna, base_pairs, helices = helices)
 
+    canonicals = np.array([utils.is_canonical(rna.sequence[pos1-1], rna.sequence[pos2-1], orientation, edge1, edge2) for orientation, edge1, edge2, pos1, pos2 in zip(base_pairs['orientation'], base_pairs['edge1'], base_pairs['edge2'], base_pairs['pos1'].tolist(), base_pairs['pos2'].tolist())], dtype = bool)
+    secondary_structure = base_pairs_to_secondary_structure(rna, base_pairs[canonicals])
+    non_canonicals = base_pairs[~canonicals]
+    for orientation, edge1, edge2, pos1, pos2 in zip(non_canonicals['orientation'], non_canonicals['edge1'], non_canonicals['edge2'], non_canonicals['pos1'].tolist(), non_canonicals['pos2'].tolist()): #the non-canonical interactions are tertiary ones
+        secondary_structure.add_tertiary_interaction(orientation, edge1, edge2, pos1, pos2)
+    return secondary_structure
 
 def parse_fasta(fasta_data, type='RNA'):
     """
@@ -1279,37 +1292,316 @@ def parse_fasta(fasta_data, type='RNA'):
     ------
     a list of RNA, DNA or Protein objects (according to the value of the parameter type) (see pyrna.features)
     """
-    molecules = []
-    pieces = []
-    molecule_name = None
-    for line in fasta_data.split('\n'):
-        if re.match('>',line):
-            if molecule_name and len(pieces) > 0:
-                if type == 'RNA':
-                    m = RNA(sequence = ''.join(pieces), name = molecule_name.strip())
-                elif type == 'DNA':
-                    m = DNA(sequence = ''.join(pieces), name = molecule_name.strip())
-                elif type == 'Protein':
-                    m = Protein(sequence = ''.join(pieces), name = molecule_name.strip())
-                    if ''.join(pieces) != m.sequence:
-                        sys.exit()
-                if m != None:
-                    molecules.append(m)
-            molecule_name = line[1:]
-            pieces = []
+    from cStringIO import StringIO
+    return list(iter_fasta(StringIO(fasta_data), type = type))
+
+def iter_fasta(fasta, type = 'RNA', mmap = False):
+    """
+    Parse FASTA data one molecule at a time, without loading the whole data in memory.
+
+    Parameters:
+    ---------
+    - fasta: the path of a FASTA file (gzipped if its name ends with .gz) or a file-like object
+    - type (default: 'RNA'): can be equal to 'DNA', 'RNA' or 'Protein'
+    - mmap (default: False): if True, the file is memory-mapped and its sequences are not read. Only the byte offsets of each sequence are recorded. Not available for gzipped files.
+
+    Returns:
+    ------
+    a generator of RNA, DNA or Protein objects (according to the value of the parameter type) (see pyrna.features). With mmap, a generator of (name, MappedSequence) tuples, the sequences being read only when sliced.
+    """
+    molecule_types = {'RNA': RNA, 'DNA': DNA, 'Protein': Protein}
+    if not molecule_types.has_key(type):
+        raise Exception("Unknown molecule type %s"%type)
+    molecule_type = molecule_types[type]
+    handle = _open_data(fasta, mmap = mmap)
+    try:
+        if mmap:
+            for name, length, offset, line_bases, line_width in _scan_fasta(handle):
+                if name and length:
+                    yield name, MappedSequence(handle, offset, length, line_bases, line_width)
+            return
+        molecule_name = None
+        pieces = []
+        line = ''
+        for line in handle:
+            if line.startswith('>'):
+                if molecule_name and len(pieces) > 0:
+                    yield molecule_type(sequence = ''.join(pieces), name = molecule_name)
+                molecule_name = line[1:].strip() #a record without name is skipped
+                pieces = []
+            else:
+                pieces.append(line.strip().upper())
+        if line.endswith('\n'): #like with the lines of fasta_data.split('\n'), the data ends with an empty line
+            pieces.append('')
+        #last molecule
+        if molecule_name and len(pieces) > 0:
+            yield molecule_type(sequence = ''.join(pieces), name = molecule_name)
+    finally:
+        if not mmap and handle is not fasta:
+            handle.close()
+
+def _open_data(data, mmap = False):
+    """
+    Returns a buffered file-like object (or a memory map if mmap is True) over data in any format given as a file path (gzipped if it ends with .gz) or as a file-like object, which is returned as is. This is the opener of all the streaming readers (iter_fasta(), iter_stockholm(), iter_pdb(),...): a caller closes the object returned only if it is not the one given as argument.
+    """
+    import gzip, io
+    if isinstance(data, basestring):
+        if data.endswith('.gz'):
+            if mmap:
+                raise Exception("A gzipped file cannot be memory-mapped")
+            return io.BufferedReader(gzip.open(data, 'rb'))
+        if not mmap:
+            return open(data, 'rb')
+        with open(data, 'rb') as handle:
+            return _mmap_file(handle)
+    if mmap:
+        return _mmap_file(data)
+    return data
+
+def _mmap_file(handle):
+    import mmap, os
+    if not os.fstat(handle.fileno()).st_size:
+        return ''
+    return mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ)
+
+def _scan_fasta(data):
+    """
+    Scan FASTA data to record the layout of each sequence, without reading the sequences line by line (each sequence must be made with lines of the same length, except the last one).
+
+    Parameters:
+    ---------
+    - data: the FASTA data as a String or a memory map
+
+    Returns:
+    ------
+    a generator of (name, length, offset, line_bases, line_width) tuples, like the lines of a FASTA index (.fai) file: the sequence length, the byte offset of its first residue, the number of residues per line and the number of bytes per line (newline included).
+    """
+    size = len(data)
+    position = 0 if data[:1] == '>' else data.find('\n>') #the first header
+    if position == -1:
+        return
+    elif data[position] == '\n':
+        position += 1
+    while position != -1:
+        end = data.find('\n', position)
+        if end == -1:
+            end = size
+        name = data[position+1:end].strip()
+        next_header = data.find('\n>', end) if end < size else -1
+        offset, sequence_end = min(end+1, size), size if next_header == -1 else next_header
+        while offset < sequence_end and data[offset] in '\r\n': #blank lines before the sequence
+            offset += 1
+        while sequence_end > offset and data[sequence_end-1] in '\r\n': #newlines after the sequence
+            sequence_end -= 1
+        first_line_end = data.find('\n', offset, sequence_end)
+        if offset >= sequence_end:
+            yield (name, 0, offset, 0, 0)
+        elif first_line_end == -1: #a single line
+            length = sequence_end-offset
+            yield (name, length, offset, length, length+(2 if data[sequence_end:sequence_end+2] == '\r\n' else 1))
         else:
-            pieces.append(line.strip().upper())
-    #last molecule
-    if molecule_name and len(pieces) > 0:
-        if type == 'RNA':
-            m = RNA(sequence = ''.join(pieces), name = molecule_name.strip())
-        elif type == 'DNA':
-            m = DNA(sequence = ''.join(pieces), name = molecule_name.strip())
-        elif type == 'Protein':
-            m = Protein(sequence = ''.join(pieces), name = molecule_name.strip())
-        if m != None:
-            molecules.append(m)
-    return molecules
+            line_width = first_line_end+1-offset
+            line_bases = len(data[offset:first_line_end+1].rstrip('\r\n'))
+            newlines = 0
+            for start in xrange(offset, sequence_end, 1<<24): #each newline has to end a line of line_width bytes
+                block = np.frombuffer(data, dtype = np.uint8, count = min(1<<24, sequence_end-start), offset = start)
+                newline_positions = np.flatnonzero(block == ord('\n'))+start
+                if (newline_positions != offset+(newlines+1+np.arange(len(newline_positions)))*line_width-1).any():
+                    raise Exception("Different line length in sequence '%s'"%name)
+                newlines += len(newline_positions)
+            last_line_bases = sequence_end-offset-newlines*line_width
+            if not 0 < last_line_bases <= line_bases:
+                raise Exception("Different line length in sequence '%s'"%name)
+            yield (name, newlines*line_bases+last_line_bases, offset, line_bases, line_width)
+        position = next_header if next_header == -1 else next_header+1
+
+class MappedSequence(object):
+    """
+    A sequence stored in a FASTA file and read on demand through a memory map. It can be sliced like a String (the residues are returned upper-cased, like with parse_fasta()).
+    """
+
+    def __init__(self, data, offset, length, line_bases, line_width):
+        """
+        Parameters:
+        ---------
+        - data: the FASTA data as a memory map (or a String)
+        - offset: the byte offset of the first residue
+        - length: the number of residues
+        - line_bases: the number of residues per line
+        - line_width: the number of bytes per line (newline included)
+        """
+        self.data = data
+        self.offset = offset
+        self.length = length
+        self.line_bases = line_bases
+        self.line_width = line_width
+
+    def __byte_offset(self, i):
+        return self.offset + (i/self.line_bases)*self.line_width + i%self.line_bases
+
+    def get_residues(self, start, end):
+        """
+        Returns:
+        ------
+        the residues from the 0-based start (included) to the end (excluded) as a String
+        """
+        start, end = max(0, start), min(self.length, end)
+        if start >= end:
+            return ''
+        return self.data[self.__byte_offset(start):self.__byte_offset(end-1)+1].translate(None, '\r\n').upper()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, end, step = i.indices(self.length)
+            if step == 1:
+                return self.get_residues(start, end)
+            return self.get_residues(0, self.length)[i]
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError("sequence index out of range")
+        return self.get_residues(i, i+1)
+
+    def __getslice__(self, i, j):
+        return self.get_residues(i, j)
+
+    def __iter__(self):
+        for start in xrange(0, self.length, self.line_bases):
+            for residue in self.get_residues(start, start+self.line_bases):
+                yield residue
+
+    def __str__(self):
+        return self.get_residues(0, self.length)
+
+    def windows(self, window_size, overlap = 0):
+        """
+        Parameters:
+        ---------
+        - window_size: the number of residues per window
+        - overlap (default: 0): the number of residues shared by two consecutive windows
+
+        Returns:
+        ------
+        a generator of (start, residues) tuples, start being the 0-based position of the window. Only one window is read at a time. The last window ends with the sequence and can be shorter.
+        """
+        if not 0 <= overlap < window_size:
+            raise Exception("The overlap has to be lower than the window size")
+        start = 0
+        while True:
+            yield start, self.get_residues(start, start+window_size)
+            if start+window_size >= self.length:
+                break
+            start += window_size-overlap
+
+class IndexedFasta(object):
+    """
+    Random access to the sequences of a FASTA file, through a FASTA index (.fai) compatible with samtools faidx. The sequences are read from a memory map only when sliced, so that large genomes are never loaded in memory.
+
+        genome = IndexedFasta("genome.fasta")["chrI"]
+        genome[1000:1300]
+    """
+
+    def __init__(self, fasta_file, index_file = None):
+        """
+        Parameters:
+        ---------
+        - fasta_file: the path of the (uncompressed) FASTA file
+        - index_file (default: None): the path of the index. If None, the index is fasta_file+'.fai'. The index is built (and written if possible) if it doesn't exist or if it is older than the FASTA file.
+        """
+        import os
+        if fasta_file.endswith('.gz'):
+            raise Exception("A gzipped file cannot be indexed")
+        self.fasta_file = fasta_file
+        self.index_file = index_file if index_file else fasta_file+'.fai'
+        self.names = [] #the sequence names, in the order of the FASTA file
+        self.index = {} #the keys are the sequence names, the values the (length, offset, line_bases, line_width) tuples
+        self.data = _open_data(fasta_file, mmap = True)
+        if os.path.exists(self.index_file) and os.path.getmtime(self.index_file) >= os.path.getmtime(fasta_file):
+            self.__read_index()
+        else:
+            self.__build_index()
+            try:
+                self.write_index()
+            except IOError: #a read-only location, the index stays in memory
+                pass
+
+    def __read_index(self):
+        with open(self.index_file) as handle:
+            for line in handle:
+                tokens = line.rstrip('\r\n').split('\t')
+                if len(tokens) >= 5:
+                    self.__add_entry(tokens[0], *[int(token) for token in tokens[1:5]])
+
+    def __build_index(self):
+        for name, length, offset, line_bases, line_width in _scan_fasta(self.data):
+            self.__add_entry(name.split()[0] if name else name, length, offset, line_bases, line_width) #like samtools, the name stops at the first whitespace
+
+    def __add_entry(self, name, length, offset, line_bases, line_width):
+        if self.index.has_key(name):
+            raise Exception("Duplicate sequence name %s in %s"%(name, self.fasta_file))
+        self.names.append(name)
+        self.index[name] = (length, offset, line_bases, line_width)
+
+    def write_index(self, index_file = None):
+        """
+        Write the index in the .fai format.
+
+        Parameters:
+        ---------
+        - index_file (default: None): the path of the index file. If None, the index is written in self.index_file
+        """
+        with open(index_file if index_file else self.index_file, 'w') as handle:
+            for name in self.names:
+                handle.write("%s\t%i\t%i\t%i\t%i\n"%((name,)+self.index[name]))
+
+    def get_sequence(self, name):
+        """
+        Returns:
+        ------
+        the sequence as a MappedSequence object, read only when sliced
+        """
+        length, offset, line_bases, line_width = self.index[name]
+        return MappedSequence(self.data, offset, length, line_bases, line_width)
+
+    def get_molecule(self, name, start = 0, end = None, type = 'DNA'):
+        """
+        Parameters:
+        ---------
+        - name: the sequence name
+        - start (default: 0): the 0-based start of the region (included)
+        - end (default: None): the 0-based end of the region (excluded). If None, the region goes until the end of the sequence
+        - type (default: 'DNA'): can be equal to 'DNA', 'RNA' or 'Protein'
+
+        Returns:
+        ------
+        the region as a DNA, RNA or Protein object (see pyrna.features)
+        """
+        molecule_types = {'RNA': RNA, 'DNA': DNA, 'Protein': Protein}
+        sequence = self.get_sequence(name)
+        return molecule_types[type](sequence = sequence.get_residues(start, len(sequence) if end is None else end), name = name)
+
+    def windows(self, name, window_size, overlap = 0):
+        """
+        Returns:
+        ------
+        a generator of (start, residues) tuples over the windows of a sequence (see MappedSequence.windows())
+        """
+        return self.get_sequence(name).windows(window_size, overlap)
+
+    def __getitem__(self, name):
+        return self.get_sequence(name)
+
+    def __contains__(self, name):
+        return self.index.has_key(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
 
 def parse_vienna(vienna_data):
     """
@@ -1329,7 +1621,7 @@ def parse_vienna(vienna_data):
     current_bn = []
     current_sequence = []
     for line in vienna_data.split('\n'):
-        if re.match('^[\.()\{\}\[\]]+$', line):
+        if re.match('^[\.()\{\}\[\]<>]+$', line):
             current_bn.append(line)
         elif re.match('^>', line):
             if len(current_sequence):
@@ -1349,34 +1641,78 @@ def parse_vienna(vienna_data):
             secondary_structures.append(parse_bn(''.join(current_bn)))
     return rnas, secondary_structures
 
-def parse_bn(bn):
+def _bn_alphabet():
+    """
+    Returns the lookup tables used by parse_bn(): for each byte, the kind of bracket (-1 for unpaired symbols) and the depth change (+1 for an opening bracket, -1 for a closing one).
     """
-    Parse a bracket notation. The function supports characters like '(', ')', '[', ']', '{' and '}'
+    kinds = np.full(256, -1, dtype=np.int8)
+    deltas = np.zeros(256, dtype=np.int8)
+    #the brackets of the extended dot-bracket notation and of WUSS, then the WUSS pseudoknot letters (Aa, Bb, ...)
+    for kind, (opening, closing) in enumerate(zip('([{<'+string.ascii_uppercase, ')]}>'+string.ascii_lowercase)):
+        kinds[ord(opening)] = kinds[ord(closing)] = kind
+        deltas[ord(opening)] = 1
+        deltas[ord(closing)] = -1
+    return kinds, deltas
+
+_bn_kinds, _bn_deltas = _bn_alphabet()
+#the edges stored in the base-pairs: '<>' are nested pairs like '()' and the pseudoknot letters are stored like '[]'
+_bn_edges = maketrans('<>'+string.ascii_uppercase+string.ascii_lowercase, '()'+'['*26+']'*26)
+
+def parse_bn(bn, pair_table = False):
+    """
+    Parse a bracket notation in one pass. The function supports the extended dot-bracket notation ('()', '[]', '{}' and '<>') and the WUSS notation used by Rfam (the same brackets and the pseudoknot letters 'Aa', 'Bb', ..., 'Zz'). Each kind of bracket is matched with its own partner, so that pseudoknots are recovered. Any other character (like '.', ',', '_', '-', ':' or '~') is an unpaired position.
 
     Parameters:
     ---------
      - bn: the bracket notation as a String
+     - pair_table (default: False): if True, returns the base pairs as a pair table instead of a pandas Dataframe
 
     Returns:
     ------
-    a pandas Dataframe listing the base pairs. Returns an empty Dataframe if no base-pairs are found.
-    """
+    a pandas Dataframe listing the base pairs, ordered by their 3' position. The edges '<>' are stored as '()' and the pseudoknot letters as '[]'. Returns an empty Dataframe if no base-pairs are found.
 
-    i = 0
-    lastPairedPos = []
-    lastPairedSymbol = []
-    basePairs = []
-
-    for s in list(bn):
-        i+=1
-        if s in ['(','{','[']:
-            lastPairedPos.append(i)
-            lastPairedSymbol.append(s)
-        elif s in [')','}',']']:
-            basePairs.append(['c', lastPairedSymbol.pop(), s, lastPairedPos.pop(), i])
-
-    if len(basePairs):
-        return DataFrame(basePairs, columns=['orientation', 'edge1', 'edge2', 'pos1', 'pos2'])
+    If pair_table is True, returns a numpy int32 array of size len(bn)+1. Like in the Vienna package, the cell 0 stores the length of the molecule and the cell i stores the position paired with the residue i (0 if unpaired).
+    """
+    bn = str(bn)
+    codes = np.frombuffer(bn, dtype=np.uint8)
+    table = np.zeros(len(codes)+1, dtype=np.int32)
+    table[0] = len(codes)
+
+    positions = np.flatnonzero(_bn_deltas[codes])
+    if len(positions):
+        #the brackets are grouped by kind, each group keeping the order of the notation
+        kinds = _bn_kinds[codes[positions]]
+        order = np.argsort(kinds, kind = 'mergesort')
+        positions, kinds = positions[order], kinds[order]
+        deltas = _bn_deltas[codes[positions]].astype(np.int32)
+        group_starts = np.flatnonzero(np.concatenate(([True], kinds[1:] != kinds[:-1])))
+        depths = np.cumsum(deltas)
+        depths -= np.repeat(depths[group_starts]-deltas[group_starts], np.diff(np.append(group_starts, len(kinds)))) #the depth reached after each bracket in its own group
+        if (depths < 0).any():
+            raise Exception("Unbalanced bracket notation: too many closing brackets")
+        opening = deltas > 0
+        levels = np.where(opening, depths, depths+1)
+        #an opening bracket is paired with the closing bracket that follows it at the same level of the same kind
+        order = np.lexsort((positions, levels, kinds))
+        positions, levels, kinds, opening = positions[order], levels[order], kinds[order], opening[order]
+        paired = opening[:-1] & ~opening[1:] & (levels[:-1] == levels[1:]) & (kinds[:-1] == kinds[1:])
+        table[positions[:-1][paired]+1] = positions[1:][paired]+1
+        table[positions[1:][paired]+1] = positions[:-1][paired]+1
+
+    if pair_table:
+        return table
+
+    positions2 = np.flatnonzero((table[1:] != 0) & (table[1:] < np.arange(1, len(table))))+1
+    if len(positions2):
+        positions1 = table[positions2].astype(np.int64)
+        edges = np.frombuffer(bn.translate(_bn_edges), dtype='S1')
+        return DataFrame({
+            'orientation': ['c']*len(positions2),
+            'edge1': edges[positions1-1].tolist(),
+            'edge2': edges[positions2-1].tolist(),
+            'pos1': positions1,
+            'pos2': positions2
+        }, columns=['orientation', 'edge1', 'edge2', 'pos1', 'pos2'])
     else:
         return DataFrame()
 
@@ -1429,39 +1765,104 @@ def parse_stockholm(stockholm_data):
     - a dict of organism names (keys)  and accession numbers/start-end (values)
     - a pandas Dataframe listing the paired positions of the consensus secondary structure)
     """
+    return _parse_stockholm_lines(stockholm_data.strip().split('\n'))
+
+def iter_stockholm(stockholm, index = False):
+    """
+    Parse Stockholm data one alignment at a time (like the families of the files Rfam.seed and Rfam.full), without loading the whole data in memory. Each alignment ends with a line '//'.
+
+    Parameters:
+    ---------
+    - stockholm: the path of a Stockholm file (gzipped if its name ends with .gz) or a file-like object
+    - index (default: False): if True, the alignments are not parsed. Only their accession (#=GF AC) and byte range are recorded, so that an alignment can be read later with a single seek (see read_stockholm()).
+
+    Returns:
+    ------
+    a generator of tuples like the ones returned by parse_stockholm(). With index, a generator of (accession, offset, length) tuples, the accession being None if not found.
+    """
+    handle = _open_data(stockholm)
+    try:
+        lines = []
+        accession = None
+        offset = 0 #the offset of the current alignment
+        position = 0 #the offset of the current line
+        for line in handle:
+            position += len(line)
+            if line.startswith('#=GF AC'):
+                accession = line.split()[2]
+            if line.startswith('//'):
+                if index:
+                    yield accession, offset, position-offset
+                else:
+                    lines.append(line)
+                    yield _parse_stockholm_lines(lines)
+                lines = []
+                accession = None
+                offset = position
+            elif not index:
+                lines.append(line)
+        #an alignment without its last line '//'
+        if index and position > offset and accession:
+            yield accession, offset, position-offset
+        elif any(line.strip() for line in lines):
+            yield _parse_stockholm_lines(lines)
+    finally:
+        if handle is not stockholm:
+            handle.close()
+
+def read_stockholm(stockholm_file, offset, length):
+    """
+    Read an alignment from a Stockholm file with a single seek.
+
+    Parameters:
+    ---------
+    - stockholm_file: the path of the (uncompressed) Stockholm file
+    - offset and length: the byte range of the alignment, as recorded by iter_stockholm() in index mode
+
+    Returns:
+    ------
+    the alignment as a String
+    """
+    with open(stockholm_file, 'rb') as handle:
+        handle.seek(offset)
+        return handle.read(length)
+
+def _parse_stockholm_lines(lines):
     alignedSequences = {}
-    organisms={}
-    aligned2D = ""
+    organisms = {}
+    aligned2D = []
     rfam_id = None
-    lines = stockholm_data.strip().split('\n')
     for line in lines:
-        tokens = re.split('\s+', line)
-        if len(line) != 0 and not re.match('^#', line) and len(tokens) == 2:
-            if alignedSequences.has_key(tokens[0]):
-                alignedSequences[tokens[0]] = alignedSequences[tokens[0]]+tokens[1]
-            else:
-                alignedSequences[tokens[0]] = tokens[1]
-        elif len(line) != 0 and re.match('^#=GC SS_cons', line):
-            aligned2D += re.sub('>', ')', re.sub('<', '(', tokens[2]))
-        elif len(line) != 0 and re.match('^#=GF AC', line):
-            rfam_id = tokens[2].strip()
-        elif len(line) != 0 and re.match('^#=GS', line):
-            organisms[tokens[1]] = tokens[-1]
+        if line.startswith('#'):
+            if line.startswith('#=GC SS_cons'):
+                aligned2D.append(line.split()[2])
+            elif line.startswith('#=GF AC'):
+                rfam_id = line.split()[2]
+            elif line.startswith('#=GS'):
+                tokens = line.split()
+                organisms[tokens[1]] = tokens[-1]
+        else:
+            tokens = line.split()
+            if len(tokens) == 2:
+                if alignedSequences.has_key(tokens[0]):
+                    alignedSequences[tokens[0]].append(tokens[1])
+                else:
+                    alignedSequences[tokens[0]] = [tokens[1]]
 
     rnas = []
 
     for key in alignedSequences:
-        rna = RNA(name=key, sequence=alignedSequences[key])
+        rna = RNA(name=key, sequence=''.join(alignedSequences[key]))
         if rfam_id:
             rna.source = 'db:rfam:'+rfam_id
         if not key.split('/') == 2:
             rna.organism = key
         rnas.append(rna)
-    return (rnas, organisms, parse_bn(aligned2D))
+    return (rnas, organisms, parse_bn(''.join(aligned2D)))
 
 def parse_pdb(pdb_data):
     """
-    Parse PDB data.
+    Parse PDB data. The ATOM and HETATM records are decoded in bulk as fixed-width columns.
 
     Parameters:
     ---------
@@ -1469,85 +1870,240 @@ def parse_pdb(pdb_data):
 
     Returns:
     ------
-    a list of TertiaryStructure objects (see pyrna.features). if the PDB data describes a tertiary structure made with several molecular chains, this method will return one TertiaryStructure object per chain.
+    a list of TertiaryStructure objects (see pyrna.features). if the PDB data describes a tertiary structure made with several molecular chains, this method will return one TertiaryStructure object per chain. The atoms of all the models are merged (see iter_pdb() to get each model).
     """
-    molecules = []
-    chains = []
-    tertiary_structures = []
-    current_chain = None
-    current_residue = None
-    current_residue_pos = None
-    absolute_position = -1
-    current_molecule = None
-    residues = []
-    current_3D = None
-    title = "N.A."
-
-    for line in pdb_data.split('\n'):
-        header = line[0:6].strip()
-        atom_name = line[12:16].strip()
-        residue_name = line[17:20].strip().upper()
-        chain_name = line[21:22].strip()
-        residue_pos = line[22:27].strip()
-
-        if (header == "ATOM" or header == "HETATM") and not residue_name in ["FMN","PRF","HOH","MG","OHX","MN","ZN", "SO4", "CA", "UNK", "AMO"] and not atom_name in ["MG","K", "NA", "SR", "CL", "CD", "ACA"] and len(chain_name):
-            if chain_name != current_chain: #new chain
-                current_residue = residue_name
-                current_residue_pos = residue_pos
-                current_chain = chain_name
-                absolute_position = 1
-                residues = []
-                current_molecule = None
-                residues.append(current_residue)
-                current_3D = TertiaryStructure(current_molecule)
-                current_3D.title = re.sub(' +', ' ', title)
-                current_3D.numbering_system[str(absolute_position)] = current_residue_pos
-
-            elif current_residue_pos != residue_pos: # new residue
-                current_residue = residue_name
-                current_residue_pos = residue_pos
-                if current_molecule:
-                    current_molecule.add_residue(current_residue)
+    return _pdb_records_to_tertiary_structures([line for line in pdb_data.split('\n') if line.startswith(('ATOM', 'HETATM', 'TER', 'TITLE'))])
+
+def iter_pdb(pdb):
+    """
+    Parse PDB data one model at a time (like the models of an NMR entry, between the MODEL and ENDMDL records). Only the records of the current model are kept in memory, so that a caller can stop after the first model without reading the other ones.
+
+    Parameters:
+    ---------
+    - pdb: the path of a PDB file (gzipped if its name ends with .gz) or a file-like object
+
+    Returns:
+    ------
+    a generator of (model number, list of TertiaryStructure objects) tuples, with one TertiaryStructure object per chain (see parse_pdb()). The data without MODEL records make a single model numbered 1.
+    """
+    handle = _open_data(pdb)
+    try:
+        title_records = [] #the TITLE records are shared by all the models
+        records = []
+        model = 1
+        for line in handle:
+            if line.startswith(('ATOM', 'HETATM', 'TER')):
+                records.append(line)
+            elif line.startswith('TITLE'):
+                title_records.append(line.rstrip('\r\n'))
+            elif line.startswith('MODEL'):
+                model = int(line[6:].split()[0]) if line[6:].strip() else model+1
+                records = []
+            elif line.startswith('ENDMDL'):
+                yield model, _pdb_records_to_tertiary_structures(title_records+records)
+                records = []
+        if records:
+            yield model, _pdb_records_to_tertiary_structures(title_records+records)
+    finally:
+        if handle is not pdb:
+            handle.close()
+
+def parse_mmcif(mmcif_data):
+    """
+    Parse mmCIF data (the format of the large assemblies not available in the PDB format). The atoms are read from the _atom_site loop and the title from _struct.title.
+
+    Parameters:
+    ---------
+     - mmcif_data: the mmCIF data as a String (see read_mmcif() for an mmCIF file)
+
+    Returns:
+    ------
+    a list of TertiaryStructure objects (see pyrna.features), like parse_pdb()
+    """
+    from cStringIO import StringIO
+    return read_mmcif(StringIO(mmcif_data))
+
+def read_mmcif(mmcif):
+    """
+    Parse an mmCIF file line by line: only the rows of the _atom_site loop are kept in memory, and the file is not read after this loop.
+
+    Parameters:
+    ---------
+    - mmcif: the path of an mmCIF file (gzipped if its name ends with .gz) or a file-like object
+
+    Returns:
+    ------
+    a list of TertiaryStructure objects (see pyrna.features), like parse_pdb()
+    """
+    handle = _open_data(mmcif)
+    try:
+        return _atom_site_to_tertiary_structures(*_read_atom_site(iter(handle)))
+    finally:
+        if handle is not mmcif:
+            handle.close()
+
+_excluded_residues = ["FMN","PRF","HOH","MG","OHX","MN","ZN", "SO4", "CA", "UNK", "AMO"] #the ions, waters and ligands not stored in the tertiary structures
+_excluded_atoms = ["MG","K", "NA", "SR", "CL", "CD", "ACA"]
+
+def _pdb_records_to_tertiary_structures(records):
+    """
+    Build the TertiaryStructure objects from the ATOM, HETATM, TER and TITLE records of PDB data. Each TER record closes the current chain.
+    """
+    if not records:
+        return []
+    #the records are stored in a fixed-width array, each field being a slice of columns
+    table = np.array(records, dtype = 'S80').view('S1').reshape(len(records), 80)
+    def field(start, end):
+        return np.char.strip(np.ascontiguousarray(table[:, start:end]).view('S%i'%(end-start)).ravel())
+
+    headers = field(0, 6)
+    atoms = np.flatnonzero((headers == 'ATOM') | (headers == 'HETATM'))
+    atom_names = field(12, 16)[atoms]
+    residue_names = np.char.upper(field(17, 20)[atoms])
+    chain_names = field(21, 22)[atoms]
+    residue_positions = field(22, 27)[atoms]
+    kept = _kept_atoms(atom_names, residue_names, chain_names)
+    atoms = atoms[kept]
+    coords = _pdb_coordinates(table[atoms, 30:54])
+
+    #a new chain starts if the chain name changes or after a TER record
+    chain_counts = np.cumsum(headers == 'TER')[atoms]
+    chain_names = chain_names[kept]
+    new_chains = np.r_[True, (chain_names[1:] != chain_names[:-1]) | (chain_counts[1:] != chain_counts[:-1])] if len(atoms) else np.zeros(0, dtype = bool)
+
+    #the title of a chain is made with the TITLE records read before its first atom
+    title_records = np.flatnonzero(headers == 'TITLE')
+    title_lines = [records[i][10:] for i in title_records]
+    titles = ["N.A."+''.join(title_lines[:count]) for count in np.searchsorted(title_records, atoms[new_chains]).tolist()]
+
+    return _atoms_to_tertiary_structures(atom_names[kept], residue_names[kept], chain_names, residue_positions[kept], coords, new_chains, titles)
+
+def _pdb_coordinates(table):
+    """
+    Decode the x, y and z fields (8 columns each) of PDB records given as a (N, 24) array of characters. The fields written with 3 decimals (the PDB format) are decoded with integer arithmetic, the other ones with float().
+    """
+    fields = table.view(np.uint8).reshape(-1, 8)
+    digits = fields-np.uint8(ord('0')) #the other characters overflow
+    is_digit = digits <= 9
+    is_minus = fields == ord('-')
+    if len(fields) and (fields[:, 4] == ord('.')).all() and (is_digit | is_minus | (fields == ord(' ')))[:, [0, 1, 2, 3, 5, 6, 7]].all():
+        values = (digits*is_digit).dot(np.array([1e6, 1e5, 1e4, 1e3, 0, 1e2, 1e1, 1]))
+        return (np.where(is_minus.any(axis = 1), -values, values)/1000.0).reshape(-1, 3)
+    return np.ascontiguousarray(table).view('S8').reshape(-1, 3).astype(np.float64)
+
+def _read_atom_site(lines):
+    """
+    Read the _atom_site loop and the title of mmCIF data, line by line. Only the rows of the loop are kept in memory.
+
+    Returns:
+    ------
+    the title and the rows of the loop as a (N, number of fields) numpy array of Strings, with the list of the field names
+    """
+    title = ''
+    fields = []
+    rows = []
+    for line in lines:
+        if line.startswith('_struct.title'):
+            title = _cif_tokens(line)[1:]
+            if not title: #the value is on the next line(s), maybe as a text field
+                line = next(lines)
+                if line.startswith(';'):
+                    text = [line[1:].strip()]
+                    for line in lines:
+                        if line.startswith(';'):
+                            break
+                        text.append(line.strip())
+                    title = ' '.join(text).strip()
                 else:
-                    residues.append(current_residue)
-                absolute_position += 1
-                current_3D.numbering_system[str(absolute_position)] = current_residue_pos
-
-            x = float(line[30:38].strip())
-            y = float(line[38:46].strip())
-            z = float(line[46:54].strip())
-            current_3D.add_atom(atom_name, absolute_position, [x,y,z])
-
-            if (atom_name == "O4'" or atom_name == "O4*") and not current_molecule in molecules:
-                current_molecule = RNA(sequence="", name = current_chain)
-                current_3D.rna = current_molecule
-                for residue in residues:
-                    current_molecule.add_residue(current_residue)
-                molecules.append(current_molecule)
-                tertiary_structures.append(current_3D)
-
-            elif (atom_name == "CA") and not current_molecule in molecules:
-                current_molecule = Protein(sequence="", name = current_chain)
-                current_3D.rna = current_molecule
-                for residue in residues:
-                    current_molecule.add_residue(current_residue)
-                molecules.append(current_molecule)
-                tertiary_structures.append(current_3D)
-
-        elif header == 'TITLE':
-            title += line[10:]
-
-        elif header == "TER":
-            current_chain = None
-            current_residue_pos = None
-            current_molecule = None
-            residues = []
+                    title = ' '.join(_cif_tokens(line))
+            else:
+                title = title[0]
+        elif line.startswith('_atom_site.'):
+            fields.append(line.split('.', 1)[1].strip())
+        elif fields:
+            if line.startswith(('loop_', '_', '#')): #the end of the loop
+                if rows:
+                    break
+            elif line.strip():
+                rows.append(_cif_tokens(line))
+    if any(len(row) != len(fields) for row in rows):
+        raise Exception("Incorrect number of values in the _atom_site loop")
+    return title, np.array(rows, dtype = object).reshape(len(rows), len(fields)), fields
 
+_cif_token = re.compile(r'''"(?:[^"]|"(?=\S))*"|'(?:[^']|'(?=\S))*'|\S+''') #like in the CIF syntax, a quote only closes a value if it is followed by a blank
+
+def _cif_tokens(line):
+    return [token[1:-1] if len(token) > 1 and token[0] in '"\'' and token[-1] == token[0] else token for token in _cif_token.findall(line)]
+
+def _atom_site_to_tertiary_structures(title, rows, fields):
+    """
+    Build the TertiaryStructure objects from the rows of an mmCIF _atom_site loop. The author fields are used if available, like in the PDB format.
+    """
+    def column(*names):
+        for name in names:
+            if name in fields:
+                return rows[:, fields.index(name)]
+        raise Exception("Missing field %s in the _atom_site loop"%names[0])
+
+    if not len(rows):
+        return []
+    rows = rows.astype(str)
+    atom_names = column('auth_atom_id', 'label_atom_id')
+    residue_names = np.char.upper(column('auth_comp_id', 'label_comp_id'))
+    chain_names = column('auth_asym_id', 'label_asym_id')
+    chain_names = np.where(np.in1d(chain_names, ['.', '?']), '', chain_names) #the unknown values
+    residue_positions = column('auth_seq_id', 'label_seq_id')
+    if 'pdbx_PDB_ins_code' in fields:
+        insertion_codes = column('pdbx_PDB_ins_code')
+        residue_positions = np.where((insertion_codes == '?') | (insertion_codes == '.'), residue_positions, np.char.add(residue_positions, insertion_codes))
+    kept = _kept_atoms(atom_names, residue_names, chain_names) & ((column('group_PDB') == 'ATOM') | (column('group_PDB') == 'HETATM'))
+    coords = np.array([column('Cartn_x'), column('Cartn_y'), column('Cartn_z')], dtype = np.float64).T[kept]
+
+    #a new chain starts if the chain name changes or with a new entity (like the TER records of the PDB format)
+    chain_names = chain_names[kept]
+    chain_ids = column('label_asym_id')[kept] if 'label_asym_id' in fields else chain_names
+    new_chains = np.r_[True, (chain_names[1:] != chain_names[:-1]) | (chain_ids[1:] != chain_ids[:-1])] if kept.any() else np.zeros(0, dtype = bool)
+
+    return _atoms_to_tertiary_structures(atom_names[kept], residue_names[kept], chain_names, residue_positions[kept], coords, new_chains, ["N.A."+title]*int(new_chains.sum()))
+
+def _kept_atoms(atom_names, residue_names, chain_names):
+    """
+    Returns the boolean mask of the atoms to store in the tertiary structures (no ions, waters or ligands, and a chain name).
+    """
+    return ~np.in1d(residue_names, _excluded_residues) & ~np.in1d(atom_names, _excluded_atoms) & (chain_names != '')
+
+def _atoms_to_tertiary_structures(atom_names, residue_names, chain_names, residue_positions, coords, new_chains, titles):
+    """
+    Build the TertiaryStructure objects from columns of atoms (numpy arrays of Strings). A new chain starts at each atom flagged in new_chains, a new residue at each change of residue position. The chains without any O4' (RNA) or CA (protein) atom are ignored.
+    """
+    tertiary_structures = []
+    if not len(atom_names):
+        return tertiary_structures
+    new_residues = new_chains | np.r_[True, residue_positions[1:] != residue_positions[:-1]]
+    residue_counts = np.cumsum(new_residues)
+    chain_starts = np.flatnonzero(new_chains)
+    chain_ends = np.r_[chain_starts[1:], len(atom_names)]
+    absolute_positions = residue_counts-np.repeat(residue_counts[chain_starts]-1, chain_ends-chain_starts)
+    residue_starts = np.flatnonzero(new_residues)
+    markers = np.flatnonzero((atom_names == "O4'") | (atom_names == "O4*") | (atom_names == "CA")) #the atoms telling if a chain is an RNA or a protein
+
+    for start, end, marker, title in zip(chain_starts.tolist(), chain_ends.tolist(), markers[np.minimum(np.searchsorted(markers, chain_starts), len(markers)-1)].tolist() if len(markers) else [None]*len(chain_starts), titles):
+        if marker is None or not start <= marker < end:
+            continue
+        molecule = Protein(sequence="", name = str(chain_names[start])) if atom_names[marker] == "CA" else RNA(sequence="", name = str(chain_names[start]))
+        starts = residue_starts[np.searchsorted(residue_starts, start):np.searchsorted(residue_starts, end)]
+        for residue in residue_names[starts].tolist():
+            molecule.add_residue(residue)
+        tertiary_structure = TertiaryStructure(molecule)
+        tertiary_structure.title = re.sub(' +', ' ', title)
+        tertiary_structure.numbering_system = dict(zip([str(position) for position in range(1, len(starts)+1)], residue_positions[starts].tolist()))
+        tertiary_structure.add_atoms(atom_names[start:end], absolute_positions[start:end], coords[start:end])
+        tertiary_structures.append(tertiary_structure)
     return tertiary_structures
 
 def parse_sam(sam_file):
     """
-    This method parses a SAM file. It delegates the low-level parsing to the pysam library (https://code.google.com/p/pysam/). At now, this method is not able to handle oriented and paired-ends reads.
+    This method parses a SAM file. It delegates the low-level parsing to the pysam library (https://code.google.com/p/pysam/) through iter_sam(). At now, this method is not able to handle oriented and paired-ends reads.
 
     Parameters:
     ---------
@@ -1556,66 +2112,83 @@ def parse_sam(sam_file):
     Returns:
     ------
     a tuple containing:
-    - a list of aligned reads (each read is described as a dict like: {'tid':int, 'genomicStart':int, 'genomicEnd':int, 'genomicStrand':['+', '-', '?']} )
+    - a list of aligned reads (each read is described as a dict like: {'tid':int, 'genomicStart':int, 'genomicEnd':int, 'genomicStrand':['+', '-']}, the strand being given by the flag 0x10)
     - the total number of reads described in the SAM file
     - a dictionary providing the correspondance between the name of the genomic sequences and the tids available in the SAM file
     """
-    from pysam import Samfile
-    reads = []
+    sequence_names = sam_reference_names(sam_file)
+    reads = [[] for name in sequence_names]
     tid_dic = {}
     total_read_nb = 0
-    aligned_read_nb = 0
-    sam_file_content = Samfile(sam_file, 'r') #samfile: <type 'csamtools.Samfile'> ; 'r' for sam files and 'rb' for bam files
-
-    sequence_nb = len(sam_file_content.header['SQ'])
-    sequence_names = []
-
-    for i in range(0, sequence_nb):
-        reads.append([])
-        sequence_names.append(sam_file_content.header['SQ'][i]['SN'])
-
-    for alignedread in sam_file_content.fetch(): #alignedread: <type 'csamtools.AlignedRead'>
-        total_read_nb += 1
-        if alignedread.flag != 4:
-            aligned_read_nb +=1
-            for name in sequence_names:
-                if name == sam_file_content.getrname(alignedread.rname):
-                    if tid_dic.has_key(alignedread.rname) == 0:
-                        tid_dic[alignedread.rname] = name
-
-            c = 0 #counter for the read sequence which is incremented with each M/I/S
-            r = alignedread.pos #counter for the reference sequence which is incremented with each M/D/S ; POS=Integer=position(-1) of the first base of the reference sequence that gives a match (M)
-            tag = 'no'
-            read = {'tid':alignedread.rname}
-            #read = [alignedread.rname]
-            aligned_seq = []
-            for tu in alignedread.cigar:
-                if tu[0] == 0: #0=M=alignment Match (match or mismatch)
-                    tag = 'yes'
-                    read_pos_list = range(c,c+tu[1],1)
-                    for p in read_pos_list: #p+1=position on the read sequence
-                        r += 1 #position on the reference sequence
-                        aligned_seq.append(r)
-                    c += tu[1]
-                elif tu[0] == 1: #1=I=Insertion
-                    c += tu[1]
-                elif tu[0] == 2: #2=D=Deletion
-                    r += tu[1]
-                elif tu[0] == 4: #4=S=Soft clipping (match or mismatch or no alignment)
-                    if tag == 'no':
-                        r -= tu[1]
-                    c += tu[1]
-                    r += tu[1]
-            read['genomicStart'] = aligned_seq[0]
-            #read.append(aligned_seq[0])
-            read['genomicEnd'] = aligned_seq[-1]
-            #read.append(aligned_seq[-1])
-            if alignedread.flag == 0:
-                read['genomicStrand'] = '+'
-            elif alignedread.flag == 16:
-                read['genomicStrand'] = '-'
-            else:
-                read['genomicStrand'] = '?'
-            reads[alignedread.rname-1].append(read)
-    sam_file_content.close()
+
+    for chunk in iter_sam(sam_file):
+        total_read_nb += len(chunk['flag'])
+        aligned = (chunk['flag'] & 4) == 0 #the unmapped reads have the flag 0x4 (alone or with other flags, like in paired-end runs)
+        tids = chunk['tid'][aligned]
+        for tid in np.unique(tids).tolist():
+            tid_dic[tid] = sequence_names[tid]
+        for tid, start, end, strand in zip(tids.tolist(), chunk['start'][aligned].tolist(), chunk['end'][aligned].tolist(), chunk['strand'][aligned].tolist()):
+            reads[tid-1].append({'tid': tid, 'genomicStart': start, 'genomicEnd': end, 'genomicStrand': strand})
+
     return reads, total_read_nb, tid_dic
+
+def iter_sam(sam_file, chunk_size = 1000000, threads = 1):
+    """
+    Parse a SAM or BAM file chunk by chunk, the reads of each chunk being stored in numpy arrays. It delegates the low-level parsing to the pysam library: the genomic ends of the reads are the ones computed by pysam from their CIGAR strings and the BAM files can be decompressed with several threads.
+
+    Parameters:
+    ---------
+    - sam_file: the path of the SAM or BAM file (a BAM file having the extension .bam)
+    - chunk_size (default: 1000000): the number of reads in each chunk
+    - threads (default: 1): the number of threads used to decompress a BAM file
+
+    Returns:
+    ------
+    a generator of dicts, one for each chunk, with the keys:
+    - 'tid': the index of the genomic sequence in the header of the file (see sam_reference_names()), -1 if the read has no genomic sequence
+    - 'start': the first genomic position of the aligned part of the read (1-based)
+    - 'end': the last genomic position of the aligned part of the read (1-based, 0 for an unmapped read)
+    - 'strand': '+', '-' or '?' for an unmapped read
+    - 'flag': the SAM flag of the read
+    """
+    sam = _open_sam(sam_file, threads = threads)
+    try:
+        tids, starts, ends, flags = [], [], [], []
+        for read in sam:
+            tids.append(read.reference_id)
+            starts.append(read.reference_start)
+            ends.append(read.reference_end or 0)
+            flags.append(read.flag)
+            if len(flags) == chunk_size:
+                yield _sam_chunk(tids, starts, ends, flags)
+                tids, starts, ends, flags = [], [], [], []
+        if flags:
+            yield _sam_chunk(tids, starts, ends, flags)
+    finally:
+        sam.close()
+
+def sam_reference_names(sam_file):
+    """
+    Returns the names of the genomic sequences described in the header of a SAM or BAM file, in the order of their tids.
+    """
+    sam = _open_sam(sam_file)
+    try:
+        return list(sam.references)
+    finally:
+        sam.close()
+
+def _open_sam(sam_file, threads = 1):
+    from pysam import AlignmentFile
+    if sam_file.endswith('.bam'):
+        return AlignmentFile(sam_file, 'rb', threads = threads)
+    return AlignmentFile(sam_file, 'r')
+
+def _sam_chunk(tids, starts, ends, flags):
+    flags = np.array(flags, dtype = np.int32)
+    return {
+        'tid': np.array(tids, dtype = np.int32),
+        'start': np.array(starts, dtype = np.int64)+1, #pysam positions are 0-based
+        'end': np.array(ends, dtype = np.int64),
+        'strand': np.where(flags & 4, '?', np.where(flags & 16, '-', '+')),
+        'flag': flags
+    }
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 
 import ujson, sys, datetime, os, random, string, json, commands
+from StringIO import StringIO
 
 from pyrna.features import RNA
 from pyrna.db import Rfam
 from pyrna.computations import Rnafold, Contrafold, Rnaplot, Rnaview, Mlocarna, Rnasubopt, RnaAlifold
 from pyrna import parsers
-from pyrna.parsers import parse_vienna, parse_fasta, base_pairs_to_secondary_structure, parse_pdb, to_clustalw, consensus2d_to_booquet
+from pyrna.parsers import parse_vienna, parse_fasta, base_pairs_to_secondary_structure, iter_pdb, to_clustalw, consensus2d_to_booquet
 from pymongo import MongoClient
 from bson.objectid import ObjectId
 from subprocess import Popen
@@ -439,10 +440,11 @@ class Compute2d(tornado.web.RequestHandler):
                     self.write(rnaview.annotate(pdb_content = data, raw_output = True))
 
             else:
+                #the NMR entries are annotated with their first model only
                 if pdbid:
-                    tertiary_structures = parse_pdb(PDB().get_entry(pdbid))
+                    tertiary_structures = next(iter_pdb(StringIO(PDB().get_entry(pdbid))), (1, []))[1]
                 elif data:
-                    tertiary_structures = parse_pdb(data)
+                    tertiary_structures = next(iter_pdb(StringIO(data)), (1, []))[1]
 
                 result = []
 
@@ -5,6 +5,7 @@ Annotate and import solved 3D structures into MongoDB
 """
 
 import sys, os, math, datetime
+from StringIO import StringIO
 from pyrna.task import Task
 from pyrna.db import RNA3DHub, PDB, PDBQuery
 from pyrna import parsers
@@ -43,7 +44,8 @@ def import_3Ds(db_host = 'localhost', db_port = 27017, rna3dhub = False, canonic
             if db['tertiaryStructures'].find_one({'source':"db:pdb:%s"%pdb_id}):
                 continue
             print "Recover %s"%pdb_id
-            for ts in parsers.parse_pdb(pdb.get_entry(pdb_id)):
+            first_model = next(parsers.iter_pdb(StringIO(pdb.get_entry(pdb_id))), (1, []))[1] #the NMR entries are annotated with their first model only
+            for ts in first_model:
                 try:
                     ss = None
                     if annotate:
@@ -65,7 +67,8 @@ def import_3Ds(db_host = 'localhost', db_port = 27017, rna3dhub = False, canonic
             if db['tertiaryStructures'].find_one({'source':"db:pdb:%s"%pdb_id}):
                 continue
             print "Recover %s"%pdb_id #we use the first pdb_id in the list of ids making a cluster
-            for ts in parsers.parse_pdb(pdb.get_entry(pdb_id)):
+            first_model = next(parsers.iter_pdb(StringIO(pdb.get_entry(pdb_id))), (1, []))[1] #the NMR entries are annotated with their first model only
+            for ts in first_model:
                 try:
                     ss = None
                     if annotate:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""
+A script to benchmark some PyRNA features on large molecules.
+"""
+
+import sys, time, random
+from pyrna.parsers import parse_bn, parse_stockholm, consensus2d_to_pair_tables, base_pairs_to_secondary_structure, to_bn, to_clustalw, to_ct, to_vienna
+from pyrna.features import MoleculeBatch
+from pyrna.utils import make_random_molecule
+
+def random_bn(length, unpaired_ratio = 0.4):
+    """
+    Returns a random bracket notation (without pseudoknots) of the length given as argument. The stems are made with 4 to 8 base-pairs.
+    """
+    def stem(length):
+        if length < 14:
+            return '.'*length
+        helix_length = random.randint(4, min(8, (length-3)/2))
+        return '('*helix_length+loop(length-2*helix_length)+')'*helix_length
+
+    def loop(length):
+        if length < 14:
+            return '.'*length
+        bn = []
+        while length > 0:
+            if length < 14 or random.random() < unpaired_ratio:
+                size = random.randint(1, min(length, 6))
+                bn.append('.'*size)
+            else:
+                size = random.randint(14, length)
+                bn.append(stem(size))
+            length -= size
+        return ''.join(bn)
+
+    return loop(length)
+
+def benchmark(name, function, repeats = 10):
+    start = time.time()
+    for i in range(repeats):
+        function()
+    print "%s: %.3f s per run"%(name, (time.time()-start)/repeats)
+
+def benchmark_find_junctions():
+    print "## SecondaryStructure.find_junctions() ##\n"
+    for name, length in [('16S', 1500), ('23S', 2900)]:
+        rna = make_random_molecule(length, name = name)
+        ss = base_pairs_to_secondary_structure(rna, parse_bn(random_bn(length)))
+        print "%s-sized structure: %i helices, %i single-strands"%(name, len(ss.helices), len(ss.single_strands))
+        benchmark("find_junctions", ss.find_junctions)
+        print "%i junctions\n"%len(ss.junctions)
+
+def benchmark_compute_plot():
+    print "## SecondaryStructure.compute_plot() ##\n"
+    #sizes of Rfam consensus structures with 20+ helices (RNase P, group II introns, SSU and LSU rRNAs)
+    for name, length in [('RNase P', 400), ('group II intron', 700), ('SSU rRNA', 1500), ('LSU rRNA', 2900)]:
+        rna = make_random_molecule(length, name = name)
+        ss = base_pairs_to_secondary_structure(rna, parse_bn(random_bn(length, unpaired_ratio = 0.1)))
+        ss.find_stem_loops()
+        print "%s-sized structure: %i helices, %i junctions, %i stem-loops"%(name, len(ss.helices), len(ss.junctions), len(ss.stem_loops))
+        benchmark("compute_plot", lambda: ss.compute_plot(step = 40, residue_occupancy = 10, junction_diameter = 20))
+        print
+
+def benchmark_exporters():
+    print "## to_bn(), to_ct() and to_vienna() ##\n"
+    length = 10000
+    rna = make_random_molecule(length)
+    base_pairs = parse_bn(random_bn(length))
+    print "10 kb structure: %i base-pairs"%len(base_pairs)
+    benchmark("to_bn", lambda: to_bn(base_pairs, length))
+    benchmark("to_ct", lambda: to_ct(base_pairs, rna))
+    benchmark("to_vienna", lambda: to_vienna([base_pairs], [rna]))
+    print
+
+def benchmark_parse_bn():
+    print "## parse_bn() ##\n"
+    length = 10000
+    bn = random_bn(length)
+    print "10 kb bracket notation: %i base-pairs"%bn.count('(')
+    benchmark("parse_bn", lambda: parse_bn(bn))
+    benchmark("parse_bn as a pair table", lambda: parse_bn(bn, pair_table = True))
+    print
+
+def random_stockholm(sequences, length):
+    """
+    Returns a random Stockholm alignment with the number of sequences and the number of columns given as arguments.
+    """
+    lines = ["# STOCKHOLM 1.0", "#=GF AC   RF00000"]
+    for i in range(sequences):
+        lines.append("seq%i/1-%i %s"%(i, length, ''.join([random.choice('ACGU-.') for j in range(length)])))
+    lines.append("#=GC SS_cons %s"%random_bn(length).replace('(', '<').replace(')', '>'))
+    lines.append("//")
+    return '\n'.join(lines)
+
+def molecule_size(molecule):
+    """
+    Returns the memory size in bytes of a Molecule object, its attributes (stored in a __dict__ or in __slots__) included but not its sequence.
+    """
+    size = sys.getsizeof(molecule)
+    if hasattr(molecule, '__dict__'):
+        size += sys.getsizeof(molecule.__dict__)
+        size += sum([sys.getsizeof(value) for key, value in molecule.__dict__.items() if key != 'sequence'])
+    for cls in type(molecule).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if slot == 'sequence':
+                continue
+            if slot.startswith('__') and not slot.endswith('__'): #a private slot, its name is mangled
+                slot = '_%s%s'%(cls.__name__.lstrip('_'), slot)
+            if hasattr(molecule, slot): #an unset slot takes no memory beyond the object itself
+                size += sys.getsizeof(getattr(molecule, slot))
+    return size
+
+def benchmark_molecules():
+    print "## Molecules from a full Rfam alignment ##\n"
+    stockholm_data = random_stockholm(50000, 120)
+    start = time.time()
+    rnas, organisms, base_pairs = parse_stockholm(stockholm_data)
+    print "parse_stockholm: %.3f s for %i sequences"%(time.time()-start, len(rnas))
+    print "%i bytes per RNA object"%molecule_size(rnas[0])
+    start = time.time()
+    consensus2d_to_pair_tables(rnas, base_pairs)
+    print "consensus2d_to_pair_tables: %.3f s for %i consensus base-pairs"%(time.time()-start, len(base_pairs))
+    start = time.time()
+    to_clustalw(base_pairs, rnas, curate = True)
+    print "to_clustalw: %.3f s with the curation of the alignment"%(time.time()-start)
+    start = time.time()
+    batch = MoleculeBatch.from_molecules(rnas)
+    batch.get_lengths()
+    print "MoleculeBatch: %.3f s, %i bytes for the names and offsets arrays\n"%(time.time()-start, batch.names.nbytes+batch.offsets.nbytes)
+
+if __name__ == '__main__':
+    random.seed(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    benchmark_find_junctions()
+    benchmark_compute_plot()
+    benchmark_exporters()
+    benchmark_parse_bn()
+    benchmark_molecules()
@@ -4,9 +4,11 @@
 A script to test the installation of PyRNA
 """
 
+import sys, os, tempfile, shutil, threading, time
+from pyrna import computations
 from pyrna.db import PDB
-from pyrna.parsers import parse_pdb, secondary_structure_to_base_pairs
-from pyrna.computations import Rnafold, Rnaview
+from pyrna.parsers import parse_pdb, secondary_structure_to_base_pairs, IndexedFasta
+from pyrna.computations import Rnafold, Rnaview, Tool, ContainerPool, LocalExecutor
 
 def test():
     print "Recovering entry 1EHZ from Protein Databank...\n"
@@ -29,5 +31,85 @@ def test():
         print "\nList of base-pairs computed with RNAfold (RNA Vienna Package):\n"
         print Rnafold().fold(molecule=ts.rna)
 
+def test_indexed_fasta():
+    print "## FASTA index ##\n"
+    directory = tempfile.mkdtemp()
+    try:
+        with open(directory+'/genome.fasta', 'w') as fasta_file:
+            fasta_file.write(">chrI first chromosome\n"+"ACGT"*15+"\n"+"TTGCA"*12+"\n"+"GG\n>chrII\nacgtn\n")
+        genome = IndexedFasta(directory+'/genome.fasta')
+        assert genome.names == ['chrI', 'chrII']
+        assert len(genome['chrI']) == 122
+        assert genome['chrI'][58:63] == "GTTTG"
+        assert genome['chrII'][:] == "ACGTN"
+        assert open(directory+'/genome.fasta.fai').read() == "chrI\t122\t23\t60\t61\nchrII\t5\t155\t5\t6\n"
+
+        #like with samtools faidx, a sequence made with lines of different lengths is rejected (and no index is written)
+        with open(directory+'/ragged.fasta', 'w') as fasta_file:
+            fasta_file.write(">x\n"+"A"*60+"\n"+"C"*62+"\n"+"G"*58+"\n"+"T"*10+"\n")
+        try:
+            IndexedFasta(directory+'/ragged.fasta')
+        except Exception, e:
+            assert str(e) == "Different line length in sequence 'x'"
+        else:
+            raise AssertionError("A ragged FASTA file has been indexed")
+        assert not os.path.exists(directory+'/ragged.fasta.fai')
+    finally:
+        shutil.rmtree(directory)
+    print "OK\n"
+
+def test_container_pool():
+    print "## Pool of Docker containers (with the local executor) ##\n"
+    directory = tempfile.mkdtemp()
+    pool = computations.container_pool
+    try:
+        with open(directory+'/input.txt', 'w') as input_file:
+            input_file.write("ACGU\n")
+        executor = LocalExecutor()
+        computations.container_pool = ContainerPool(size = 2, max_uses = 4, health_check_interval = 3600, executor = executor)
+        tool = Tool(cache_dir = directory, use_docker = False)
+
+        #an idle container is reused, a busy one makes the pool start a new container
+        assert tool.docker_run('fjossinet/assemble2', "cat < /data/input.txt") == "ACGU"
+        assert tool.docker_run('fjossinet/assemble2', "cat < /data/input.txt") == "ACGU"
+        busy = threading.Thread(target = lambda: tool.docker_run('fjossinet/assemble2', "sleep 0.5"))
+        busy.start()
+        time.sleep(0.2)
+        assert tool.docker_run('fjossinet/assemble2', "cat < /data/input.txt") == "ACGU"
+        busy.join()
+        assert [container for container, command in executor.commands] == ['local-1', 'local-1', 'local-1', 'local-2']
+
+        #a container is recycled after max_uses commands
+        tool.docker_run('fjossinet/assemble2', "true")
+        assert executor.commands[-1][0] == 'local-1' and sorted(executor.volumes.keys()) == ['local-2']
+        for i in range(3):
+            tool.docker_run('fjossinet/assemble2', "true")
+        assert executor.commands[-1][0] == 'local-2' and executor.volumes == {}
+        tool.docker_run('fjossinet/assemble2', "true")
+        assert executor.commands[-1][0] == 'local-3'
+
+        #a container dying between two health checks: the command is retried in a new container
+        del executor.volumes['local-3']
+        assert tool.docker_run('fjossinet/assemble2', "cat < /data/input.txt") == "ACGU"
+        assert [container for container, command in executor.commands[-2:]] == ['local-3', 'local-4']
+        assert [container['container'] for container in computations.container_pool.containers[('fjossinet/assemble2', directory)]] == ['local-4']
+
+        #a dead container found by the health check is replaced before use
+        computations.container_pool.health_check_interval = 0
+        del executor.volumes['local-4']
+        commands_count = len(executor.commands)
+        assert tool.docker_run('fjossinet/assemble2', "cat < /data/input.txt") == "ACGU"
+        assert [container for container, command in executor.commands[commands_count:]] == ['local-5']
+
+        computations.container_pool.close()
+        assert executor.volumes == {}
+    finally:
+        computations.container_pool = pool
+        shutil.rmtree(directory)
+    print "OK\n"
+
 if __name__ == '__main__':
-    test()
+    test_indexed_fasta()
+    test_container_pool()
+    if not "-offline" in sys.argv: #the next tests need the Protein Databank and Docker
+        test()
@@ -7,9 +7,9 @@ This script searches for the inner loop of HIV-1 SL1 in 2Ds infered from 3D stru
 import os, math, sys, re
 from pymongo import MongoClient
 
-from pyrna.features import RNA
+from pyrna.features import RNA, SecondaryStructure
 from pyrna.db import Rfam
-from pyrna.parsers import consensus2d_to_base_pairs, to_bn, base_pairs_to_secondary_structure, to_clustalw
+from pyrna.parsers import consensus2d_to_pair_tables, to_bn, to_clustalw
 
 
 def search(db_host = 'localhost', db_port = 27017):
@@ -37,13 +37,13 @@ def search(db_host = 'localhost', db_port = 27017):
             (rnas, organisms, consensus_2D) = rfam.get_entry(rfam_id = "RF%05u" % id, aln_type = 'full')
             print "Search in RF%05u"% id
             interesting_rnas = []
-            for rna in rnas:
+            pair_tables = consensus2d_to_pair_tables(rnas, consensus_2D)
+            for rna, pair_table in zip(rnas, pair_tables):
                 if rna.name in ['M.mulatta.244', 'E.telfairi.194', 'S.araneus.581', 'Macaca_fascicularis_.302', 'Macaca_fascicularis_.413', 'M.mulatta.290'] or re.match('^.+sapiens.+$', rna.name):
                     interesting_rnas.append(rna)
                 i += 1
-                base_pairs = consensus2d_to_base_pairs(rna, consensus_2D)
                 non_aligned_rna = RNA(name = rna.name, sequence = rna.sequence.replace('-',''))
-                ss = base_pairs_to_secondary_structure(non_aligned_rna, base_pairs)
+                ss = SecondaryStructure.from_pair_table(non_aligned_rna, pair_table)
                 ss.find_junctions()
                 for junction in ss.junctions:
                     strands = junction['description'].split(' ')